@@ -0,0 +1,286 @@
+# ======================================================================#
+# Binary columnar store of Hi-C alignments
+# ======================================================================#
+
+import os
+import numpy as np
+import contig_ids as cids
+
+# ======================================================================#
+#                                ARGUMENTS
+# ======================================================================#
+
+# bed_file : bed file of alignments sorted by read names
+# length_file : path to file with contigs length at first iteration
+# store_dir : directory holding the columns of the store
+# offsets_file : contig to scaffold table written after a layout
+
+# Columns of the store, each one written as a raw little-endian file
+COLUMNS = [
+    ("contig", np.int32),
+    ("start", np.int64),
+    ("end", np.int64),
+    ("read", np.int64),
+    ("mate", np.int8),
+]
+
+# Number of alignments converted or read at once
+CHUNK_SIZE = 2000000
+
+# ======================================================================#
+#                                MODULES
+# ======================================================================#
+
+
+# BUILD_ALIGNMENT_STORE
+# input :
+#   bed_file : bed file of alignments sorted by read names
+#   length_file : path to file with contigs length
+#   store_dir : directory where the columns are written
+#   chunk_size : number of bed lines converted at once
+# output :
+#   number of alignments written to the store
+def build_alignment_store(bed_file, length_file, store_dir, chunk_size=CHUNK_SIZE):
+    """
+    Convert a name-sorted bed file into a memory-mappable columnar store.
+    Reads are numbered in order of appearance, mate flag is the number after
+    the "/" of the read name (0 if there is none).
+    """
+    if not os.path.exists(store_dir):
+        os.mkdir(store_dir)
+
+    contig_ids, _ = cids.load_contig_ids(length_file)
+    with open(store_dir + "/contigs.txt", "w") as f:
+        for name in contig_ids.names:
+            f.write(name + "\n")
+
+    outputs = {
+        name: open(store_dir + "/" + name + ".bin", "wb") for name, _ in COLUMNS
+    }
+
+    total = 0
+    prev_read = None
+    read_id = -1
+    lines = []
+    with open(bed_file, "r") as f:
+        for line in f:
+            lines.append(line)
+            if len(lines) < chunk_size:
+                continue
+            prev_read, read_id = _write_chunk(
+                lines, contig_ids, outputs, prev_read, read_id
+            )
+            total += len(lines)
+            lines = []
+    if lines:
+        prev_read, read_id = _write_chunk(
+            lines, contig_ids, outputs, prev_read, read_id
+        )
+        total += len(lines)
+
+    for output in outputs.values():
+        output.close()
+
+    return total
+
+
+def _write_chunk(lines, contig_ids, outputs, prev_read, read_id):
+    """
+    Append a chunk of bed lines to the columns of the store.
+    """
+    fields = [line.split(None, 4) for line in lines]
+    names = [x[3].split("/") for x in fields]
+
+    reads = np.array([x[0] for x in names])
+    new_read = np.empty(len(reads), dtype=bool)
+    new_read[0] = reads[0] != prev_read
+    new_read[1:] = reads[1:] != reads[:-1]
+
+    columns = {
+        "contig": contig_ids.intern([x[0] for x in fields]),
+        "start": np.array([x[1] for x in fields], dtype=np.int64),
+        "end": np.array([x[2] for x in fields], dtype=np.int64),
+        "read": read_id + np.cumsum(new_read),
+        "mate": np.array(
+            [int(x[1]) if len(x) > 1 and x[1].isdigit() else 0 for x in names]
+        ),
+    }
+    for name, dtype in COLUMNS:
+        columns[name].astype(dtype).tofile(outputs[name])
+
+    return reads[-1], int(columns["read"][-1])
+
+
+# LOAD_ALIGNMENT_STORE
+# input :
+#   store_dir : directory holding the columns of the store
+# output :
+#   contig_names : list of contig names in id order
+#   columns : dictionnary of memory-mapped columns
+def load_alignment_store(store_dir):
+    """
+    Memory-map the columns of an alignment store.
+    """
+    with open(store_dir + "/contigs.txt", "r") as f:
+        contig_names = [line.rstrip("\n") for line in f]
+
+    columns = {}
+    for name, dtype in COLUMNS:
+        path = store_dir + "/" + name + ".bin"
+        if os.path.getsize(path) == 0:
+            columns[name] = np.zeros(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(path, dtype=dtype, mode="r")
+
+    return contig_names, columns
+
+
+# WRITE_SCAFFOLD_OFFSETS
+# input :
+#   offsets_file : path of the table to write
+#   store_dir : directory of the alignment store
+#   scaffold_names : list of scaffold names
+#   contig2scaffold : dictionnary contig name -> scaffold name
+#   contig2info : dictionnary contig name -> (start, end, orientation) in the
+#                 scaffold
+#   intra : if False, pairs of mates falling in the same scaffold are dropped
+# output :
+#   offsets_file written as a numpy archive
+def write_scaffold_offsets(
+    offsets_file, store_dir, scaffold_names, contig2scaffold, contig2info, intra
+):
+    """
+    Save the placement of every contig of the store in the current scaffolds.
+    """
+    contig_names, _ = load_alignment_store(store_dir)
+    scaffold_index = {name: i for i, name in enumerate(scaffold_names)}
+    n = len(contig_names)
+    scaffold = np.full(n, -1, dtype=np.int32)
+    offset = np.zeros(n, dtype=np.int64)
+    orientation = np.zeros(n, dtype=np.int8)
+
+    for cid, contig in enumerate(contig_names):
+        if contig in contig2scaffold:
+            scaffold[cid] = scaffold_index[contig2scaffold[contig]]
+            offset[cid] = contig2info[contig][0]
+            orientation[cid] = contig2info[contig][2] == "REV"
+
+    with open(offsets_file, "wb") as f:
+        np.savez(
+            f,
+            scaffold=scaffold,
+            offset=offset,
+            orientation=orientation,
+            scaffold_names=np.array(scaffold_names, dtype=str),
+            intra=np.array(intra),
+        )
+
+
+# LOAD_SCAFFOLD_OFFSETS
+# input :
+#   offsets_file : path to a table written by write_scaffold_offsets
+# output :
+#   offsets : dictionnary of arrays
+def load_scaffold_offsets(offsets_file):
+    """
+    Read a contig to scaffold table.
+    """
+    with np.load(offsets_file) as data:
+        offsets = {key: data[key] for key in data.files}
+    offsets["scaffold_names"] = offsets["scaffold_names"].tolist()
+    offsets["intra"] = bool(offsets["intra"])
+    return offsets
+
+
+# ITER_ALIGNMENTS
+# input :
+#   store_dir : directory holding the columns of the store
+#   offsets : table returned by load_scaffold_offsets, or None for contigs
+#   chunk_size : number of alignments read at once
+# output :
+#   generator of (names, ids, starts, ends, reads, mates) chunks, names being
+#   the list of contig or scaffold names indexed by ids
+def iter_alignments(store_dir, offsets=None, chunk_size=CHUNK_SIZE):
+    """
+    Read the alignments, placed on scaffolds when a table is given.
+    With a table, only mates 1 and 2 of a read that are consecutive and both
+    placed are kept, and their coordinates are shifted by the offset of their
+    contig like update_bed did when it rewrote the bed file.
+    """
+    contig_names, columns = load_alignment_store(store_dir)
+    total = len(columns["contig"])
+
+    for start in range(0, total, chunk_size):
+        stop = min(start + chunk_size, total)
+
+        if offsets is None:
+            yield (contig_names,) + tuple(
+                np.asarray(columns[name][start:stop], dtype=np.int64)
+                for name, _ in COLUMNS
+            )
+            continue
+
+        # Look one alignment ahead to pair the last mate of the chunk
+        ahead = min(stop + 1, total)
+        ids, starts, ends, reads, mates = (
+            np.asarray(columns[name][start:ahead], dtype=np.int64)
+            for name, _ in COLUMNS
+        )
+
+        scaffold = offsets["scaffold"][np.maximum(ids, 0)]
+        scaffold[ids < 0] = -1
+        keep = (
+            (reads[:-1] == reads[1:])
+            & (mates[:-1] == 1)
+            & (mates[1:] == 2)
+            & (scaffold[:-1] >= 0)
+            & (scaffold[1:] >= 0)
+        )
+        if not offsets["intra"]:
+            keep &= (ids[:-1] != ids[1:]) & (scaffold[:-1] != scaffold[1:])
+
+        first = np.flatnonzero(keep[: stop - start])
+        rows = np.empty(2 * len(first), dtype=np.int64)
+        rows[0::2] = first
+        rows[1::2] = first + 1
+
+        shift = offsets["offset"][ids[rows]]
+        yield (
+            offsets["scaffold_names"],
+            scaffold[rows].astype(np.int64),
+            starts[rows] + shift,
+            ends[rows] + shift,
+            reads[rows],
+            mates[rows],
+        )
+
+
+# EXPORT_BED
+# input :
+#   store_dir : directory holding the columns of the store
+#   offsets_file : contig to scaffold table, or "abc" for contigs
+#   outfile : path to the bed file to write
+# output :
+#   bed file written for tools which can only read text, read names being
+#   replaced by their number in the store
+def export_bed(store_dir, offsets_file, outfile):
+    """
+    Write the alignments of the store as a bed file.
+    """
+    offsets = None
+    if offsets_file != "abc":
+        offsets = load_scaffold_offsets(offsets_file)
+
+    output = open(outfile, "w")
+    for names, ids, starts, ends, reads, mates in iter_alignments(store_dir, offsets):
+        lines = []
+        for cid, start, end, read, mate in zip(
+            ids.tolist(), starts.tolist(), ends.tolist(), reads.tolist(), mates.tolist()
+        ):
+            if cid < 0:
+                continue
+            lines.append(
+                "{0}\t{1}\t{2}\tr{3}/{4}\n".format(names[cid], start, end, read, mate)
+            )
+        output.write("".join(lines))
+    output.close()
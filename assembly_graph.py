@@ -0,0 +1,338 @@
+# ======================================================================#
+# Oriented overlap graph of the assembly and distances between its nodes
+# ======================================================================#
+
+import sys
+import numpy as np
+
+# ======================================================================#
+#                                ARGUMENTS
+# ======================================================================#
+
+# segment : sequence of a S line of the GFA file
+# node : one orientation of a segment, FOW or REV, node id is
+#        2 * segment id for FOW and 2 * segment id + 1 for REV
+# index_file : binary graph index written by build_graph_index, the segment
+#              names are written to index_file + ".names"
+
+ORIENTATIONS = ["FOW", "REV"]
+
+# The graph index is written to INDEX_FILE in the output directory. It starts
+# with this header, then holds the segment lengths, the offsets and the targets
+# of the edges as little-endian arrays, so that C++ tools can map it too
+INDEX_FILE = "assembly_graph.bin"
+INDEX_MAGIC = b"SALSAGFA"
+INDEX_VERSION = 1
+INDEX_HEADER = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<i8"),
+        ("segments", "<i8"),
+        ("edges", "<i8"),
+    ]
+)
+
+# Number of paths kept by a distance oracle, the cache is cleared above it
+CACHE_PATHS = 1 << 20
+
+# ======================================================================#
+#                                MODULES
+# ======================================================================#
+
+
+class AssemblyGraph:
+    """
+    Nodes and edges of the assembly graph in compressed sparse row form, the
+    successors of node i are targets[offsets[i]:offsets[i + 1]].
+    """
+
+    def __init__(self, segments, lengths, offsets, targets):
+        self.segments = segments
+        self.ids = {name: i for i, name in enumerate(segments)}
+        self.lengths = lengths
+        self.offsets = offsets
+        self.targets = targets
+
+    def _sources(self):
+        return np.repeat(
+            np.arange(self.number_of_nodes(), dtype=np.int64), np.diff(self.offsets)
+        )
+
+    def reverse(self):
+        """
+        Graph with every edge reversed, the predecessors of each node are its
+        successors there.
+        """
+        offsets, targets = _csr(
+            self.number_of_nodes(), np.asarray(self.targets), self._sources()
+        )
+        return AssemblyGraph(self.segments, self.lengths, offsets, targets)
+
+    def undirected(self):
+        """
+        Graph with the reverse of every edge added, like a networkx Graph.
+        """
+        sources = self._sources()
+        targets = np.asarray(self.targets)
+        offsets, targets = _csr(
+            self.number_of_nodes(),
+            np.concatenate((sources, targets)),
+            np.concatenate((targets, sources)),
+        )
+        return AssemblyGraph(self.segments, self.lengths, offsets, targets)
+
+    def node_id(self, segment, orientation):
+        """
+        Id of an orientation of a segment, -1 if the segment is not in the
+        graph.
+        """
+        idx = self.ids.get(segment)
+        if idx is None:
+            return -1
+        return 2 * idx + ORIENTATIONS.index(orientation)
+
+    def node_name(self, node):
+        return self.segments[node // 2], ORIENTATIONS[node % 2]
+
+    def successors(self, node):
+        return self.targets[self.offsets[node] : self.offsets[node + 1]]
+
+    def number_of_nodes(self):
+        return 2 * len(self.segments)
+
+    def number_of_edges(self):
+        return len(self.targets)
+
+
+def _csr(n, sources, targets):
+    """
+    Offsets and targets of edges sorted by source, in their order for each
+    source.
+    """
+    order = np.argsort(sources, kind="stable")
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n), out=offsets[1:])
+    return offsets, targets[order].astype(np.int32)
+
+
+# LOAD_GFA
+# input :
+#   path : GFA file of the contigs or unitigs
+# output :
+#   AssemblyGraph with both orientations of every segment
+def load_gfa(path):
+    """
+    Each link of the GFA file gives an edge between the orientations it joins
+    and one between their reverse complements.
+    """
+    segments = {}
+    lengths = {}
+    sources = []
+    targets = []
+
+    def node(name, orientation):
+        return 2 * segments.setdefault(name, len(segments)) + orientation
+
+    with open(path, "r") as f:
+        for line in f:
+            attrs = line.strip().split()
+            if not attrs:
+                continue
+
+            # S   tig00000001 *   LN:i:20388
+            # L   tig00023281 -   tig00008904 +   21556M  cv:A:F
+            if attrs[0] == "S":
+                node(attrs[1], 0)
+                for tag in attrs[3:]:
+                    if tag.startswith("LN:i:"):
+                        lengths[attrs[1]] = int(tag[5:])
+            if attrs[0] == "L" or attrs[0] == "E":
+                fow1 = attrs[2] == "+"
+                fow2 = attrs[4] == "+"
+                sources.append(node(attrs[1], 0 if fow1 else 1))
+                targets.append(node(attrs[3], 0 if fow2 else 1))
+                sources.append(node(attrs[3], 1 if fow2 else 0))
+                targets.append(node(attrs[1], 1 if fow1 else 0))
+
+    offsets, targets = _csr(
+        2 * len(segments),
+        np.array(sources, dtype=np.int64),
+        np.array(targets, dtype=np.int64),
+    )
+    return AssemblyGraph(
+        list(segments),
+        np.array([lengths.get(name, 0) for name in segments], dtype=np.int64),
+        offsets,
+        targets,
+    )
+
+
+# BUILD_GRAPH_INDEX
+# input :
+#   gfa : GFA file of the contigs or unitigs
+#   index_file : path of the graph index to write
+# output :
+#   number of segments of the graph
+def build_graph_index(gfa, index_file):
+    """
+    Parse the GFA file once and save its graph in a file that the stages can
+    map instead of parsing the GFA file again.
+    """
+    graph = load_gfa(gfa)
+    header = np.zeros(1, dtype=INDEX_HEADER)
+    header["magic"] = INDEX_MAGIC
+    header["version"] = INDEX_VERSION
+    header["segments"] = len(graph.segments)
+    header["edges"] = graph.number_of_edges()
+
+    with open(index_file + ".names", "w") as f:
+        for name in graph.segments:
+            f.write(name + "\n")
+    with open(index_file, "wb") as f:
+        header.tofile(f)
+        graph.lengths.astype("<i8").tofile(f)
+        graph.offsets.astype("<i8").tofile(f)
+        graph.targets.astype("<i4").tofile(f)
+    return len(graph.segments)
+
+
+# LOAD_GRAPH_INDEX
+# input :
+#   index_file : graph index written by build_graph_index
+# output :
+#   AssemblyGraph with memory-mapped arrays
+def load_graph_index(index_file):
+    header = np.fromfile(index_file, dtype=INDEX_HEADER, count=1)
+    if (
+        len(header) == 0
+        or header["magic"][0] != INDEX_MAGIC
+        or header["version"][0] != INDEX_VERSION
+    ):
+        print("ERROR : " + index_file + " is not a graph index of this version")
+        sys.exit(1)
+    n = int(header["segments"][0])
+    m = int(header["edges"][0])
+
+    with open(index_file + ".names", "r") as f:
+        segments = [line.rstrip("\n") for line in f]
+
+    start = INDEX_HEADER.itemsize
+    lengths = _map(index_file, "<i8", start, n)
+    offsets = _map(index_file, "<i8", start + 8 * n, 2 * n + 1)
+    targets = _map(index_file, "<i4", start + 8 * (3 * n + 1), m)
+    return AssemblyGraph(segments, lengths, offsets, targets)
+
+
+def _map(index_file, dtype, start, count):
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(index_file, dtype=dtype, mode="r", offset=start, shape=(count,))
+
+
+# LOAD_GRAPH
+# input :
+#   path : GFA file or graph index
+# output :
+#   AssemblyGraph of the file
+def load_graph(path):
+    with open(path, "rb") as f:
+        is_index = f.read(len(INDEX_MAGIC)) == INDEX_MAGIC
+    if is_index:
+        return load_graph_index(path)
+    return load_gfa(path)
+
+
+class DistanceOracle:
+    """
+    Shortest paths in the assembly graph, all edges weigh 1. Each query runs a
+    breadth first search from the source and one from the target on the
+    reverse graph, always extending the smaller frontier by one level, and
+    stops at the level where they meet. The paths found from each source are
+    kept.
+    """
+
+    def __init__(self, graph, cache_paths=CACHE_PATHS):
+        self.graphs = [graph, graph.reverse()]
+        self.cache_paths = cache_paths
+        self.known = {}
+        self.cached = 0
+
+    def _search(self, source, target):
+        """
+        Nodes of a shortest path from source to target, None if there is no
+        path.
+        """
+        if source == target:
+            return [source]
+        n = self.graphs[0].number_of_nodes()
+        if not (0 <= source < n and 0 <= target < n):
+            return None
+
+        # parent of each node reached from both ends, towards its end
+        parent = [{source: -1}, {target: -1}]
+        frontier = [[source], [target]]
+        while frontier[0] and frontier[1]:
+            side = 0 if len(frontier[0]) <= len(frontier[1]) else 1
+            graph = self.graphs[side]
+            reached = parent[side]
+            other = parent[1 - side]
+            meet = None
+            best = -1
+            following = []
+            for u in frontier[side]:
+                for w in graph.successors(u).tolist():
+                    if w in reached:
+                        continue
+                    reached[w] = u
+                    following.append(w)
+                    # the other search reached it already, the path is
+                    # shortest once the whole level is done
+                    if w in other:
+                        length = self._depth(other, w)
+                        if meet is None or length < best:
+                            meet = w
+                            best = length
+            if meet is not None:
+                path = self._walk(parent[0], meet)[::-1]
+                return path + self._walk(parent[1], meet)[1:]
+            frontier[side] = following
+        return None
+
+    def _depth(self, parent, node):
+        depth = 0
+        while parent[node] != -1:
+            node = parent[node]
+            depth += 1
+        return depth
+
+    def _walk(self, parent, node):
+        path = [node]
+        while parent[path[-1]] != -1:
+            path.append(parent[path[-1]])
+        return path
+
+    def path(self, source, target):
+        """
+        Nodes of a shortest path from source to target, None if there is no
+        path.
+        """
+        if source < 0 or target < 0:
+            return None
+        known = self.known.setdefault(source, {})
+        if target not in known:
+            if self.cached >= self.cache_paths:
+                self.known = {}
+                self.cached = 0
+                known = self.known.setdefault(source, {})
+            known[target] = self._search(source, target)
+            self.cached += 1
+        return known[target]
+
+    def distance(self, source, target):
+        """
+        Number of edges from source to target, -1 if there is no path.
+        """
+        path = self.path(source, target)
+        if path is None:
+            return -1
+        return len(path) - 1
@@ -0,0 +1,456 @@
+# ======================================================================#
+# Benchmark of the pipeline stages on a synthetic assembly and Hi-C data
+# ======================================================================#
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import traceback
+from functools import partial
+import numpy as np
+import seq_utils as sequ
+import digest
+import pair_cache
+import pipeline
+import run_pipeline
+import telemetry
+
+# ======================================================================#
+#                                ARGUMENTS
+# ======================================================================#
+
+# contigs : number of contigs of the synthetic assembly
+# genome_size : total length of the contigs
+# pairs : number of Hi-C read pairs of the bed file
+# misassembly_rate : fraction of contigs joining two distant parts of the genome
+# seed : seed of the random generator, the same seed gives the same data
+
+# Length of the reads and smallest contig of the synthetic data
+READ_LENGTH = 100
+MIN_CONTIG = 1000
+
+# Contigs per chromosome of the synthetic genome
+CHROMOSOME_CONTIGS = 100
+
+# Fraction of the pairs joining random positions rather than nearby ones
+TRANS_RATE = 0.1
+
+# Pairs and bases generated at once
+CHUNK_PAIRS = 1 << 20
+CHUNK_BASES = 1 << 24
+
+REPORT_FIELDS = [
+    "date",
+    "contigs",
+    "genome_size",
+    "pairs",
+    "misassembly_rate",
+    "stage",
+    "status",
+    "wall_s",
+    "cpu_s",
+    "peak_rss_kb",
+    "read_bytes",
+    "written_bytes",
+    "counts",
+]
+
+# ======================================================================#
+#                                MODULES
+# ======================================================================#
+
+
+class SyntheticGenome:
+    """
+    Random genome cut into contigs. Chromosomes are runs of consecutive
+    contigs, half of the contigs are reverse complemented and misassembled
+    contigs swap their second half with a contig of another part of the
+    genome. Each contig is a list of pieces of the genome so that positions
+    of the genome can be placed on the contigs.
+    """
+
+    def __init__(self, contigs, genome_size, misassembly_rate, seed):
+        if genome_size < 2 * MIN_CONTIG * contigs:
+            print("ERROR : genome size is too small for the number of contigs")
+            sys.exit(1)
+        self.rng = np.random.default_rng(seed)
+        self.genome_size = genome_size
+        self.sequence = np.frombuffer(b"ACGT", dtype=np.uint8)[
+            self.rng.integers(0, 4, genome_size, dtype=np.uint8)
+        ]
+
+        spare = genome_size - MIN_CONTIG * contigs
+        lengths = MIN_CONTIG + self.rng.multinomial(spare, np.ones(contigs) / contigs)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        self.chromosome_starts = starts[::CHROMOSOME_CONTIGS]
+
+        self.pieces = [[(int(s), int(s + n))] for s, n in zip(starts, lengths)]
+        chimeras = self.rng.permutation(contigs)[: int(misassembly_rate * contigs)]
+        for i, j in zip(chimeras[0::2], chimeras[1::2]):
+            (a, b), (c, d) = self.pieces[i][0], self.pieces[j][0]
+            self.pieces[i] = [(a, (a + b) // 2), ((c + d) // 2, d)]
+            self.pieces[j] = [(c, (c + d) // 2), ((a + b) // 2, b)]
+        self.reverse = self.rng.random(contigs) < 0.5
+        self.names = ["ctg%07d" % i for i in range(contigs)]
+
+        # pieces sorted by their start on the genome, with their contig and
+        # their offset on the forward contig
+        table = []
+        for cid, pieces in enumerate(self.pieces):
+            offset = 0
+            for start, end in pieces:
+                table.append((start, end, cid, offset))
+                offset += end - start
+        table.sort()
+        self.piece_starts = np.array([x[0] for x in table], dtype=np.int64)
+        self.piece_ends = np.array([x[1] for x in table], dtype=np.int64)
+        self.piece_contigs = np.array([x[2] for x in table], dtype=np.int64)
+        self.piece_offsets = np.array([x[3] for x in table], dtype=np.int64)
+        self.contig_lengths = np.array(
+            [sum(end - start for start, end in pieces) for pieces in self.pieces],
+            dtype=np.int64,
+        )
+
+    def write_fasta(self, path):
+        with open(path, "wb") as ofile:
+            writer = sequ.FastaWriter(ofile)
+            for cid, pieces in enumerate(self.pieces):
+                writer.start(self.names[cid])
+                if self.reverse[cid]:
+                    for start, end in reversed(pieces):
+                        for stop in range(end, start, -CHUNK_BASES):
+                            begin = max(start, stop - CHUNK_BASES)
+                            chunk = self.sequence[begin:stop].tobytes()
+                            writer.write(sequ.rev_comp(chunk))
+                else:
+                    for start, end in pieces:
+                        for i in range(start, end, CHUNK_BASES):
+                            chunk = self.sequence[i : min(end, i + CHUNK_BASES)]
+                            writer.write(chunk.tobytes())
+            writer.end()
+
+    def place(self, positions):
+        """
+        Contig, start on the contig and strand of reads starting at positions
+        of the genome, contig -1 for reads which do not fit in one piece.
+        """
+        k = np.searchsorted(self.piece_starts, positions, side="right") - 1
+        fits = positions + READ_LENGTH <= self.piece_ends[k]
+        contigs = np.where(fits, self.piece_contigs[k], -1)
+        starts = self.piece_offsets[k] + positions - self.piece_starts[k]
+        reverse = self.reverse[self.piece_contigs[k]]
+        starts = np.where(
+            reverse,
+            self.contig_lengths[self.piece_contigs[k]] - starts - READ_LENGTH,
+            starts,
+        )
+        return contigs, starts, reverse
+
+    def write_bed(self, path, pairs):
+        """
+        Bed file of read pairs sorted by read names. Most pairs are at a
+        distance following a power law on the same chromosome, the others
+        join random positions.
+        """
+        last = self.genome_size - READ_LENGTH
+        ends = np.append(self.chromosome_starts[1:], self.genome_size) - READ_LENGTH
+        written = 0
+        with open(path, "w") as ofile:
+            while written < pairs:
+                n = min(CHUNK_PAIRS, pairs - written)
+                pos1 = self.rng.integers(0, last, n)
+                chrom = np.searchsorted(self.chromosome_starts, pos1, side="right") - 1
+                distance = (1000 * self.rng.pareto(0.8, n)).astype(np.int64)
+                pos2 = pos1 + np.where(self.rng.random(n) < 0.5, -distance, distance)
+                trans = self.rng.random(n) < TRANS_RATE
+                pos2 = np.where(trans, self.rng.integers(0, last, n), pos2)
+                keep = trans | (
+                    (pos2 >= self.chromosome_starts[chrom]) & (pos2 < ends[chrom])
+                )
+                pos1 = pos1[keep]
+                pos2 = pos2[keep]
+
+                ctg1, start1, rev1 = self.place(pos1)
+                ctg2, start2, rev2 = self.place(pos2)
+                keep = (ctg1 >= 0) & (ctg2 >= 0)
+                lines = []
+                for read, c1, s1, r1, c2, s2, r2 in zip(
+                    range(written, written + int(keep.sum())),
+                    ctg1[keep].tolist(),
+                    start1[keep].tolist(),
+                    rev1[keep].tolist(),
+                    ctg2[keep].tolist(),
+                    start2[keep].tolist(),
+                    rev2[keep].tolist(),
+                ):
+                    lines.append(
+                        "%s\t%d\t%d\tread%010d/1\t60\t%s\n"
+                        % (self.names[c1], s1, s1 + READ_LENGTH, read, "+-"[r1])
+                    )
+                    lines.append(
+                        "%s\t%d\t%d\tread%010d/2\t60\t%s\n"
+                        % (self.names[c2], s2, s2 + READ_LENGTH, read, "+-"[r2])
+                    )
+                ofile.writelines(lines)
+                written += int(keep.sum())
+        return written
+
+
+class StageList:
+    """
+    Stages added by the functions of run_pipeline, kept in the order they are
+    added to run them one by one.
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    def add(self, stage):
+        self.stages.append(stage)
+
+    def wait(self, paths=None):
+        pass
+
+
+# MEASURE
+# input :
+#   run : function called without arguments
+# output :
+#   dictionary of status, wall and cpu time, peak resident memory, bytes
+#   read and written and record counts of run and the programs it starts
+def measure(run):
+    """
+    Run a function in a child process, so that its peak memory is not mixed
+    with the one of the other stages.
+    """
+    fd, counts_file = tempfile.mkstemp(prefix="salsa_counts_")
+    os.close(fd)
+    read_fd, write_fd = os.pipe()
+    start = time.time()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        # counts of the stage and of its programs go to the same file
+        os.environ[telemetry.COUNTS_ENV] = counts_file
+        status = 0
+        before = telemetry.io_counters("/proc/self/io")
+        try:
+            run()
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        after = telemetry.io_counters("/proc/self/io")
+        sys.stdout.flush()
+        sys.stderr.flush()
+        with os.fdopen(write_fd, "w") as f:
+            json.dump([after[0] - before[0], after[1] - before[1]], f)
+        os._exit(status)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd, "r") as f:
+        counted = f.read()
+    _, status, usage = os.wait4(pid, 0)
+    wall = time.time() - start
+    read_bytes, written_bytes = json.loads(counted) if counted else (0, 0)
+    counts = telemetry.read_counts(counts_file)
+    os.remove(counts_file)
+    return {
+        "status": "done" if status == 0 else "failed",
+        "wall_s": round(wall, 3),
+        "cpu_s": round(usage.ru_utime + usage.ru_stime, 3),
+        "peak_rss_kb": usage.ru_maxrss,
+        "read_bytes": read_bytes,
+        "written_bytes": written_bytes,
+        "counts": ",".join(name + "=" + str(counts[name]) for name in sorted(counts)),
+    }
+
+
+# PIPELINE_STAGES
+# input :
+#   args : arguments of the benchmark
+#   assembly, bed : synthetic data
+#   log : file receiving the commands
+# output :
+#   stages of the first iteration of the pipeline, in order
+def pipeline_stages(args, assembly, bed, log):
+    workdir = os.path.dirname(os.path.abspath(__file__))
+    out = args.output
+    store = out + "/alignments"
+    lengths = out + "/scaffold_length_iteration_1"
+    cleaned = out + "/assembly.cleaned.fasta"
+    pipeline_args = argparse.Namespace(
+        output=out,
+        gfa="abc",
+        dup="abc",
+        cutoff=MIN_CONTIG,
+        enzyme=args.enzyme,
+        workers=args.workers,
+    )
+
+    graph = StageList()
+    graph.add(
+        pipeline.Stage(
+            "lengths",
+            partial(
+                sequ.make_seq_length_file,
+                assembly=assembly,
+                output_file=lengths,
+                namelist_file=out + "/contig_names.txt",
+            ),
+        )
+    )
+    graph.add(pipeline.Stage("assembly", partial(pipeline.link, assembly, cleaned)))
+    graph.add(
+        pipeline.Stage(
+            "pair_cache",
+            partial(
+                pair_cache.prepare_pair_cache,
+                bed_file=bed,
+                length_file=lengths,
+                store_dir=store,
+            ),
+        )
+    )
+    graph.add(
+        pipeline.Stage(
+            "digest",
+            partial(
+                digest.generate_digested_fragments,
+                assembly=cleaned,
+                enzyme=args.enzyme,
+                outname=out + "/re_counts_iteration_1",
+                workers=int(args.workers),
+            ),
+        )
+    )
+    links = run_pipeline.add_link_stages(graph, pipeline_args, 1, "chunked")
+    run_pipeline.add_layout_stages(graph, pipeline_args, 1, links, workdir, log)
+    run_pipeline.add_get_seq_stage(graph, pipeline_args, 1, "ITERATION_1", log)
+    return graph.stages
+
+
+# WRITE_REPORT
+# input :
+#   report : tab separated file the rows are appended to
+#   rows : dictionaries with the fields of REPORT_FIELDS
+def write_report(report, rows):
+    new = not os.path.isfile(report)
+    with open(report, "a") as f:
+        if new:
+            f.write("\t".join(REPORT_FIELDS) + "\n")
+        for row in rows:
+            f.write("\t".join(str(row[field]) for field in REPORT_FIELDS) + "\n")
+
+
+# ======================================================================#
+#                                MAIN
+# ======================================================================#
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the SALSA stages on synthetic data"
+    )
+    parser.add_argument(
+        "-n", "--contigs", help="Number of contigs, default = 1000", default=1000
+    )
+    parser.add_argument(
+        "-s",
+        "--genome_size",
+        help="Total length of the contigs, default = 20000000",
+        default=20000000,
+    )
+    parser.add_argument(
+        "-r",
+        "--pairs",
+        help="Number of Hi-C read pairs, default = 1000000",
+        default=1000000,
+    )
+    parser.add_argument(
+        "-m",
+        "--misassembly_rate",
+        help="Fraction of misassembled contigs, default = 0.01",
+        default=0.01,
+    )
+    parser.add_argument("-d", "--seed", help="Random seed, default = 1", default=1)
+    parser.add_argument(
+        "-e", "--enzyme", help="Restriction enzyme, default = GATC", default="GATC"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="Number of processes used to digest the genome and count links, "
+        "default = 1",
+        default=1,
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Directory of the synthetic data and of the outputs",
+        default="SALSA_benchmark",
+    )
+    parser.add_argument(
+        "-t",
+        "--report",
+        help="Tab separated file the timings are appended to, "
+        "default = OUTPUT/benchmark.tsv",
+        default="abc",
+    )
+    args = parser.parse_args()
+
+    if not os.path.exists(args.output):
+        os.mkdir(args.output)
+    report = args.report
+    if report == "abc":
+        report = args.output + "/benchmark.tsv"
+    assembly = args.output + "/synthetic.fasta"
+    bed = args.output + "/synthetic.bed"
+    scale = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "contigs": int(args.contigs),
+        "genome_size": int(args.genome_size),
+        "pairs": int(args.pairs),
+        "misassembly_rate": float(args.misassembly_rate),
+    }
+
+    genome = SyntheticGenome(
+        scale["contigs"],
+        scale["genome_size"],
+        scale["misassembly_rate"],
+        int(args.seed),
+    )
+    genome.write_fasta(assembly)
+    genome.write_bed(bed, scale["pairs"])
+    del genome
+
+    log = open(args.output + "/commands.log", "w", 1)
+    rows = []
+    print("%-22s %8s %10s %10s %12s %14s %14s %s" % tuple(REPORT_FIELDS[5:]))
+    for stage in pipeline_stages(args, assembly, bed, log):
+        row = dict(scale, stage=stage.name, **measure(stage.run))
+        rows.append(row)
+        print(
+            "%-22s %8s %10.3f %10.3f %12d %14d %14d %s"
+            % (
+                row["stage"],
+                row["status"],
+                row["wall_s"],
+                row["cpu_s"],
+                row["peak_rss_kb"],
+                row["read_bytes"],
+                row["written_bytes"],
+                row["counts"],
+            )
+        )
+        if row["status"] != "done":
+            print("ERROR : " + stage.error)
+            break
+    log.close()
+    write_report(report, rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,7 @@
 //#include <thread>
 
 #include "cmdline.h"
+#include "coverage_track.h"
 
 using namespace std;
 
@@ -141,6 +142,14 @@ double inspect(int pos, vector<int>& count)
 	}
 }
 
+// One record of the pair table written by pair_cache.py (PAIR_DTYPE)
+struct PairRecord
+{
+    int64_t start1, end1, start2, end2, mid1, mid2;
+    int32_t contig1, contig2;
+    int8_t mate1, mate2;
+};
+
 bool check_if_inside(string contig, long start, long end)
 {
     if(contig2breakpoints.find(contig) == contig2breakpoints.end())
@@ -159,15 +168,88 @@ bool check_if_inside(string contig, long start, long end)
 
 }
 
+// The coverage of a window is summed from the base before its start, so the
+// coverage at the base before that one is subtracted from the whole window
+long restart_position(long start)
+{
+    return max(start - 2, -1L);
+}
+
+// Add a scaffold to the coverage, with the restart points of its windows
+void add_scaffold(CoverageBuilder& coverage, string contig)
+{
+    if(coverage.contains(contig))
+        return;
+    coverage.add_sequence(contig, contig_length[contig]);
+    if(contig2breakpoints.find(contig) == contig2breakpoints.end())
+        return;
+    vector<pair<long,pair<long,long>>> &positions = contig2breakpoints[contig];
+    for(int i = 0;i < positions.size();i++)
+    {
+        coverage.add_point(contig, restart_position(positions[i].second.first));
+    }
+}
+
+void add_pair(CoverageBuilder& coverage, unordered_map<string,int>& contig2cutoff, string contig, long prev_start, long prev_end, long start, long end)
+{
+    if(prev_end <= start)
+    {
+        if(check_if_inside(contig,prev_start,end+1))
+        {
+            if(end - prev_start <= contig2cutoff[contig])
+            {
+                coverage.add_span(contig, prev_start, end);
+            }
+        }
+    }
+}
+
+void load_pairs(string file, string names_file, CoverageBuilder& coverage, unordered_map<string,int>& contig2cutoff)
+{
+    vector<string> names;
+    string line;
+    ifstream namefile(getCharExpr(names_file));
+    while(getline(namefile,line))
+    {
+        names.push_back(line);
+    }
+    namefile.close();
+
+    ifstream pairfile(getCharExpr(file), ios::binary);
+    vector<PairRecord> records(1000000);
+    while(pairfile)
+    {
+        pairfile.read((char*)records.data(), records.size()*sizeof(PairRecord));
+        long n = pairfile.gcount()/sizeof(PairRecord);
+        for(long i = 0; i < n; i++)
+        {
+            PairRecord& r = records[i];
+            if(r.contig1 < 0 || r.contig1 != r.contig2)
+                continue;
+            string contig = names[r.contig1];
+            if(contig_length[contig] < 1000000)
+                continue;
+            add_scaffold(coverage, contig);
+            add_pair(coverage,contig2cutoff,contig,r.start1,r.end1,r.start2,r.end2);
+        }
+    }
+    pairfile.close();
+}
+
 int main(int argc, char *argv[])
 {
 	cmdline::parser p;
-	p.add<string>("alignment", 'a', "bed file for alignment", true, "");
+	p.add<string>("alignment", 'a', "bed file for alignment", false, "");
+	p.add<string>("pairs", 'p', "pair table written by pair_cache.py, used instead of the bed file", false, "");
+	p.add<string>("names", 'n', "scaffold names of the pair table", false, "");
 	//p.add<string>("outputdir", 'd', "coordinate output file", true, "");
 	p.add<string>("breakpoints", 'b', "breakpoints", true, "");
     p.add<int>("min_size",'s',"Minimum mate pair separation for error findng",true,0);
 	p.add<string>("contiglen", 'l', "length of contigs", true, "");
 	p.add<int>("iteration",'i',"Iteration number",true,0);
+	p.add<int>("bin_size",'z',"Bases between two coverage samples",false,1);
+	p.add<string>("coverage",'c',"coverage track written by coverage_track.py, used instead of the alignments or pairs",false,"");
+	p.add<string>("write_coverage",'w',"coverage track to write",false,"");
     p.parse_check(argc, argv);	
 	string line;
 	ifstream lenfile(getCharExpr(p.get<string>("contiglen")));
@@ -186,9 +268,14 @@ int main(int argc, char *argv[])
 	lenfile.close();
 	load_breakpoints(p.get<string>("breakpoints"));
 	//cout<<"loaded breakpoints"<<endl;
-	ifstream bedfile(getCharExpr(p.get<string>("alignment")));
-	
-	unordered_map<string,vector<int> > contig2coverage;
+	CoverageBuilder builder(p.get<int>("bin_size"));
+	if(p.get<string>("pairs") != "" && p.get<string>("coverage") == "")
+	{
+		load_pairs(p.get<string>("pairs"),p.get<string>("names"),builder,contig2cutoff);
+	}
+	ifstream bedfile;
+	if(p.get<string>("coverage") == "")
+		bedfile.open(getCharExpr(p.get<string>("alignment")));
     string prev_line = "";
 	string prev_contig="";
 	long prev_start=-1;
@@ -219,29 +306,10 @@ int main(int argc, char *argv[])
 			prev_read = read;
 			continue;
 		}
-		if(contig2coverage.find(contig) == contig2coverage.end())
-		{
-			vector<int> cov(contig_length[contig]+10,0);
-			contig2coverage[contig] = cov;
-		}
-		//vector<int> cov = contig2coverage[contig];
+		add_scaffold(builder, contig);
 		if(read.substr(0,read.length()-2) == prev_read.substr(0,prev_read.length()-2) && prev_contig == contig)
 		{
-			// cout<<"here"<<endl;
-			if(prev_end <= start)
-			{
-				//cout<<"here"<<endl;
-                if(check_if_inside(contig,prev_start,end+1))               
-                {
-                    if(end - prev_start <= contig2cutoff[contig])
-                    {
-                        contig2coverage[contig].at(prev_start) += 1;
-				        contig2coverage[contig].at(end+1) -= 1;
-                    }
-                }
-				// cout<<contig2coverage[contig].at(prev_start)<<endl;
-			}
-			//contig2coverage[contig] = cov;
+			add_pair(builder,contig2cutoff,contig,prev_start,prev_end,start,end);
 		}
 		prev_contig = contig;
 		prev_start = start;
@@ -254,58 +322,57 @@ int main(int argc, char *argv[])
     int total_breakpoints = 0;
     int suspicious_breakpoints = 0;
     
-	for(unordered_map<string,vector<int> > :: iterator it = contig2coverage.begin(); it != contig2coverage.end();++it)
+	CoverageTrack coverage = p.get<string>("coverage") != "" ? load_track(p.get<string>("coverage")) : builder.finish();
+	if(p.get<string>("write_coverage") != "")
+	{
+		write_track(p.get<string>("write_coverage"), coverage);
+	}
+	long bin_size = coverage.bin_size;
+	for(size_t c = 0; c < coverage.names.size(); c++)
 	{
 		//cout<<"Testing contig " << it->first<<endl;
-        string contig = it->first;
-        if (contig2breakpoints.find(it->first) != contig2breakpoints.end())
+        string contig = coverage.names[c];
+        if (contig2breakpoints.find(contig) != contig2breakpoints.end())
         {
             cout<<contig;
-            vector<pair<long,pair<long,long>>> positions = contig2breakpoints[it->first];
+            vector<pair<long,pair<long,long>>> &positions = contig2breakpoints[contig];
+            long count;
+            const uint32_t *cov = coverage.track(contig, count);
             
             for(int i = 0;i < positions.size();i++)
             {
                 //cout<<"testing "<<i<<endl;
                 long misasm_loc = positions[i].first;
-                long start = positions[i].second.first;
-                long end = positions[i].second.second;
-                long start_pos = start;
-                long end_pos = end;
-                vector<int> cov = contig2coverage[it->first];
-                vector<int> local_coverage;
-                vector<int>tmpcov(cov);
-                for(long j = start;j < end;j++)
+                // samples of the window, read in place from the track
+                long start_pos = coverage.first_sample(positions[i].second.first);
+                long end_pos = min(coverage.first_sample(positions[i].second.second), count);
+                const uint32_t *local_coverage = cov + start_pos;
+                long sz = end_pos - start_pos;
+                if(sz <= 0)
                 {
-                    tmpcov[j] += tmpcov[j-1];
-                    local_coverage.push_back(tmpcov[j]);;
+                    total_breakpoints += 1;
+                    continue;
                 }
-               // ofstream covfile(to_string(i)+"_coverage.txt");
-                //for(long k = 0;k < local_coverage.size();k+=1000)
-                //{
-                //   covfile<<k<<"\t"<<local_coverage[k]<<endl;
-                //}
-                //covfile.close();
-                contig2coverage[it->first] = cov;
-                double average = accumulate(local_coverage.begin(),local_coverage.end(),0.0)/local_coverage.size();
+                long restart = coverage.point(contig, restart_position(positions[i].second.first));
+                double average = (accumulate(local_coverage,local_coverage + sz,0.0) - (double) restart * sz)/sz;
                 //cout<<"average coverage = "<<average<<endl;
                 vector<long> misasm_pos;
+                vector<int>delta(sz);
                for(int div = 5; div <= 15; div++)                                                                        
                {
                    double cutoff = average/div;                                                                         
-                   vector<int>delta;
                    //cout<<"Cutoff = " << cutoff<<endl;
-                   for(long j = 0; j < local_coverage.size();j++)
+                   for(long j = 0; j < sz;j++)
                    {
-                       if(local_coverage[j] < cutoff)
+                       if((long) local_coverage[j] - restart < cutoff)
                        {
-                           delta.push_back(5);
+                           delta[j] = 5;
                        }
                        else
                        {
-                           delta.push_back(-5); 
+                           delta[j] = -5; 
                        }
                    }
-                   long sz = delta.size();
                    //cout<<"Running Kadane algorithm"<<endl;
                    /*
                     * Now find maximum sum subarray of delta with Kadane's algorithm
@@ -328,7 +395,8 @@ int main(int argc, char *argv[])
                        }
                    }
                    //cout<<start<<"\t"<<end<<endl;
-                   if(misasm_loc >= start + start_pos && misasm_loc <= end+start_pos)
+                   // the region is known to within a sample on each side
+                   if(misasm_loc >= (start + start_pos) * bin_size - (bin_size - 1) && misasm_loc <= (end + start_pos) * bin_size + (bin_size - 1))
                    {
                        misasm_pos.push_back((start+end)/2);
                    }
@@ -12,6 +12,7 @@
 //#include <thread>
 
 #include "cmdline.h"
+#include "coverage_track.h"
 
 using namespace std;
 
@@ -268,12 +269,15 @@ void get_MAD(string contig, vector<int>& count)
 int main(int argc, char *argv[])
 {
 	cmdline::parser p;
-	p.add<string>("alignment", 'a', "bed file for alignment", true, "");
+	p.add<string>("alignment", 'a', "bed file for alignment", false, "");
 	//p.add<string>("outputdir", 'd', "coordinate output file", true, "");
 	//p.add<string>("breakpoints", 'b', "breakpoints", true, "");
 	p.add<string>("contiglen", 'l', "length of contigs", true, "");
 	//p.add<int>("iteration",'i',"Iteration number",true,0);
     p.add<int>("min_size",'s',"Minimum mate pair separation for error findng",true,0);
+	p.add<int>("bin_size",'z',"Bases between two coverage samples",false,1);
+	p.add<string>("coverage",'c',"coverage track written by coverage_track.py, used instead of the alignments",false,"");
+	p.add<string>("write_coverage",'w',"coverage track to write",false,"");
     p.parse_check(argc, argv);	
 	string line;
 	ifstream lenfile(getCharExpr(p.get<string>("contiglen")));
@@ -292,9 +296,11 @@ int main(int argc, char *argv[])
 	lenfile.close();
 	//load_breakpoints(p.get<string>("breakpoints"));
 	//cout<<"loaded breakpoints"<<endl;
-	ifstream bedfile(getCharExpr(p.get<string>("alignment")));
+	ifstream bedfile;
+	if(p.get<string>("coverage") == "")
+		bedfile.open(getCharExpr(p.get<string>("alignment")));
 	
-	unordered_map<string,vector<int> > contig2coverage;
+	CoverageBuilder builder(p.get<int>("bin_size"));
 	string prev_line = "";
 	string prev_contig="";
 	long prev_start=-1;
@@ -323,12 +329,7 @@ int main(int argc, char *argv[])
 			prev_read = read;
 			continue;
 		}
-		if(contig2coverage.find(contig) == contig2coverage.end())
-		{
-			vector<int> cov(contig_length[contig]+10,0);
-			contig2coverage[contig] = cov;
-		}
-		//vector<int> cov = contig2coverage[contig];
+		builder.add_sequence(contig, contig_length[contig]);
 		if(read.substr(0,read.length()-2) == prev_read.substr(0,prev_read.length()-2) && prev_contig == contig)
 		{
            long span_start = 0, span_end = 0;                   
@@ -365,8 +366,7 @@ int main(int argc, char *argv[])
            {
                 if(span_end - span_start <= contig2cutoff[contig])
                 {
-                    contig2coverage[contig].at(span_start) += 1; 
-                    contig2coverage[contig].at(span_end+1) -= 1;
+                    builder.add_span(contig, span_start, span_end);
                 }
 			
            } //contig2coverage[contig] = cov;
@@ -382,42 +382,49 @@ int main(int argc, char *argv[])
     int total_breakpoints = 0;
     int suspicious_breakpoints = 0;
 
-	for(unordered_map<string,vector<int> > :: iterator it = contig2coverage.begin(); it != contig2coverage.end();++it)
+	CoverageTrack coverage = p.get<string>("coverage") != "" ? load_track(p.get<string>("coverage")) : builder.finish();
+	if(p.get<string>("write_coverage") != "")
+	{
+		write_track(p.get<string>("write_coverage"), coverage);
+	}
+	long bin_size = coverage.bin_size;
+	// 5000 bases, in samples
+	long margin = (5000 + bin_size - 1) / bin_size;
+
+	for(size_t c = 0; c < coverage.names.size(); c++)
 	{
 		//cout<<"Testing contig " << it->first<<endl;
-        vector<int> cov = contig2coverage[it->first];
-		for(long i = 1; i< cov.size();i++)
-		{
-			cov[i] += cov[i-1];
-			//cout<<(int)cov[i]<<endl;
-		}
-		contig2coverage[it->first] = cov;
+        string contig = coverage.names[c];
+        long sz;
+        const uint32_t *cov = coverage.track(contig, sz);
+        if(sz == 0)
+        {
+            continue;
+        }
 		//get_MAD_complete(it->first,cov);
-        string contig = it->first;
 	    
         /*
          *Delta array will store 1 if coverage is less than threshold , -1 otherwise
          */
         
-        double average = accumulate(cov.begin(),cov.end(),0.0)/cov.size();
+        double average = accumulate(cov,cov + sz,0.0)/sz;
         vector<long> positions;
+        vector<int>delta(sz);
         for(int div = 5; div <= 15; div++)
         {
             double cutoff = average/div; 
-            vector<int>delta;
             //cout<<"Cutoff = " << cutoff<<endl;
-            for(long i = 0; i < cov.size();i++)
+            for(long i = 0; i < sz;i++)
             {
                 if(cov[i] < cutoff)
                 {
-                    delta.push_back(5);
+                    delta[i] = 5;
                 }
                 else
                 {
-                    delta.push_back(-5); 
+                    delta[i] = -5; 
                 }
             }
-            long sz = delta.size();
             //cout<<"Running Kadane algorithm"<<endl;
             /*
              * Now find maximum sum subarray of delta with Kadane's algorithm
@@ -439,9 +446,9 @@ int main(int argc, char *argv[])
                     s = i + 1;
                 }
             }
-            if(start >= sz/100 + 5000 && end <= 9*sz/10 - 5000)
+            if(start >= sz/100 + margin && end <= 9*sz/10 - margin)
             {
-                positions.push_back((start+end)/2);
+                positions.push_back((start+end)/2 * bin_size);
             }
             //cout<<"Possible Misassembly with cutoff "<<cutoff<<" in "<<contig<<" at "<<start<<"\t"<<end<<endl;
         }
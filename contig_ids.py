@@ -0,0 +1,163 @@
+# ======================================================================#
+# Shared contig identifiers
+# ======================================================================#
+
+import numpy as np
+
+# ======================================================================#
+#                                ARGUMENTS
+# ======================================================================#
+
+# length_file : path to file with contigs length, as written by
+#               seq_utils.make_seq_length_file
+# re_file : path to restriction sites counts per half of contigs
+
+# Contig ends are numbered 2 * contig_id + end, with end 0 for B and 1 for E
+ENDS = ["B", "E"]
+
+# ======================================================================#
+#                                MODULES
+# ======================================================================#
+
+
+class ContigIds:
+    """
+    Dictionnary between contig names and integer ids. Ids follow the order in
+    which contigs are added, names are only needed at the output boundary.
+    """
+
+    def __init__(self, names=[]):
+        self.names = []
+        self.index = {}
+        self._rank = None
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    # ADD
+    # input :
+    #   name : contig name
+    # output :
+    #   integer id of the contig, added if it was not known yet
+    def add(self, name) -> int:
+        """
+        Intern a contig name.
+        """
+        cid = self.index.get(name)
+        if cid is None:
+            cid = len(self.names)
+            self.index[name] = cid
+            self.names.append(name)
+            self._rank = None
+        return cid
+
+    def get(self, name, default=-1) -> int:
+        """
+        Return the id of a contig, or default if it is unknown.
+        """
+        return self.index.get(name, default)
+
+    # INTERN
+    # input :
+    #   names : iterable of contig names
+    # output :
+    #   numpy array of ids, -1 for unknown contigs
+    def intern(self, names):
+        """
+        Convert a list of names into an array of ids.
+        """
+        index = self.index
+        return np.array([index.get(name, -1) for name in names], dtype=np.int64)
+
+    @property
+    def rank(self):
+        """
+        Position of each id in the sorted list of names, so that comparing
+        ranks gives the same result as comparing names.
+        """
+        if self._rank is None:
+            order = sorted(range(len(self.names)), key=self.names.__getitem__)
+            self._rank = np.empty(len(self.names), dtype=np.int64)
+            self._rank[order] = np.arange(len(self.names), dtype=np.int64)
+        return self._rank
+
+    # NODE_ID
+    # input :
+    #   node : contig end name, such as "tig00000001:B"
+    # output :
+    #   integer id of the contig end
+    def node_id(self, node) -> int:
+        """
+        Intern a contig end.
+        """
+        contig, end = node.rsplit(":", 1)
+        return 2 * self.add(contig) + ENDS.index(end)
+
+    def node_name(self, nid) -> str:
+        """
+        Name of a contig end from its id.
+        """
+        return self.names[nid // 2] + ":" + ENDS[nid % 2]
+
+    # LOAD_LENGTHS
+    # input :
+    #   length_file : path to file with contigs length
+    # output :
+    #   lengths : numpy array of lengths indexed by contig id
+    def load_lengths(self, length_file, dtype=np.int64):
+        """
+        Read a length file into an array, adding unknown contigs.
+        """
+        values = {}
+        with open(length_file, "r") as f:
+            for line in f:
+                attrs = line.split()
+                values[self.add(attrs[0])] = attrs[1]
+        lengths = np.zeros(len(self.names), dtype=dtype)
+        for cid, value in values.items():
+            lengths[cid] = dtype(float(value))
+        return lengths
+
+    # LOAD_RE_COUNTS
+    # input :
+    #   re_file : path to restriction sites counts per half of contigs
+    # output :
+    #   counts : numpy array of shape (number of contigs, 2), 0 for contigs
+    #            absent from the file
+    def load_re_counts(self, re_file, dtype=np.int64):
+        """
+        Read restriction sites counts into an array.
+        """
+        counts = np.zeros((len(self.names), 2), dtype=dtype)
+        with open(re_file, "r") as f:
+            for line in f:
+                attrs = line.split()
+                cid = self.get(attrs[0])
+                if cid >= 0:
+                    counts[cid] = [dtype(float(attrs[1])), dtype(float(attrs[2]))]
+        return counts
+
+
+# ======================================================================#
+#                                MAIN
+# ======================================================================#
+
+
+# LOAD_CONTIG_IDS
+# input :
+#   length_file : path to file with contigs length
+# output :
+#   contig_ids : ContigIds built in the order of the length file
+#   lengths : numpy array of lengths indexed by contig id
+def load_contig_ids(length_file, dtype=np.int64):
+    """
+    Build the contig dictionnary from a length file.
+    """
+    contig_ids = ContigIds()
+    lengths = contig_ids.load_lengths(length_file, dtype)
+    return contig_ids, lengths
@@ -1,111 +1,83 @@
+import os
 import sys
+from bisect import bisect_right
 import seq_utils as sequ
 
 # reads input assembly, breakpoints given by the method and outputs new contig file with lengths
 # offsets bed file as well
-# read fasta first
-input_seqs = sequ.parse_fasta(sys.argv[1])
+# a contig with breakpoints b1 < b2 < ... < bk is split into contig_1 = [0, b1),
+# contig_2 = [b1, b2), ..., contig_k+1 = [bk, end), other contigs keep their name
 
-# read breakpoints
+# Bytes buffered by the writers of the bed and length files
+WRITE_BUFFER = 1 << 22
 
+# index fasta first, sequences are only read when the new contigs are written,
+# the index is kept in the output directory rather than next to the input
+input_seqs = sequ.IndexedFasta(
+    sys.argv[1], sys.argv[4] + "/" + os.path.basename(sys.argv[1]) + ".fai"
+)
+
+# read breakpoints, one line per breakpoint, several lines for a contig with
+# several breakpoints
 contig2breakpoints = {}
 with open(sys.argv[2], "r") as f:
     for line in f:
         attrs = line.split()
-        contig2breakpoints[attrs[0]] = int(attrs[1])
+        if len(attrs) < 2 or attrs[0] not in input_seqs:
+            continue
+        pos = int(attrs[1])
+        # a breakpoint at either end would give an empty contig
+        if 0 < pos < input_seqs.length(attrs[0]):
+            contig2breakpoints.setdefault(attrs[0], set()).add(pos)
 
-# first breake the input assembly and store the mapping of old to new names of contigs
-contig2new = {}
-contig2newseq = {}
-contig_id = 1
-for seq in input_seqs:
-    if seq not in contig2breakpoints:
-        contig2new[seq] = seq
-        contig2newseq[seq] = input_seqs[seq]
-        contig_id += 1
-    else:
-        first = input_seqs[seq][: contig2breakpoints[seq]]
-        second = input_seqs[seq][contig2breakpoints[seq] :]
-        first_id = seq + "_1"
-        contig_id += 1
-        second_id = seq + "_2"
-        contig_id += 1
-        contig2new[seq] = [first_id, second_id]
-        contig2newseq[first_id] = first
-        contig2newseq[second_id] = second
+for contig in contig2breakpoints:
+    contig2breakpoints[contig] = sorted(contig2breakpoints[contig])
 
-# now update the bed file in streaming fashion
-oline = ""
-count = 0
-ofile = open(sys.argv[4] + "/alignment_iteration_1.tmp.bed", "w")
+# now update the bed file in streaming fashion, an alignment spanning a
+# breakpoint is dropped, the others are moved to the contig holding them
+ofile = open(sys.argv[4] + "/alignment_iteration_1.tmp.bed", "w", WRITE_BUFFER)
 with open(sys.argv[3], "r") as f:
     for line in f:
-        attrs = line.split()
-        if attrs[0] not in contig2breakpoints:
-            oline += str(
-                contig2new[attrs[0]]
-                + "\t"
-                + attrs[1]
-                + "\t"
-                + attrs[2]
-                + "\t"
-                + attrs[3]
-                + "\n"
-            )
-            count += 1
-        else:
-            pos1 = int(attrs[1])
-            pos2 = int(attrs[2])
-            breakpoint_loc = contig2breakpoints[attrs[0]]
-            if pos1 < breakpoint_loc and pos2 > breakpoint_loc:
-                continue
-            else:
-                if pos2 < breakpoint_loc:
-                    oline += str(
-                        contig2new[attrs[0]][0]
-                        + "\t"
-                        + attrs[1]
-                        + "\t"
-                        + attrs[2]
-                        + "\t"
-                        + attrs[3]
-                        + "\n"
-                    )
-                    count += 1
-                else:
-                    new_start = pos1 - breakpoint_loc
-                    new_end = pos2 - breakpoint_loc
-                    oline += str(
-                        contig2new[attrs[0]][1]
-                        + "\t"
-                        + str(new_start)
-                        + "\t"
-                        + str(new_end)
-                        + "\t"
-                        + attrs[3]
-                        + "\n"
-                    )
-                    count += 1
-        if count >= 1000000:
-            ofile.write(oline)
-            oline = ""
-            count = 0
+        attrs = line.split(None, 4)
+        breakpoints = contig2breakpoints.get(attrs[0])
+        if breakpoints is None:
+            ofile.write(attrs[0] + "\t" + attrs[1] + "\t" + attrs[2])
+            ofile.write("\t" + attrs[3] + "\n")
+            continue
+
+        pos1 = int(attrs[1])
+        pos2 = int(attrs[2])
+        piece = bisect_right(breakpoints, pos1)
+        if piece < len(breakpoints) and pos2 > breakpoints[piece]:
+            continue
+        offset = breakpoints[piece - 1] if piece > 0 else 0
+        ofile.write(attrs[0] + "_" + str(piece + 1) + "\t" + str(pos1 - offset))
+        ofile.write("\t" + str(pos2 - offset) + "\t" + attrs[3] + "\n")
 
 ofile.close()
-# write fasta file
-ofasta = open(sys.argv[4] + "/asm.cleaned.fasta", "w")
-for seq in contig2newseq:
-    contig_seq = contig2newseq[seq]
-    chunks = [contig_seq[i : i + 80] for i in range(0, len(contig_seq), 80)]
-    ofasta.write(">" + seq + "\n")
-    for chunk in chunks:
-        ofasta.write(chunk + "\n")
 
-ofasta.close()
+# write fasta file and lengths in the same pass, sequences are streamed by chunks
+ofasta = open(sys.argv[4] + "/asm.cleaned.fasta", "wb")
+olens = open(sys.argv[4] + "/scaffold_length_iteration_1", "w", WRITE_BUFFER)
+writer = sequ.FastaWriter(ofasta)
+for contig in input_seqs:
+    length = input_seqs.length(contig)
+    breakpoints = contig2breakpoints.get(contig)
+    if breakpoints is None:
+        pieces = [(contig, 0, length)]
+    else:
+        ends = [0] + breakpoints + [length]
+        pieces = [
+            (contig + "_" + str(i + 1), ends[i], ends[i + 1])
+            for i in range(len(ends) - 1)
+        ]
 
-# write lengths
-olens = open(sys.argv[4] + "/scaffold_length_iteration_1", "w")
-for seq in contig2newseq:
-    olens.write(seq + "\t" + str(len(contig2newseq[seq])) + "\n")
+    for name, start, end in pieces:
+        writer.start(name)
+        for chunk in input_seqs.stream(contig, start, end):
+            writer.write(chunk)
+        olens.write(name + "\t" + str(end - start) + "\n")
 
+writer.end()
+ofasta.close()
 olens.close()
@@ -8,36 +8,274 @@
 #include <getopt.h>
 #include <vector>
 #include <unordered_map>
+#include <cstdint>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
 
-#include <boost/config.hpp>
-
-#include <boost/graph/adjacency_list.hpp>
-#include <boost/graph/undirected_graph.hpp>
-#include <boost/graph/graph_traits.hpp>
-#include <boost/graph/connected_components.hpp>
-#include <boost/graph/iteration_macros.hpp>
-#include <boost/graph/dijkstra_shortest_paths.hpp>
+#include <sstream>
+#include <climits>
 
 using namespace std;
 
-typedef float Weight;
-typedef boost::property<boost::edge_weight_t, Weight> WeightProperty;
-typedef boost::property<boost::vertex_name_t, std::string> NameProperty;
+// Number of distances kept by the distance oracle, the cache is cleared above it
+const size_t CACHE_DISTANCES = 1 << 22;
+
+/*
+Oriented overlap graph of the assembly in compressed sparse row form : the
+successors of node i are targets[offsets[i]] to targets[offsets[i+1]-1]. The
+arrays are either built from the edges of a GFA file or mapped from a graph
+index.
+*/
+struct AssemblyGraph
+{
+	int n = 0;
+	long m = 0;
+	const int64_t *offsets = NULL;
+	const int32_t *targets = NULL;
+	// arrays of a graph which is not mapped from a graph index
+	vector<int64_t> own_offsets;
+	vector<int32_t> own_targets;
+
+	AssemblyGraph()
+	{
+	}
+
+	AssemblyGraph(int num_nodes, const vector<pair<int,int> > &edges)
+	{
+		own_offsets.assign(num_nodes + 1, 0);
+		for(size_t i = 0; i < edges.size(); i++)
+			own_offsets[edges[i].first + 1]++;
+		for(int i = 0; i < num_nodes; i++)
+			own_offsets[i + 1] += own_offsets[i];
+		own_targets.resize(edges.size());
+		vector<int64_t> next(own_offsets.begin(), own_offsets.end() - 1);
+		for(size_t i = 0; i < edges.size(); i++)
+			own_targets[next[edges[i].first]++] = edges[i].second;
+		view_own();
+	}
+
+	AssemblyGraph(int num_nodes, long num_edges, const int64_t *offsets, const int32_t *targets)
+		: n(num_nodes), m(num_edges), offsets(offsets), targets(targets)
+	{
+	}
+
+	// the arrays of an owned graph move with it, but a copy would point to
+	// the arrays of the original
+	AssemblyGraph(const AssemblyGraph &) = delete;
+	AssemblyGraph(AssemblyGraph &&) = default;
+
+	// Graph with every edge reversed, the predecessors of each node are its
+	// successors there
+	AssemblyGraph reversed() const
+	{
+		AssemblyGraph r;
+		r.own_offsets.assign(n + 1, 0);
+		for(long i = 0; i < m; i++)
+			r.own_offsets[targets[i] + 1]++;
+		for(int i = 0; i < n; i++)
+			r.own_offsets[i + 1] += r.own_offsets[i];
+		r.own_targets.resize(m);
+		vector<int64_t> next(r.own_offsets.begin(), r.own_offsets.end() - 1);
+		for(int u = 0; u < n; u++)
+		{
+			for(long i = offsets[u]; i < offsets[u + 1]; i++)
+				r.own_targets[next[targets[i]]++] = u;
+		}
+		r.view_own();
+		return r;
+	}
+
+	int num_vertices() const
+	{
+		return n;
+	}
+
+	long num_edges() const
+	{
+		return m;
+	}
+
+	bool has_edge(int u, int v) const
+	{
+		if(u < 0 || u >= num_vertices())
+			return false;
+		for(long i = offsets[u]; i < offsets[u + 1]; i++)
+		{
+			if(targets[i] == v)
+				return true;
+		}
+		return false;
+	}
+
+private:
+	void view_own()
+	{
+		n = own_offsets.size() - 1;
+		m = own_targets.size();
+		offsets = own_offsets.data();
+		targets = own_targets.data();
+	}
+};
+
+/*
+Graph index written by assembly_graph.py : a header with INDEX_MAGIC, the
+version, the number of segments n and of edges m, then the n segment lengths
+and the 2n+1 offsets as int64 and the m targets as int32, all little-endian.
+The segment names are in index + ".names", segment i has nodes 2i (FOW) and
+2i+1 (REV).
+*/
+const char INDEX_MAGIC[8] = {'S','A','L','S','A','G','F','A'};
+const int64_t INDEX_VERSION = 1;
+
+AssemblyGraph load_graph_index(string index, unordered_map<string,int> &unitig2id)
+{
+	int fd = open(index.c_str(), O_RDONLY);
+	struct stat st;
+	if(fd == -1 || fstat(fd, &st) == -1)
+	{
+		cerr<<"ERROR : Could not open "<<index<<endl;
+		exit(EXIT_FAILURE);
+	}
+	size_t size = st.st_size;
+	const char *data = NULL;
+	if(size > 0)
+	{
+		void *mapped = mmap(NULL, size, PROT_READ, MAP_SHARED, fd, 0);
+		if(mapped != MAP_FAILED)
+			data = (const char *) mapped;
+	}
+	close(fd);
+
+	int64_t header[3] = {0, 0, 0};
+	if(data != NULL && size >= 32)
+		memcpy(header, data + 8, sizeof(header));
+	long n = header[1];
+	long m = header[2];
+	if(data == NULL || size < 32 || memcmp(data, INDEX_MAGIC, 8) != 0 || header[0] != INDEX_VERSION
+		|| size < (size_t) (32 + 8 * (3 * n + 1) + 4 * m))
+	{
+		cerr<<"ERROR : "<<index<<" is not a graph index of this version"<<endl;
+		exit(EXIT_FAILURE);
+	}
 
-typedef boost::adjacency_list < boost::listS, boost::vecS, boost::directedS,NameProperty, WeightProperty > Graph;
+	ifstream names((index + ".names").c_str());
+	string name;
+	int id = 0;
+	while(getline(names, name))
+	{
+		unitig2id[name + ":FOW"] = id++;
+		unitig2id[name + ":REV"] = id++;
+	}
+	const int64_t *offsets = (const int64_t *) (data + 32 + 8 * n);
+	const int32_t *targets = (const int32_t *) (data + 32 + 8 * (3 * n + 1));
+	return AssemblyGraph(2 * n, m, offsets, targets);
+}
 
-typedef boost::graph_traits < Graph >::vertex_descriptor Vertex;
+/*
+Hop distances in the assembly graph, all edges weigh 1. Each query runs a
+breadth first search from the source and one from the target on the reverse
+graph, always extending the smaller frontier by one level, and stops at the
+level where they meet. The distances found from each source are kept.
+*/
+class DistanceOracle
+{
+	const AssemblyGraph &g;
+	AssemblyGraph reverse;
+	// nodes reached by each search, marked with the number of the query so
+	// that nothing is cleared between queries
+	vector<unsigned> seen[2];
+	vector<long> dist[2];
+	unsigned query = 0;
+	unordered_map<int,unordered_map<int,long> > known;
+	size_t cached = 0;
 
-typedef boost::property_map < Graph, boost::vertex_index_t >::type IndexMap;
-typedef boost::property_map < Graph, boost::vertex_name_t >::type NameMap;
+public:
+	DistanceOracle(const AssemblyGraph &graph)
+		: g(graph), reverse(graph.reversed())
+	{
+		for(int side = 0; side < 2; side++)
+		{
+			seen[side].assign(g.num_vertices(), 0);
+			dist[side].assign(g.num_vertices(), 0);
+		}
+	}
 
-typedef boost::iterator_property_map < Vertex*, IndexMap, Vertex, Vertex& > PredecessorMap;
-typedef boost::iterator_property_map < Weight*, IndexMap, Weight, Weight& > DistanceMap;
+	// Number of edges from source to target, -1 if there is no path
+	long distance(int source, int target)
+	{
+		unordered_map<int,long> &from = known[source];
+		auto it = from.find(target);
+		if(it != from.end())
+			return it->second;
+		if(cached >= CACHE_DISTANCES)
+		{
+			known.clear();
+			cached = 0;
+			return distance(source, target);
+		}
+		long d = search(source, target);
+		from[target] = d;
+		cached++;
+		return d;
+	}
 
-// typedef boost::property<boost::edge_weight_t, double> EdgeWeightProperty;
-// typedef boost::adjacency_list<boost::listS, boost::vecS,boost::bidirectionalS,boost::no_property,EdgeWeightProperty> Graph;
+private:
+	long search(int source, int target)
+	{
+		if(source == target)
+			return 0;
+		int n = g.num_vertices();
+		if(source < 0 || source >= n || target < 0 || target >= n)
+			return -1;
 
-// typedef boost::adjacency_list<boost::vecS, boost::vecS, boost::undirectedS> Graph;
+		query++;
+		vector<int> frontier[2];
+		long depth[2] = {0, 0};
+		int ends[2] = {source, target};
+		for(int side = 0; side < 2; side++)
+		{
+			seen[side][ends[side]] = query;
+			dist[side][ends[side]] = 0;
+			frontier[side].push_back(ends[side]);
+		}
+
+		while(!frontier[0].empty() && !frontier[1].empty())
+		{
+			int side = frontier[0].size() <= frontier[1].size() ? 0 : 1;
+			const AssemblyGraph &graph = side == 0 ? g : reverse;
+			long best = -1;
+			vector<int> next;
+			for(size_t j = 0; j < frontier[side].size(); j++)
+			{
+				int u = frontier[side][j];
+				for(long i = graph.offsets[u]; i < graph.offsets[u + 1]; i++)
+				{
+					int w = graph.targets[i];
+					if(seen[side][w] == query)
+						continue;
+					seen[side][w] = query;
+					dist[side][w] = depth[side] + 1;
+					next.push_back(w);
+					// the other search reached it already, the path is
+					// shortest once the whole level is done
+					if(seen[1 - side][w] == query)
+					{
+						long d = depth[side] + 1 + dist[1 - side][w];
+						if(best == -1 || d < best)
+							best = d;
+					}
+				}
+			}
+			if(best != -1)
+				return best;
+			depth[side]++;
+			frontier[side].swap(next);
+		}
+		return -1;
+	}
+};
 
 std::vector<std::string> split(std::string const & s, size_t count)
 {
@@ -59,56 +297,17 @@ char* getCharExpr(string s)
     return a;
 }
 
-void print_usage()
+// Graph of a GFA file, the ids of its nodes are added to unitig2id
+AssemblyGraph load_gfa(string gfa, unordered_map<string,int> &unitig2id)
 {
-	printf("Usage: misasm -g gfa -l hic_links\n");
-}
-
-int main(int argc, char* argv[])
-{
-	int option = 0;
-	string gfa="", hic_links="";
-	while((option = getopt(argc,argv,"g:l:")) != -1)
-	{
-		switch(option)
-		{
-			case 'l':
-			{
-				//cout<<optarg<<endl;
-				hic_links = optarg;
-				break;
-			}
-			case 'g':	
-			{
-				//cout<<optarg<<endl;
-				gfa = optarg;
-				break;
-			}
-			default:
-			{
-				//cout<<"here"<<endl;
-				print_usage();
-				exit(EXIT_FAILURE);
-			}
-		}	
-	}
-
-	if(gfa == "" || hic_links == "")
-	{
-		print_usage();
-		exit(EXIT_FAILURE);
-	}
-
-	unordered_map<string,int> unitig2id;
 	unordered_map<int,string> id2unitig;
 	int id = 0;
-	Graph g;
+	vector<pair<int,int> > oriented_edges;
 	string line;
 	ifstream edges(getCharExpr(gfa));
 	while(getline(edges,line))
 	{
 		string u,v,y,z,a,b;
-		double w = 1.0;
 		istringstream iss(line);
 		/*
 		S       tig00000042     *       LN:i:30165
@@ -169,14 +368,68 @@ int main(int argc, char* argv[])
 				v3 = contig2 + ":FOW";
 				v4 = contig1 + ":FOW";
 			}
-			boost::add_edge(unitig2id[v1],unitig2id[v2],w,g);
-			boost::add_edge(unitig2id[v3],unitig2id[v4],w,g);
+			oriented_edges.push_back(make_pair(unitig2id[v1],unitig2id[v2]));
+			oriented_edges.push_back(make_pair(unitig2id[v3],unitig2id[v4]));
 		}
 	}	
 	edges.close();
-	cerr<<"Done loading GFA file"<<endl;
-	cerr<<"Number of Nodes = "<<boost::num_vertices(g)<<endl;
-	cerr<<"Number of Edges = "<<boost::num_edges(g)<<endl;
+	return AssemblyGraph(id, oriented_edges);
+}
+
+void print_usage()
+{
+	printf("Usage: misasm -g gfa | -i graph_index -l hic_links\n");
+}
+
+int main(int argc, char* argv[])
+{
+	int option = 0;
+	string gfa="", index="", hic_links="";
+	while((option = getopt(argc,argv,"g:i:l:")) != -1)
+	{
+		switch(option)
+		{
+			case 'l':
+			{
+				//cout<<optarg<<endl;
+				hic_links = optarg;
+				break;
+			}
+			case 'g':	
+			{
+				//cout<<optarg<<endl;
+				gfa = optarg;
+				break;
+			}
+			case 'i':
+			{
+				index = optarg;
+				break;
+			}
+			default:
+			{
+				//cout<<"here"<<endl;
+				print_usage();
+				exit(EXIT_FAILURE);
+			}
+		}	
+	}
+
+	if((gfa == "" && index == "") || hic_links == "")
+	{
+		print_usage();
+		exit(EXIT_FAILURE);
+	}
+
+	// lines end with '\n' so that the output is not flushed at every link
+	ios::sync_with_stdio(false);
+
+	unordered_map<string,int> unitig2id;
+	AssemblyGraph g = index != "" ? load_graph_index(index, unitig2id) : load_gfa(gfa, unitig2id);
+	DistanceOracle oracle(g);
+	cerr<<"Done loading assembly graph"<<endl;
+	cerr<<"Number of Nodes = "<<g.num_vertices()<<endl;
+	cerr<<"Number of Edges = "<<g.num_edges()<<endl;
 
 
 	/*
@@ -186,6 +439,7 @@ int main(int argc, char* argv[])
 	*/
 	
     unordered_map<string,bool> added;
+	string line;
 	ifstream hic(getCharExpr(hic_links));
 	while(getline(hic,line))
 	{
@@ -195,33 +449,19 @@ int main(int argc, char* argv[])
 		iss >> a >> b >> c >> d >> e >> f >> x >> h;
 		if(e < 1)
 		{
-			cout<<line<<endl;
+			cout<<line<<'\n';
             continue;
 		}
 		string u = a.substr(0,a.length()-2);
 		string v = b.substr(0,b.length()-2);
         if(unitig2id.find(u+":FOW") == unitig2id.end() && unitig2id.find(u+":REV") == unitig2id.end() && unitig2id.find(v+":FOW") == unitig2id.end() && unitig2id.find(v+":REV") == unitig2id.end())
         {
-            cout<<line<<endl;
+            cout<<line<<'\n';
             continue;
         }
-		// Create things for Dijkstra
-		std::vector<Vertex> predecessorsFOW(boost::num_vertices(g)); // To store parents
-		std::vector<Weight> distancesFOW(boost::num_vertices(g)); // To store distances
-
-		IndexMap indexMap = boost::get(boost::vertex_index, g);
-		PredecessorMap predecessorMapFOW(&predecessorsFOW[0], indexMap);
-		DistanceMap distanceMapFOW(&distancesFOW[0], indexMap);
-
-		boost::dijkstra_shortest_paths(g, unitig2id[u + ":FOW"], boost::distance_map(distanceMapFOW).predecessor_map(predecessorMapFOW));
-
-		std::vector<Vertex> predecessorsREV(boost::num_vertices(g)); // To store parents
-		std::vector<Weight> distancesREV(boost::num_vertices(g)); // To store distances
-
-		PredecessorMap predecessorMapREV(&predecessorsREV[0], indexMap);
-		DistanceMap distanceMapREV(&distancesREV[0], indexMap);
-
-		boost::dijkstra_shortest_paths(g, unitig2id[u + ":REV"], boost::distance_map(distanceMapREV).predecessor_map(predecessorMapREV));
+		// Distances are only searched for the orientations which need them
+		int sourceFOW = unitig2id[u + ":FOW"];
+		int sourceREV = unitig2id[u + ":REV"];
 
 		long minpath = -1;
 		string ori;
@@ -262,13 +502,13 @@ int main(int argc, char* argv[])
 			// cout<<boost::edge(unitig2id[v1],unitig2id[v2],g).second<<endl;
 			if(added.find(a) == added.end() && added.find(b) == added.end())
 			{
-				if(boost::edge(unitig2id[v1],unitig2id[v2],g).second)
+				if(g.has_edge(unitig2id[v1],unitig2id[v2]))
 				{
 					//cout<<line<<endl;
 					//cout<<"EDGE exists"<<endl;
                     added[u] = true;
 					added[v] = true;
-					cout<<u<<":"<<orientation[0]<<"\t"<<v<<":"<<orientation[1]<<"\t"<<c<<"\t"<<d<<"\t"<<e<<"\t"<<f<<"\t"<<x<<"\t"<<h<<endl;
+					cout<<u<<":"<<orientation[0]<<"\t"<<v<<":"<<orientation[1]<<"\t"<<c<<"\t"<<d<<"\t"<<e<<"\t"<<f<<"\t"<<x<<"\t"<<h<<'\n';
 					done = true;
 					printed = true;
                     break;
@@ -282,15 +522,15 @@ int main(int argc, char* argv[])
 					long path_len;
 					if(orientation == "BB" || orientation == "BE")
 					{
-						path_len = distanceMapREV[unitig2id[v2]];
+						path_len = oracle.distance(sourceREV, unitig2id[v2]);
 					    //cout<<"PATH LENGTH = "<<path_len<<endl;
                     }
 					else
 					{
-						path_len = distanceMapFOW[unitig2id[v2]];
+						path_len = oracle.distance(sourceFOW, unitig2id[v2]);
                         //cout<<"PATH LENGTH = "<<path_len<<endl;
 					}	
-					if(path_len < INT_MAX && path_len > INT_MIN)
+					if(path_len >= 0)
 					{
                         //cout<<"Path Length = "<<path_len<<endl;
                         inlimits=true;
@@ -327,7 +567,7 @@ int main(int argc, char* argv[])
 		{
 			//cout<<ratio<<"\t"<<minpath<<endl;
 			//cout<<"Where we found the paths in graph"<<endl;
-            cout<<u+":"+ori[0]<<'\t'<<v+":"+ori[1]<<'\t'<<c<<"\t"<<d<<"\t"<<e<<"\t"<<f<<"\t"<<x<<"\t"<<h<<endl;
+            cout<<u+":"+ori[0]<<'\t'<<v+":"+ori[1]<<'\t'<<c<<"\t"<<d<<"\t"<<e<<"\t"<<f<<"\t"<<x<<"\t"<<h<<'\n';
 		    //cout << line << endl;
 			added[a] = true;
             printed = true;
@@ -338,7 +578,7 @@ int main(int argc, char* argv[])
             //cout<<"here"<<endl;
 			if(!printed)
             {
-                cout<<line<<endl;
+                cout<<line<<'\n';
 			    added[a] = true;
 			    added[b] = true;
             }
@@ -0,0 +1,292 @@
+#ifndef COVERAGE_TRACK_H
+#define COVERAGE_TRACK_H
+
+#include <iostream>
+#include <fstream>
+#include <string>
+#include <cstring>
+#include <cstdint>
+#include <cstdlib>
+#include <vector>
+#include <algorithm>
+#include <unordered_map>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+
+/*
+Spanning coverage of the sequences sampled every bin_size bases, the format of
+coverage_track.py. A track file starts with a header of magic, version,
+bin_size, sequences, samples, points and names_bytes, then holds the sequence
+lengths, the first sample of each sequence, the first point of each sequence,
+the point positions and their coverage, the samples as uint32 and the sequence
+names separated by newlines, little-endian.
+
+Sample i of a sequence is the exact coverage at base i * bin_size, a sequence
+of length L has L / bin_size + 1 samples. A region of at least bin_size bases
+always holds a sample and its ends are known to within bin_size - 1 bases. The
+points are positions where the exact coverage is also kept.
+*/
+
+const char TRACK_MAGIC[9] = "SALSACOV";
+const int64_t TRACK_VERSION = 2;
+const size_t TRACK_HEADER = 56;
+
+struct CoverageTrack
+{
+	long bin_size = 1;
+	std::vector<std::string> names;
+	std::unordered_map<std::string,long> ids;
+	const int64_t *lengths = NULL;
+	const int64_t *offsets = NULL;
+	const uint32_t *samples = NULL;
+	const int64_t *point_offsets = NULL;
+	const int64_t *point_positions = NULL;
+	const int64_t *point_coverage = NULL;
+	// arrays of a track which is not mapped from a file
+	std::vector<int64_t> own_lengths;
+	std::vector<int64_t> own_offsets;
+	std::vector<uint32_t> own_samples;
+	std::vector<int64_t> own_point_offsets;
+	std::vector<int64_t> own_point_positions;
+	std::vector<int64_t> own_point_coverage;
+
+	CoverageTrack()
+	{
+	}
+
+	// the arrays of an owned track move with it, but a copy would point to
+	// the arrays of the original
+	CoverageTrack(const CoverageTrack &) = delete;
+	CoverageTrack(CoverageTrack &&) = default;
+
+	bool contains(const std::string &name) const
+	{
+		return ids.find(name) != ids.end();
+	}
+
+	// Samples of a sequence and their number
+	const uint32_t *track(const std::string &name, long &count) const
+	{
+		long id = ids.at(name);
+		count = offsets[id + 1] - offsets[id];
+		return samples + offsets[id];
+	}
+
+	// Index of the first sample at or after base pos
+	long first_sample(long pos) const
+	{
+		return (pos + bin_size - 1) / bin_size;
+	}
+
+	// Exact coverage at base pos, from the points of the sequence or from
+	// its samples
+	long point(const std::string &name, long pos) const
+	{
+		long id = ids.at(name);
+		const int64_t *first = point_positions + point_offsets[id];
+		const int64_t *last = point_positions + point_offsets[id + 1];
+		const int64_t *found = std::lower_bound(first, last, (int64_t) pos);
+		if(found != last && *found == pos)
+			return point_coverage[found - point_positions];
+		if(pos % bin_size == 0 && pos >= 0 && pos <= lengths[id])
+			return samples[offsets[id] + pos / bin_size];
+		std::cerr<<"ERROR : No coverage at "<<name<<":"<<pos<<std::endl;
+		exit(EXIT_FAILURE);
+	}
+};
+
+/*
+Sums the spans added for each sequence in a difference array of one entry per
+sample, memory is that of the samples. The points of a sequence, from -1 to
+its length, are added before its spans.
+*/
+class CoverageBuilder
+{
+	long bin_size;
+	std::vector<std::string> names;
+	std::unordered_map<std::string,long> ids;
+	std::vector<int64_t> lengths;
+	std::vector<std::vector<int32_t> > delta;
+	std::vector<std::vector<int64_t> > points;
+	std::vector<std::vector<int32_t> > point_delta;
+
+public:
+	CoverageBuilder(long bin_size) : bin_size(bin_size)
+	{
+	}
+
+	void add_sequence(const std::string &name, long length)
+	{
+		if(ids.find(name) != ids.end())
+			return;
+		ids[name] = names.size();
+		names.push_back(name);
+		lengths.push_back(length);
+		delta.push_back(std::vector<int32_t>(length / bin_size + 2, 0));
+		points.push_back(std::vector<int64_t>());
+		point_delta.push_back(std::vector<int32_t>(1, 0));
+	}
+
+	void add_point(const std::string &name, long pos)
+	{
+		long id = ids.at(name);
+		std::vector<int64_t> &p = points[id];
+		std::vector<int64_t>::iterator found = std::lower_bound(p.begin(), p.end(), (int64_t) pos);
+		if(found != p.end() && *found == pos)
+			return;
+		p.insert(found, pos);
+		point_delta[id].push_back(0);
+	}
+
+	bool contains(const std::string &name) const
+	{
+		return ids.find(name) != ids.end();
+	}
+
+	// A span covers the samples from the first at or after start to the last
+	// at or before end
+	void add_span(const std::string &name, long start, long end)
+	{
+		long id = ids.at(name);
+		std::vector<int64_t> &p = points[id];
+		if(!p.empty())
+		{
+			point_delta[id][std::lower_bound(p.begin(), p.end(), (int64_t) start) - p.begin()] += 1;
+			point_delta[id][std::upper_bound(p.begin(), p.end(), (int64_t) end) - p.begin()] -= 1;
+		}
+
+		std::vector<int32_t> &d = delta[id];
+		long first = (start + bin_size - 1) / bin_size;
+		long last = end / bin_size + 1;
+		if(first >= last || first >= (long) d.size())
+			return;
+		d[first] += 1;
+		d[std::min(last, (long) d.size() - 1)] -= 1;
+	}
+
+	CoverageTrack finish()
+	{
+		CoverageTrack t;
+		t.bin_size = bin_size;
+		t.names = names;
+		t.ids = ids;
+		t.own_lengths = lengths;
+		t.own_offsets.assign(1, 0);
+		t.own_point_offsets.assign(1, 0);
+		long total = 0;
+		for(size_t i = 0; i < names.size(); i++)
+			total += lengths[i] / bin_size + 1;
+		t.own_samples.reserve(total);
+		for(size_t i = 0; i < names.size(); i++)
+		{
+			long count = lengths[i] / bin_size + 1;
+			int64_t cov = 0;
+			for(long j = 0; j < count; j++)
+			{
+				cov += delta[i][j];
+				t.own_samples.push_back(cov);
+			}
+			t.own_offsets.push_back(t.own_samples.size());
+			std::vector<int32_t>().swap(delta[i]);
+
+			cov = 0;
+			for(size_t j = 0; j < points[i].size(); j++)
+			{
+				cov += point_delta[i][j];
+				t.own_point_positions.push_back(points[i][j]);
+				t.own_point_coverage.push_back(cov);
+			}
+			t.own_point_offsets.push_back(t.own_point_positions.size());
+		}
+		t.lengths = t.own_lengths.data();
+		t.offsets = t.own_offsets.data();
+		t.samples = t.own_samples.data();
+		t.point_offsets = t.own_point_offsets.data();
+		t.point_positions = t.own_point_positions.data();
+		t.point_coverage = t.own_point_coverage.data();
+		return t;
+	}
+};
+
+inline void write_track(const std::string &file, const CoverageTrack &t)
+{
+	std::string names;
+	for(size_t i = 0; i < t.names.size(); i++)
+		names += t.names[i] + "\n";
+	long s = t.names.size();
+	int64_t p = t.point_offsets[s];
+	int64_t header[6] = {TRACK_VERSION, t.bin_size, s, t.offsets[s], p, (int64_t) names.size()};
+
+	std::ofstream out(file.c_str(), std::ios::binary);
+	out.write(TRACK_MAGIC, 8);
+	out.write((const char *) header, sizeof(header));
+	out.write((const char *) t.lengths, 8 * s);
+	out.write((const char *) t.offsets, 8 * (s + 1));
+	out.write((const char *) t.point_offsets, 8 * (s + 1));
+	out.write((const char *) t.point_positions, 8 * p);
+	out.write((const char *) t.point_coverage, 8 * p);
+	out.write((const char *) t.samples, 4 * t.offsets[s]);
+	out.write(names.data(), names.size());
+	if(!out)
+	{
+		std::cerr<<"ERROR : Could not write "<<file<<std::endl;
+		exit(EXIT_FAILURE);
+	}
+}
+
+inline CoverageTrack load_track(const std::string &file)
+{
+	int fd = open(file.c_str(), O_RDONLY);
+	struct stat st;
+	if(fd == -1 || fstat(fd, &st) == -1)
+	{
+		std::cerr<<"ERROR : Could not open "<<file<<std::endl;
+		exit(EXIT_FAILURE);
+	}
+	size_t size = st.st_size;
+	const char *data = NULL;
+	if(size > 0)
+	{
+		void *mapped = mmap(NULL, size, PROT_READ, MAP_SHARED, fd, 0);
+		if(mapped != MAP_FAILED)
+			data = (const char *) mapped;
+	}
+	close(fd);
+
+	int64_t header[6] = {0, 0, 0, 0, 0, 0};
+	if(data != NULL && size >= TRACK_HEADER)
+		memcpy(header, data + 8, sizeof(header));
+	long s = header[2];
+	long n = header[3];
+	long p = header[4];
+	size_t samples_start = TRACK_HEADER + 8 * (3 * s + 2 + 2 * p);
+	size_t names_start = samples_start + 4 * n;
+	if(data == NULL || size < TRACK_HEADER || memcmp(data, TRACK_MAGIC, 8) != 0
+		|| header[0] != TRACK_VERSION || size < names_start + header[5])
+	{
+		std::cerr<<"ERROR : "<<file<<" is not a coverage track of this version"<<std::endl;
+		exit(EXIT_FAILURE);
+	}
+
+	CoverageTrack t;
+	t.bin_size = header[1];
+	t.lengths = (const int64_t *) (data + TRACK_HEADER);
+	t.offsets = (const int64_t *) (data + TRACK_HEADER + 8 * s);
+	t.point_offsets = (const int64_t *) (data + TRACK_HEADER + 8 * (2 * s + 1));
+	t.point_positions = (const int64_t *) (data + TRACK_HEADER + 8 * (3 * s + 2));
+	t.point_coverage = t.point_positions + p;
+	t.samples = (const uint32_t *) (data + samples_start);
+	const char *name = data + names_start;
+	for(long i = 0; i < s; i++)
+	{
+		const char *eol = (const char *) memchr(name, '\n', data + size - name);
+		t.ids[std::string(name, eol - name)] = i;
+		t.names.push_back(std::string(name, eol - name));
+		name = eol + 1;
+	}
+	return t;
+}
+
+#endif
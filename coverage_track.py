@@ -0,0 +1,273 @@
+# ======================================================================#
+# Coverage tracks : spanning coverage of the sequences sampled every
+# bin_size bases, shared with break_contigs and break_contigs_start
+# ======================================================================#
+
+import sys
+import numpy as np
+
+# ======================================================================#
+#                                ARGUMENTS
+# ======================================================================#
+
+# track_file : coverage track written by save_track, or with -w by the C++
+#              tools, which read it with -c
+# span : bases covered by a read pair, from the start of one alignment to the
+#        end of the other, the builder of a track chooses which pairs count
+# bin_size : distance between two samples, sample i of a sequence is the exact
+#            coverage at base i * bin_size and a sequence of length L has
+#            L // bin_size + 1 samples
+# points : positions of a sequence where the builder of a track also keeps the
+#          exact coverage, whatever the bin size
+#
+# Accuracy : no sample is approximated, only the bases between two samples are
+# not seen. A region of at least bin_size bases always holds a sample and its
+# ends are known to within bin_size - 1 bases, a narrower region can be missed.
+# Memory and time scale with the genome size divided by bin_size.
+
+# A track file starts with this header, then holds the sequence lengths, the
+# first sample of each sequence, the first point of each sequence, the point
+# positions and their coverage, the samples and the sequence names separated
+# by newlines, as little-endian arrays
+TRACK_MAGIC = b"SALSACOV"
+TRACK_VERSION = 2
+TRACK_HEADER = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<i8"),
+        ("bin_size", "<i8"),
+        ("sequences", "<i8"),
+        ("samples", "<i8"),
+        ("points", "<i8"),
+        ("names_bytes", "<i8"),
+    ]
+)
+
+BIN_SIZE = 1000
+
+# ======================================================================#
+#                                MODULES
+# ======================================================================#
+
+
+class CoverageTrack:
+    """
+    Samples of the coverage of each sequence, the samples of sequence i are
+    samples[offsets[i]:offsets[i + 1]] and its points are those from
+    point_offsets[i] to point_offsets[i + 1].
+    """
+
+    def __init__(
+        self,
+        names,
+        lengths,
+        offsets,
+        samples,
+        bin_size,
+        point_offsets,
+        point_positions,
+        point_coverage,
+    ):
+        self.names = names
+        self.ids = {name: i for i, name in enumerate(names)}
+        self.lengths = lengths
+        self.offsets = offsets
+        self.samples = samples
+        self.bin_size = bin_size
+        self.point_offsets = point_offsets
+        self.point_positions = point_positions
+        self.point_coverage = point_coverage
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def first_sample(self, pos):
+        """
+        Index of the first sample at or after base pos.
+        """
+        return -(-pos // self.bin_size)
+
+    def track(self, name):
+        i = self.ids[name]
+        return self.samples[self.offsets[i] : self.offsets[i + 1]]
+
+    def point(self, name, pos):
+        """
+        Exact coverage at base pos, from the points of the sequence or from
+        its samples.
+        """
+        i = self.ids[name]
+        first, last = self.point_offsets[i], self.point_offsets[i + 1]
+        k = first + np.searchsorted(self.point_positions[first:last], pos)
+        if k < last and self.point_positions[k] == pos:
+            return int(self.point_coverage[k])
+        if pos % self.bin_size == 0 and 0 <= pos <= self.lengths[i]:
+            return int(self.track(name)[pos // self.bin_size])
+        raise KeyError("No coverage at " + name + ":" + str(pos))
+
+    def window(self, name, start, end):
+        """
+        Index of the first sample at or after start and the samples from
+        there up to end.
+        """
+        samples = self.track(name)
+        first = self.first_sample(start)
+        return first, samples[first : self.first_sample(end)]
+
+
+class TrackBuilder:
+    """
+    Coverage of the spans added to a set of sequences, kept as one difference
+    array of int64 until finish. The points are given by the index of their
+    sequence and their position, from -1 to the sequence length.
+    """
+
+    def __init__(self, names, lengths, bin_size=BIN_SIZE, points=()):
+        self.names = list(names)
+        self.bin_size = bin_size
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.base = np.zeros(len(self.names) + 1, dtype=np.int64)
+        np.cumsum(self.lengths // bin_size + 2, out=self.base[1:])
+        self.delta = np.zeros(self.base[-1], dtype=np.int64)
+
+        # points in the coordinates of the sequences laid end to end, sorted
+        self.point_base = np.zeros(len(self.names) + 1, dtype=np.int64)
+        np.cumsum(self.lengths + 2, out=self.point_base[1:])
+        points = np.array(sorted(set(points)), dtype=np.int64).reshape(-1, 2)
+        self.point_sequences = points[:, 0]
+        self.point_positions = points[:, 1]
+        self.point_keys = self.point_base[points[:, 0]] + points[:, 1]
+        self.point_delta = np.zeros(len(points) + 1, dtype=np.int64)
+
+    def add_spans(self, sequences, starts, ends):
+        """
+        Add spans given by the index of their sequence, their first and last
+        base. A span covers the samples from the first at or after its start
+        to the last at or before its end, and the points between them.
+        """
+        sequences = np.asarray(sequences)
+        base = self.point_base[sequences]
+        first = np.searchsorted(self.point_keys, base + starts, "left")
+        last = np.searchsorted(self.point_keys, base + ends, "right")
+        n = len(self.point_delta)
+        self.point_delta += np.bincount(first, minlength=n)[:n]
+        self.point_delta -= np.bincount(last, minlength=n)[:n]
+
+        first = -(-np.asarray(starts) // self.bin_size)
+        last = np.asarray(ends) // self.bin_size + 1
+        size = self.lengths[sequences] // self.bin_size + 1
+        keep = (first < last) & (first < size)
+        base = self.base[sequences][keep]
+        first = base + first[keep]
+        last = base + np.minimum(last[keep], size[keep])
+        n = len(self.delta)
+        self.delta += np.bincount(first, minlength=n)[:n]
+        self.delta -= np.bincount(last, minlength=n)[:n]
+        return len(first)
+
+    def finish(self):
+        """
+        Track of the spans added.
+        """
+        # the last entry of each sequence only ends the spans reaching its end
+        keep = np.ones(len(self.delta), dtype=bool)
+        keep[self.base[1:] - 1] = False
+        samples = np.cumsum(self.delta)[keep].astype(np.uint32)
+        offsets = self.base - np.arange(len(self.names) + 1)
+        point_offsets = np.searchsorted(
+            self.point_sequences, np.arange(len(self.names) + 1)
+        )
+        return CoverageTrack(
+            self.names,
+            self.lengths,
+            offsets,
+            samples,
+            self.bin_size,
+            point_offsets,
+            self.point_positions,
+            np.cumsum(self.point_delta[:-1]),
+        )
+
+
+# SAVE_TRACK
+# input :
+#   track_file : path of the track to write
+#   track : CoverageTrack
+# output :
+#   number of samples written
+def save_track(track_file, track):
+    names = "".join(name + "\n" for name in track.names).encode()
+    header = np.zeros(1, dtype=TRACK_HEADER)
+    header["magic"] = TRACK_MAGIC
+    header["version"] = TRACK_VERSION
+    header["bin_size"] = track.bin_size
+    header["sequences"] = len(track.names)
+    header["samples"] = len(track.samples)
+    header["points"] = len(track.point_positions)
+    header["names_bytes"] = len(names)
+
+    with open(track_file, "wb") as f:
+        header.tofile(f)
+        np.asarray(track.lengths, dtype="<i8").tofile(f)
+        np.asarray(track.offsets, dtype="<i8").tofile(f)
+        np.asarray(track.point_offsets, dtype="<i8").tofile(f)
+        np.asarray(track.point_positions, dtype="<i8").tofile(f)
+        np.asarray(track.point_coverage, dtype="<i8").tofile(f)
+        np.asarray(track.samples, dtype="<u4").tofile(f)
+        f.write(names)
+    return len(track.samples)
+
+
+# LOAD_TRACK
+# input :
+#   track_file : track written by save_track or by the C++ tools
+# output :
+#   CoverageTrack with memory-mapped samples
+def load_track(track_file):
+    header = np.fromfile(track_file, dtype=TRACK_HEADER, count=1)
+    if (
+        len(header) == 0
+        or header["magic"][0] != TRACK_MAGIC
+        or header["version"][0] != TRACK_VERSION
+    ):
+        print("ERROR : " + track_file + " is not a coverage track of this version")
+        sys.exit(1)
+    s = int(header["sequences"][0])
+    n = int(header["samples"][0])
+    p = int(header["points"][0])
+
+    start = TRACK_HEADER.itemsize
+    lengths = np.fromfile(track_file, dtype="<i8", count=s, offset=start)
+    start += 8 * s
+    offsets = np.fromfile(track_file, dtype="<i8", count=s + 1, offset=start)
+    start += 8 * (s + 1)
+    point_offsets = np.fromfile(track_file, dtype="<i8", count=s + 1, offset=start)
+    start += 8 * (s + 1)
+    point_positions = np.fromfile(track_file, dtype="<i8", count=p, offset=start)
+    start += 8 * p
+    point_coverage = np.fromfile(track_file, dtype="<i8", count=p, offset=start)
+    start += 8 * p
+    if n == 0:
+        samples = np.zeros(0, dtype="<u4")
+    else:
+        samples = np.memmap(track_file, dtype="<u4", mode="r", offset=start, shape=(n,))
+    start += 4 * n
+    with open(track_file, "rb") as f:
+        f.seek(start)
+        names = f.read(int(header["names_bytes"][0])).decode().split("\n")
+    return CoverageTrack(
+        names[:s],
+        lengths,
+        offsets,
+        samples,
+        int(header["bin_size"][0]),
+        point_offsets,
+        point_positions,
+        point_coverage,
+    )
@@ -1,12 +1,19 @@
 # ======================================================================#
 # Digest genome
-# Last edition : 2019/02/26
+# Last edition : 2026/10/18
 # ======================================================================#
 
+import re
+import sys
+from collections import deque
+from multiprocessing import Pool
 import numpy as np
 import Bio
 from Bio import SeqIO
 from Bio import Restriction
+from Bio.Seq import Seq
+import seq_utils as sequ
+import telemetry
 
 # ======================================================================#
 #                                ARGUMENTS
@@ -15,6 +22,16 @@ from Bio import Restriction
 # assembly : assembled contigs
 # enzyme : restriction enzyme(s)
 # outname : path to output file
+# workers : number of processes
+# engine : "scanner" for the built-in cut-site scanner, "biopython" to search
+#          sites with Bio.Restriction
+
+# Bit of each base in the site masks of the scanner, other letters only match
+# the positions of a site where any letter is allowed
+BASE_BITS = np.zeros(256, dtype=np.uint8)
+for base, bit in zip(b"ACGT", [1, 2, 4, 8]):
+    BASE_BITS[base] = bit
+    BASE_BITS[base + 32] = bit
 
 # ======================================================================#
 #                                MODULES
@@ -33,79 +50,261 @@ def parse_enzyme_input(enzyme_input: str):
     return enzyme_list
 
 
-# FIND_RESTRICTION_SITES
+# RESOLVE_ENZYMES
 # input :
-# 	fasta_file : fasta file of genome to digest
-# 	enz_list : list of enzymes to use for digestion
+#    enzyme_list : list of enzyme names or recognition sites (e.g. GATC)
 # output :
-# 	restrict_dict : dictionnary with length and cutting sites for each sequence
-#                   of your genome after digestion by the restriction enzyme
-def find_restriction_sites(fasta_file, enzyme_list: list) -> dict:
+#    list of enzyme names known to Bio.Restriction
+def resolve_enzymes(enzyme_list: list) -> list:
     """
-    Find the restriction sites of one or several enzyme in a sequence.
+    Replace recognition sites by an enzyme cutting them, commercially
+    available ones being preferred.
     """
-    # Create Restriction enzyme object
-    enzymes = Restriction.RestrictionBatch(enzyme_list)
+    names = []
+    for enzyme in enzyme_list:
+        if enzyme in Restriction.AllEnzymes:
+            names.append(enzyme)
+            continue
+        matches = sorted(
+            [e for e in Restriction.AllEnzymes if e.site == enzyme.upper()],
+            key=lambda e: (not e.is_comm(), str(e)),
+        )
+        if not matches:
+            print("ERROR : Unknown restriction enzyme or site " + enzyme)
+            sys.exit(1)
+        names.append(str(matches[0]))
+    return names
 
-    # Load fasta file
-    seq_data = SeqIO.parse(fasta_file, "fasta")
 
-    restrict_dict = {}
+# COUNT_CUT_SITES
+# input :
+#   record : (name, sequence) of one sequence of the genome
+#   enzyme_list : list of enzyme names
+# output :
+#   name, number of cutting sites on the left half, on the right half
+def count_cut_sites(record, enzyme_list: list):
+    """
+    Count the restriction sites on each half of a sequence. Cut positions
+    are only kept for the sequence at hand.
+    """
+    name, seq = record
+    enzymes = _batch(enzyme_list)
 
-    for record in seq_data:
-        rest_sites_dict = enzymes.search(record.seq)
-        pos = []
-        for enz in enzymes:
-            pos.extend(rest_sites_dict[enz])
-        restrict_dict[record.id] = [len(record.seq), list(np.unique(sorted(pos)))]
+    rest_sites_dict = enzymes.search(Seq(seq))
+    pos = []
+    for enz in enzymes:
+        pos.extend(rest_sites_dict[enz])
+    pos = np.unique(pos)
 
-    return restrict_dict
+    left = int(np.count_nonzero(pos < len(seq) / 2))
+    return name, left, len(pos) - left
 
 
-# COUNT_CUT_SITES
+_batches = {}
+
+
+def _batch(enzyme_list):
+    """
+    Restriction batch of a list of enzymes, built once per process.
+    """
+    key = tuple(enzyme_list)
+    if key not in _batches:
+        _batches[key] = Restriction.RestrictionBatch(enzyme_list)
+    return _batches[key]
+
+
+# CAN_SCAN
+# input :
+#   enzyme_list : list of enzyme names
+# output :
+#   True if the built-in scanner can find the cuts of all the enzymes
+def can_scan(enzyme_list: list) -> bool:
+    """
+    The scanner handles enzymes cutting once at a known position.
+    """
+    enzymes = [Restriction.AllEnzymes.get(name) for name in enzyme_list]
+    return all(e.cut_once() and not e.is_unknown() for e in enzymes)
+
+
+# COMPILE_SCANNER
 # input :
-#   restrict_dict : dictionnary of cutting sites for each sequence fragments of
-#                   your genome after digestion by the restriction enzyme
+#   enzyme_list : list of enzyme names
 # output :
-#   count_dict : dictionnary of counts of cutting sites for each half of a sequence
-def count_cut_sites(restrict_dict: dict) -> dict:
+#   list of (masks, cut offset, overhang, forward) for each strand of each
+#   enzyme, masks holding the bases allowed at each position of the site and
+#   forward the index of the forward strand of a reverse site (-1 otherwise)
+def compile_scanner(enzyme_list: list) -> list:
     """
-    Count the number of restriction sites on each half of a sequence.
+    Compile the recognition sites of the enzymes into base masks. Masks are
+    read from the patterns of Bio.Restriction so that degenerate bases match
+    the same sequence letters.
     """
-    count_cut_sites = {}
+    scanner = []
+    for name in dict.fromkeys(enzyme_list):
+        e = Restriction.AllEnzymes.get(name)
+        sites = re.findall(r"\(\?P<\w+>([^)]*)\)", e.compsite.pattern)
+
+        # Cuts are computed from the 1-based start of the site, like _modify
+        # and _rev_modify of Bio.Restriction
+        scanner.append((_site_masks(sites[0]), e.fst5, e.ovhg, -1))
+        if not e.is_palindromic():
+            forward = len(scanner) - 1
+            scanner.append((_site_masks(sites[1]), -e.fst3, e.ovhg, forward))
 
-    for contig in restrict_dict.keys():
+    return scanner
 
-        mid = restrict_dict[contig][0] / 2
-        count_cut_sites[contig] = [0, 0]
 
-        for cut in restrict_dict[contig][1]:
+def _site_masks(pattern):
+    """
+    Bases allowed at each position of a site pattern, 0 for any letter.
+    """
+    masks = []
+    for token in re.findall(r"\[[ACGT]+\]|[ACGT.]", pattern):
+        masks.append(int(np.bitwise_or.reduce(BASE_BITS[list(token.encode())])))
+    return np.array(masks, dtype=np.uint8)
+
+
+# SCAN_CUT_SITES
+# input :
+#   seq : sequence, as bytes
+#   scanner : list returned by compile_scanner
+# output :
+#   array of sorted distinct cut positions, as returned by
+#   RestrictionBatch.search on a linear sequence
+def scan_cut_sites(seq: bytes, scanner: list):
+    """
+    Find the cut positions of all the enzymes, testing each position of a
+    site on the whole sequence at once.
+    """
+    bits = BASE_BITS[np.frombuffer(seq, dtype=np.uint8)]
+    length = len(bits)
+
+    hits = []
+    cuts = [np.zeros(0, dtype=np.int64)]
+    for masks, offset, ovhg, forward in scanner:
+        last = max(length - len(masks) + 1, 0)
+        hit = np.ones(last, dtype=bool)
+        for j, mask in enumerate(masks.tolist()):
+            if mask:
+                hit &= (bits[j : j + last] & mask) != 0
+        # A reverse site only counts where the forward one does not match
+        if forward >= 0:
+            hit &= ~hits[forward]
+        hits.append(hit)
 
-            if cut < mid:
-                count_cut_sites[contig][0] += 1
-            else:
-                count_cut_sites[contig][1] += 1
+        cut = np.flatnonzero(hit) + 1 + offset
+        # Cuts outside of a linear sequence are dropped, as _drop does
+        keep = (1 < cut) & (cut <= length) & (1 < cut - ovhg) & (cut - ovhg <= length)
+        cuts.append(cut[keep])
 
-    return count_cut_sites
+    return np.unique(np.concatenate(cuts))
+
+
+# SCAN_RECORD
+# input :
+#   span : (name, start, end) of a record in the fasta file
+#   fasta_file : fasta file of genome to digest
+#   enzyme_list : list of enzyme names
+# output :
+#   name, number of cutting sites on the left half, on the right half
+def scan_record(span, fasta_file, enzyme_list: list):
+    """
+    Count the restriction sites on each half of a sequence with the scanner.
+    """
+    name, start, end = span
+    seq = sequ.span_sequence(_fasta_map(fasta_file), start, end)
+    pos = scan_cut_sites(seq, _scanner(enzyme_list))
+
+    left = int(np.count_nonzero(pos < len(seq) / 2))
+    return name, left, len(pos) - left
+
+
+_scanners = {}
+_maps = {}
+
+
+def _scanner(enzyme_list):
+    """
+    Scanner of a list of enzymes, compiled once per process.
+    """
+    key = tuple(enzyme_list)
+    if key not in _scanners:
+        _scanners[key] = compile_scanner(enzyme_list)
+    return _scanners[key]
+
+
+def _fasta_map(fasta_file):
+    """
+    Fasta file mapped once per process.
+    """
+    if fasta_file not in _maps:
+        _maps[fasta_file] = sequ.map_fasta(fasta_file)
+    return _maps[fasta_file]
+
+
+# DIGEST_GENOME
+# input :
+#   fasta_file : fasta file of genome to digest
+#   enzyme_list : list of enzyme names
+#   workers : number of processes
+#   engine : "scanner" or "biopython"
+# output :
+#   generator of (name, left count, right count) in the order of the fasta file
+def digest_genome(fasta_file, enzyme_list: list, workers=1, engine="scanner"):
+    """
+    Stream the sequences of a genome through a pool of processes. Only a few
+    sequences per worker are in flight, whatever the size of the genome.
+    Enzymes the scanner cannot handle are searched with Bio.Restriction.
+    """
+    if engine == "scanner" and can_scan(enzyme_list):
+        # Workers read the sequences from the mapped file themselves
+        func = scan_record
+        tasks = (
+            (span, fasta_file, enzyme_list)
+            for span in sequ.fasta_spans(_fasta_map(fasta_file))
+        )
+    else:
+        func = count_cut_sites
+        tasks = (
+            ((record.id, str(record.seq)), enzyme_list)
+            for record in SeqIO.parse(fasta_file, "fasta")
+        )
+
+    if workers <= 1:
+        for task in tasks:
+            yield func(*task)
+        return
+
+    # the usage of the workers is added to the stage reading the counts
+    with Pool(workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(telemetry.measured_task, (func,) + task))
+            if len(pending) >= 2 * workers:
+                result, usage = pending.popleft().get()
+                telemetry.add_worker_usage(usage)
+                yield result
+        while pending:
+            result, usage = pending.popleft().get()
+            telemetry.add_worker_usage(usage)
+            yield result
 
 
 # WRITE_COUNT_CUTS_FILE
 # input :
-#   count_dict : dictionnary of counts of cutting sites for each half of a sequence
+#   counts : iterable of (name, left count, right count)
 # 	outfile : path to output file
 # output :
 # 	output file written with number of cut sites on each half of each contig
-def write_count_cuts_file(count_dict: dict, outfile):
+def write_count_cuts_file(counts, outfile):
     """
 	Write number of restriction enzyme sites on each half of each sequence.
 	"""
     output = open(outfile, "w")
 
-    for seq in count_dict:
+    for seq, left, right in counts:
         short_name = seq.split(" ")[0]
-        output.write(
-            "{0}\t{1}\t{2}\n".format(short_name, count_dict[seq][0], count_dict[seq][1])
-        )
+        output.write("{0}\t{1}\t{2}\n".format(short_name, left, right))
 
     output.close()
 
@@ -117,23 +316,24 @@ def write_count_cuts_file(count_dict: dict, outfile):
 # GENERATE_DIGESTED_FRAGMENTS
 # input :
 # 	assembly : fasta file with genome
-# 	enzyme : string of comma separated enzymes
+# 	enzyme : string of comma separated enzymes or recognition sites
 # 	outname : path to output file
+#   workers : number of processes
+#   engine : "scanner" or "biopython"
 # output :
 # 	output file written with the number of cutting sites on each half of each sequence.
-def generate_digested_fragments(assembly, enzyme: str, outname):
+def generate_digested_fragments(
+    assembly, enzyme: str, outname, workers=1, engine="scanner"
+):
     """
 	Takes a genome and one or several enzymes to digest the genome,
 	and returns the digested fragments.
 	"""
     # Parse one or several enzymes given as input
-    enzymes_input = parse_enzyme_input(enzyme)
-
-    # Find restriction sites for all sequences
-    restrict_sites = find_restriction_sites(assembly, enzymes_input)
+    enzymes_input = resolve_enzymes(parse_enzyme_input(enzyme))
 
-    # Count restriction sites on each half of each contig
-    count_restrict_sites = count_cut_sites(restrict_sites)
+    # Count restriction sites on each half of each contig, one contig at a time
+    counts = digest_genome(assembly, enzymes_input, workers, engine)
 
     # Output file
-    write_count_cuts_file(count_restrict_sites, outname)
+    write_count_cuts_file(counts, outname)
@@ -1,6 +1,7 @@
-import networkx as nx
 import sys
 import argparse
+import numpy as np
+import telemetry
 
 # ======================================================================#
 #                                ARGUMENTS
@@ -10,140 +11,225 @@ import argparse
 #                                MODULES
 # ======================================================================#
 
+# Lines of the contig links file parsed at once
+CHUNK_LINES = 1 << 20
+
+
 # LOAD_CONTIG_LINKS
 # input :
-#
+#   filename : path to contig links file, with unique pairs of contig ends as
+#              written by make_links
 # output :
-#
+#   names : list of contig end names, indexed by contig end id
+#   node1, node2 : arrays of contig end ids of each link
+#   weights : array of link scores
+#   counts : array of number of Hi-C links of each link
 def load_contig_links(filename):
-    G = nx.Graph()
-
-    links = {}
-
-    # map for node to max edge weight for it
-    node2weight = {}
-
-    f = open(filename, "r")
-    for line in f:
-        line = line.strip().split()
-
-        key = line[0] + "$" + line[1]
-        links[key] = float(line[2])
-
-        # add first node to node2weight
-        if line[0] not in node2weight:
-            node2weight[line[0]] = float(line[2])
-        else:
-            if float(line[2]) >= node2weight[line[0]]:
-                node2weight[line[0]] = float(line[2])
-
-        # add second node to node2weight
-        if line[1] not in node2weight:
-            node2weight[line[1]] = float(line[2])
-        else:
-            if float(line[2]) >= node2weight[line[1]]:
-                node2weight[line[1]] = float(line[2])
-
-        # add nodes to graph
-        G.add_node(line[0])
-        G.add_node(line[1])
-
-        # add edge to graph
-        G.add_edge(
-            line[0],
-            line[1],
-            weight=float(line[2]),
-            isNeighbor="False",
-            isGood="False",
-            links=int(line[3]),
-        )
-    f.close()
-
-    return G, node2weight, links
-
-
-# GET_MAX_INCIDENT
+    ends = {}
+    node1 = []
+    node2 = []
+    weights = []
+    counts = []
+
+    with open(filename, "r") as f:
+        while True:
+            fields = "".join(f.readlines(CHUNK_LINES * 64)).split()
+            if not fields:
+                break
+            # new ends are numbered in order, then ends are looked up in C
+            for end in dict.fromkeys(fields[0::4] + fields[1::4]):
+                if end not in ends:
+                    ends[end] = len(ends)
+            node1.append(np.fromiter(map(ends.__getitem__, fields[0::4]), np.int64))
+            node2.append(np.fromiter(map(ends.__getitem__, fields[1::4]), np.int64))
+            weights.append(np.array(fields[2::4], dtype=float))
+            counts.append(np.array(fields[3::4], dtype=np.int64))
+
+    if not node1:
+        empty = np.zeros(0, dtype=np.int64)
+        return [], empty, empty, np.zeros(0), empty
+    return (
+        list(ends),
+        np.concatenate(node1),
+        np.concatenate(node2),
+        np.concatenate(weights),
+        np.concatenate(counts),
+    )
+
+
+# TOP_INCIDENT_WEIGHTS
 # input :
-#   start
-#   end
-#   G
+#   n : number of contig ends
+#   node1, node2 : arrays of contig end ids of each link
+#   weights : array of link scores
 # output :
-#   max
-def get_max_incident(start, end, G):
-    max = 0
-    try:
-        for e in G.successors(start):
-            if e != end and G[start][e]["weight"] > max:
-                max = G[start][e]["weight"]
-        for e in G.predecessors(start):
-            if e != end and G[e][start]["weight"] > max:
-                max = G[start][e]["weight"]
-    except:
-        for e in G.neighbors(start):
-            if e != end and G[start][e]["weight"] > max:
-                max = G[start][e]["weight"]
-
-    return max
-
-
-# GET_MAX_WEIGHT
+#   first, second : largest and second largest weight of the links incident
+#                   to each contig end, 0 when there are none
+def top_incident_weights(n, node1, node2, weights):
+    """
+    Segment maximum and second maximum of the link weights of each end.
+    """
+    # a link from an end to itself is only incident once
+    other = node1 != node2
+    nodes = np.concatenate((node1, node2[other]))
+    incident = np.concatenate((weights, weights[other]))
+
+    first = np.zeros(n)
+    np.maximum.at(first, nodes, incident)
+
+    # the second largest weight is the largest one again when it is reached
+    # by several links
+    top = incident == first[nodes]
+    second = np.zeros(n)
+    np.maximum.at(second, nodes[~top], incident[~top])
+    ties = np.bincount(nodes[top], minlength=n) > 1
+    second[ties] = first[ties]
+    return first, second
+
+
+# BEST_ALTERNATIVES
 # input :
-#   start
-#   end
-#   G
+#   n : number of contig ends
+#   node1, node2 : arrays of contig end ids of each link
+#   weights : array of link scores
 # output :
-#   max
-def get_max_weight(start, end, G):
-    return max(get_max_incident(start, end, G), get_max_incident(end, start, G))
+#   best score of the other links of the two ends of each link, 0 when there
+#   are none
+def best_alternatives(n, node1, node2, weights):
+    """
+    Largest weight incident to either end of each link, excluding the link.
+    """
+    first, second = top_incident_weights(n, node1, node2, weights)
+    # the link itself is the largest weight of an end unless another link
+    # is heavier, on ties the second largest is equal to it
+    alt1 = np.where(weights == first[node1], second[node1], first[node1])
+    alt2 = np.where(weights == first[node2], second[node2], first[node2])
+    return np.maximum(alt1, alt2)
 
 
 # PROCESS_LINKS
 # input :
-#   G
-#   node2weight
-#   links
-#   outfile
+#   names : list of contig end names
+#   node1, node2 : arrays of contig end ids of each link
+#   weights : array of link scores
+#   counts : array of number of Hi-C links of each link
+#   outfile : path of the scaled links
 # output :
-#   scaled scores written to outfile
-def process_links(G, node2weight, links, outfile):
+#   scaled scores written to outfile, by decreasing score, and as arrays to
+#   outfile + ".npz"
+def process_links(names, node1, node2, weights, counts, outfile):
+
+    best = best_alternatives(len(names), node1, node2, weights)
+    # links without alternative keep their score
+    scores = weights / np.where(best == 0, 1, best)
+
+    order = rank_links(scores, node1, node2, names)
+    telemetry.count("links", len(order))
 
     ofile = open(outfile, "w")
+    for start in range(0, len(order), CHUNK_LINES):
+        chunk = order[start : start + CHUNK_LINES]
+        ofile.writelines(
+            "%s\t%s\t%r\t%s\t%r\t%d\tFalse\tFalse\n"
+            % (names[u], names[v], w, repr(b) if b != 0 else "1", score, c)
+            for u, v, w, b, score, c in zip(
+                node1[chunk].tolist(),
+                node2[chunk].tolist(),
+                weights[chunk].tolist(),
+                best[chunk].tolist(),
+                scores[chunk].tolist(),
+                counts[chunk].tolist(),
+            )
+        )
+    ofile.close()
+
+    save_links_table(
+        outfile, names, node1[order], node2[order], scores[order], counts[order]
+    )
+
 
-    for key in links:
-        attrs = key.split("$")
-        u = attrs[0]
-        v = attrs[1]
-        w = links[key]
-
-        max_u = node2weight[u]
-        max_v = node2weight[v]
-
-        bestAlt = max(max_u, max_v)
-        if bestAlt == w:
-            bestAlt = get_max_weight(u, v, G)
-        if bestAlt == 0:
-            bestAlt = 1
-
-        ofile.write(
-            str(u)
-            + "\t"
-            + str(v)
-            + "\t"
-            + str(w)
-            + "\t"
-            + str(bestAlt)
-            + "\t"
-            + str(w / bestAlt)
-            + "\t"
-            + str(G[u][v]["links"])
-            + "\t"
-            + str(G[u][v]["isNeighbor"])
-            + "\t"
-            + str(G[u][v]["isGood"])
-            + "\n"
+# RANK_LINKS
+# input :
+#   scores : scaled score of each link
+#   node1, node2 : arrays of contig end ids of each link
+#   names : list of contig end names
+# output :
+#   order of the links by decreasing score, ties by decreasing line like
+#   sort -k 5 -gr in the C locale
+def rank_links(scores, node1, node2, names):
+    # Each pair of ends has a single link, so the lines of two links with the
+    # same score already differ on their first two fields
+    fields = np.array([name + "\t" for name in names], dtype=str)
+    rank = np.empty(len(names), dtype=np.int64)
+    rank[np.argsort(fields, kind="stable")] = np.arange(len(names))
+    return np.lexsort((-rank[node2], -rank[node1], -scores))
+
+
+# SAVE_LINKS_TABLE
+# input :
+#   outfile : sorted links file, the table is written to outfile + ".npz"
+#   names : names of the contig ends
+#   node1, node2 : contig end ids of each link
+#   scores : scaled score of each link
+#   counts : number of Hi-C links of each link
+# output :
+#   table read by layout_unitigs instead of the text file
+def save_links_table(outfile, names, node1, node2, scores, counts):
+    with open(outfile + ".npz", "wb") as f:
+        np.savez(
+            f,
+            names=np.array(names, dtype=str),
+            node1=node1,
+            node2=node2,
+            scores=scores,
+            counts=counts,
         )
 
-    ofile.close()
+
+# LINKS_TABLE_FROM_TEXT
+# input :
+#   infile : sorted links file rewritten by another tool
+# output :
+#   table of the links of infile, in the same order, saved to infile + ".npz"
+def links_table_from_text(infile):
+    names = {}
+    node1 = []
+    node2 = []
+    scores = []
+    counts = []
+    with open(infile, "r") as f:
+        for line in f:
+            attrs = line.split()
+            if len(attrs) < 6:
+                break
+            node1.append(names.setdefault(attrs[0], len(names)))
+            node2.append(names.setdefault(attrs[1], len(names)))
+            scores.append(float(attrs[4]))
+            counts.append(int(attrs[5]))
+    save_links_table(
+        infile,
+        list(names),
+        np.array(node1, dtype=np.int64),
+        np.array(node2, dtype=np.int64),
+        np.array(scores, dtype=float),
+        np.array(counts, dtype=np.int64),
+    )
+
+
+# LOAD_LINKS_TABLE
+# input :
+#   infile : sorted links file
+# output :
+#   names, node1, node2, scores, counts as written by save_links_table
+def load_links_table(infile):
+    with np.load(infile + ".npz") as data:
+        return (
+            data["names"],
+            data["node1"],
+            data["node2"],
+            data["scores"],
+            data["counts"],
+        )
 
 
 # ======================================================================#
@@ -152,6 +238,6 @@ def process_links(G, node2weight, links, outfile):
 
 
 def fast_scaled_scores(infile, outfile):
-    G, node_to_weight, links_data = load_contig_links(infile)
-    process_links(G, node_to_weight, links_data, outfile)
-
+    # outfile is already sorted like the layout reads it
+    names, node1, node2, weights, counts = load_contig_links(infile)
+    process_links(names, node1, node2, weights, counts, outfile)
@@ -0,0 +1,231 @@
+#include <iostream>
+#include <fstream>
+#include <string>
+#include <cstring>
+#include <cstdio>
+#include <cstdlib>
+#include <vector>
+#include <thread>
+#include <unordered_set>
+#include <getopt.h>
+#include <fcntl.h>
+#include <unistd.h>
+
+using namespace std;
+
+// Bytes of the bed file read by each thread at a time
+const size_t BLOCK_SIZE = 1 << 24;
+
+/*
+Keep the alignments of the bed file whose contig, the first column, is one of
+the contig names. The file is read in blocks of whole lines, the blocks of a
+batch are filtered by the threads and written in their order, so the memory
+used does not depend on the size of the bed file.
+*/
+
+unordered_set<string> load_names(string file)
+{
+	unordered_set<string> names;
+	string line;
+	ifstream nfile(file.c_str());
+	if(!nfile)
+	{
+		cerr<<"ERROR : Could not open "<<file<<endl;
+		exit(EXIT_FAILURE);
+	}
+	while(getline(nfile,line))
+	{
+		if(line != "")
+			names.insert(line);
+	}
+	return names;
+}
+
+struct Shard
+{
+	const char* begin;
+	const char* end;
+	vector<char> output;
+	long kept;
+	long dropped;
+};
+
+void filter_shard(const unordered_set<string>& names, Shard* shard)
+{
+	string contig;
+	shard->output.clear();
+	shard->output.reserve(shard->end - shard->begin);
+	shard->kept = 0;
+	shard->dropped = 0;
+	const char* line = shard->begin;
+	while(line < shard->end)
+	{
+		const char* eol = (const char*) memchr(line, '\n', shard->end - line);
+		if(eol == NULL)
+			eol = shard->end;
+		const char* field = line;
+		while(field < eol && *field != '\t' && *field != ' ')
+			field++;
+		contig.assign(line, field - line);
+		if(names.count(contig))
+		{
+			shard->output.insert(shard->output.end(), line, eol);
+			shard->output.push_back('\n');
+			shard->kept++;
+		}
+		else
+			shard->dropped++;
+		line = eol + 1;
+	}
+}
+
+// End of the line holding position pos, or end
+const char* line_end(const char* pos, const char* end)
+{
+	const char* eol = (const char*) memchr(pos, '\n', end - pos);
+	return eol == NULL ? end : eol + 1;
+}
+
+void write_all(int fd, const char* data, size_t size)
+{
+	while(size > 0)
+	{
+		ssize_t n = write(fd, data, size);
+		if(n < 0)
+		{
+			cerr<<"ERROR : Could not write the filtered bed file"<<endl;
+			exit(EXIT_FAILURE);
+		}
+		data += n;
+		size -= n;
+	}
+}
+
+// Add the counts of the run to the file named by SALSA_TELEMETRY_COUNTS
+void write_counts(long kept, long dropped)
+{
+	const char* counts_file = getenv("SALSA_TELEMETRY_COUNTS");
+	if(counts_file == NULL || *counts_file == 0)
+		return;
+	ofstream counts(counts_file, ios::app);
+	counts<<"alignments\t"<<kept<<"\n";
+	counts<<"dropped_alignments\t"<<dropped<<"\n";
+}
+
+void print_usage()
+{
+	printf("Usage: filter_bed -n contig_names -b bed [-t threads] > filtered_bed\n");
+}
+
+int main(int argc, char* argv[])
+{
+	int option = 0;
+	string names_file="", bed="";
+	int threads = 1;
+	while((option = getopt(argc,argv,"n:b:t:")) != -1)
+	{
+		switch(option)
+		{
+			case 'n':
+			{
+				names_file = optarg;
+				break;
+			}
+			case 'b':
+			{
+				bed = optarg;
+				break;
+			}
+			case 't':
+			{
+				threads = atoi(optarg);
+				break;
+			}
+			default:
+			{
+				print_usage();
+				exit(EXIT_FAILURE);
+			}
+		}
+	}
+
+	if(names_file == "" || bed == "" || threads < 1)
+	{
+		print_usage();
+		exit(EXIT_FAILURE);
+	}
+
+	unordered_set<string> names = load_names(names_file);
+	int fd = open(bed.c_str(), O_RDONLY);
+	if(fd < 0)
+	{
+		cerr<<"ERROR : Could not open "<<bed<<endl;
+		exit(EXIT_FAILURE);
+	}
+	posix_fadvise(fd, 0, 0, POSIX_FADV_SEQUENTIAL);
+
+	vector<char> buffer(threads * BLOCK_SIZE);
+	vector<Shard> shards(threads);
+	size_t filled = 0;
+	long kept = 0, dropped = 0;
+	bool eof = false;
+	while(!eof || filled > 0)
+	{
+		while(!eof && filled < buffer.size())
+		{
+			ssize_t n = read(fd, &buffer[filled], buffer.size() - filled);
+			if(n < 0)
+			{
+				cerr<<"ERROR : Could not read "<<bed<<endl;
+				exit(EXIT_FAILURE);
+			}
+			if(n == 0)
+				eof = true;
+			filled += n;
+		}
+
+		// filter the whole lines, the last line is kept for the next batch
+		const char* begin = buffer.data();
+		const char* end = begin + filled;
+		if(!eof)
+		{
+			while(end > begin && end[-1] != '\n')
+				end--;
+			if(end == begin)
+			{
+				// a line longer than the buffer
+				buffer.resize(2 * buffer.size());
+				continue;
+			}
+		}
+
+		size_t shard_size = (end - begin) / threads + 1;
+		const char* start = begin;
+		for(int i = 0; i < threads; i++)
+		{
+			shards[i].begin = start;
+			start = start + shard_size < end ? line_end(start + shard_size, end) : end;
+			shards[i].end = start;
+		}
+		vector<thread> workers;
+		for(int i = 1; i < threads; i++)
+			workers.push_back(thread(filter_shard, cref(names), &shards[i]));
+		filter_shard(names, &shards[0]);
+		for(size_t i = 0; i < workers.size(); i++)
+			workers[i].join();
+
+		for(int i = 0; i < threads; i++)
+		{
+			write_all(1, shards[i].output.data(), shards[i].output.size());
+			kept += shards[i].kept;
+			dropped += shards[i].dropped;
+		}
+
+		size_t rest = begin + filled - end;
+		memmove(buffer.data(), end, rest);
+		filled = rest;
+	}
+	close(fd);
+	write_counts(kept, dropped);
+	return 0;
+}
@@ -1,14 +1,23 @@
 import networkx as nx
 import sys
 import operator
-import pickle
 import argparse
 import os
+import alignment_store as alst
+import fast_scaled_scores as fss
+import scaffold_graph as sg
+import assembly_graph as ag
+import scaffold_layout as sl
+import telemetry
 
 parser = argparse.ArgumentParser()
 # parser.add_argument('-a','--assembly', help='Contig assembly', required=False)
 parser.add_argument(
-    "-x", "--graph", help="GFA file for assembly graph", required=False, default="abc"
+    "-x",
+    "--graph",
+    help="GFA file or graph index for assembly graph",
+    required=False,
+    default="abc",
 )
 parser.add_argument(
     "-l", "--links", help="Links sorted by relative score", required=True
@@ -40,7 +49,7 @@ args = parser.parse_args()
 #                                MAIN
 # ======================================================================#
 
-G = nx.Graph()
+G = sg.EndMatching()
 contigs = set()
 all_G = nx.Graph()
 contig_length = {}
@@ -53,8 +62,6 @@ tenx_links = 0
 
 contig_lengths_original = {}
 
-contig_length = get_contig_len(args.directory + "/scaffold_length_iteration_1")
-
 # ======================================================================#
 #                                MODULES
 # ======================================================================#
@@ -77,7 +84,13 @@ def get_contig_len(filename) :
 
     return seq_len
 
-OVl_G = nx.Graph()
+
+contig_length = get_contig_len(args.directory + "/scaffold_length_iteration_1")
+
+# Assembly graph and shortest paths in it, set by load_GFA
+assembly_graph = None
+oracle = None
+
 
 def get_best_path(start, end):
     """
@@ -113,63 +126,31 @@ def get_best_path_aux(start, end):
         or2 = "FOW"
     else:
         or2 = "REV"
-    start = v1[0] + "$" + or1
-    end = v2[0] + "$" + or2
-    paths = nx.single_source_dijkstra(OVl_G, source=start, target=end)
-
-    paths = paths[1]
-    path = []
-    if end in paths:
-        path = paths[end]
-    else:
+    path = oracle.path(
+        assembly_graph.node_id(v1[0], or1), assembly_graph.node_id(v2[0], or2)
+    )
+    if path is None:
         return "NO PATH FOUND"
     ret = []
     for node in path:
-        n = node.split("$")
-        if n[1] == "REV":
-            ret.append(n[0] + "-E")
-            ret.append(n[0] + "-B")
+        name, orientation = assembly_graph.node_name(node)
+        if orientation == "REV":
+            ret.append(name + "-E")
+            ret.append(name + "-B")
         else:
-            ret.append(n[0] + "-B")
-            ret.append(n[0] + "-E")
+            ret.append(name + "-B")
+            ret.append(name + "-E")
     return ret
 
 
 def load_GFA(path):
     """
-    Loads GFA file for either unitigs or contigs, given the file path
+    Loads GFA file or graph index for either unitigs or contigs, given the file path
     """
-    # f = open(path,'r')
-    with open(path, "r") as f:
-        for line in f:
-            line = line.strip().split()
-
-            # S   tig00000001 *   LN:i:20388
-            # L   tig00023281 -   tig00008904 +   21556M  cv:A:F
-            if line[0] == "S":
-                OVl_G.add_node(
-                    line[1] + "$REV", name=line[1], length=line[3].split(":")[2]
-                )
-                OVl_G.add_node(
-                    line[1] + "$FOW", name=line[1], length=line[3].split(":")[2]
-                )
-            if line[0] == "L" or line[0] == "E":
-                # BUG BUG BUG in GFA inverting edges on input
-                # assume orientations are correct
-                ctg1 = line[1]
-                ctg2 = line[3]
-                if line[2] == "+" and line[4] == "+":
-                    OVl_G.add_edge(ctg1 + "$FOW", ctg2 + "$FOW", weight=1)
-                    OVl_G.add_edge(ctg2 + "$REV", ctg1 + "$REV", weight=1)
-                if line[2] == "+" and line[4] == "-":
-                    OVl_G.add_edge(ctg1 + "$FOW", ctg2 + "$REV", weight=1)
-                    OVl_G.add_edge(ctg2 + "$FOW", ctg1 + "$REV", weight=1)
-                if line[2] == "-" and line[4] == "+":
-                    OVl_G.add_edge(ctg1 + "$REV", ctg2 + "$FOW", weight=1)
-                    OVl_G.add_edge(ctg2 + "$REV", ctg1 + "$FOW", weight=1)
-                if line[2] == "-" and line[4] == "-":
-                    OVl_G.add_edge(ctg1 + "$REV", ctg2 + "$REV", weight=1)
-                    OVl_G.add_edge(ctg2 + "$FOW", ctg1 + "$FOW", weight=1)
+    global assembly_graph, oracle
+    # the layout follows overlaps in both directions
+    assembly_graph = ag.load_graph(path).undirected()
+    oracle = ag.DistanceOracle(assembly_graph)
 
 
 def reverse_complement(contig):
@@ -210,12 +191,10 @@ iteration = int(args.iteration)
 """
 If GFA is given as an argument, load it
 """
-# shortest_paths = {}
 # if args.graph !='abc':
 #    print(>> sys.stderr, 'started loading GFA')
 #    load_GFA(args.graph)
-#    shortest_paths = nx.all_pairs_dijkstra_path_length(OVl_G)
-# print(>> sys.stderr, 'Finished loading GFA, nodes =  ' + str(len(OVl_G.nodes())) + ' edges = ' + str(len(OVl_G.edges())))
+# print(>> sys.stderr, 'Finished loading GFA, nodes =  ' + str(assembly_graph.number_of_nodes()) + ' edges = ' + str(assembly_graph.number_of_edges()))
 
 
 """
@@ -226,11 +205,8 @@ previous_scaffolds = {}
 contig2scaffold = {}
 if int(args.iteration) > 1:
     try:
-        previous_scaffolds = pickle.load(
-            open(
-                args.directory + "/scaffolds_iteration_" + str(iteration - 1) + ".p",
-                "r",
-            )
+        previous_scaffolds = sl.load_layout(
+            args.directory + "/scaffolds_iteration_" + str(iteration - 1) + ".layout"
         )
         for key in previous_scaffolds:
             contigs_1 = previous_scaffolds[key]
@@ -266,23 +242,28 @@ def load_tenx_links():
                     attrs = line.split()
                     v1 = attrs[0]
                     v2 = attrs[1]
-                    if v1 not in G.nodes() and v2 not in G.nodes():
-                        G.add_edge(v1, v2, score=float(attrs[4]), linktype="tenx")
+                    if G.is_free(v1) and G.is_free(v2):
+                        G.add_link(v1, v2)
                         contigs.add(v1.split(":")[0])
                         contigs.add(v2.split(":")[0])
                         # tenx_links += 1
 
     else:
         if args.tenx != "abc":
+            # paths of the scaffolds decoded from the layout, each only once
+            paths = {}
             for u, v in tenx_graph.edges():
                 contig_1 = u.split(":")[0]
                 contig_2 = v.split(":")[0]
                 if contig_1 in contig2scaffold and contig_2 in contig2scaffold:
                     scaffold_1 = contig2scaffold[contig_1]
                     scaffold_2 = contig2scaffold[contig_2]
+                    for scaffold in (scaffold_1, scaffold_2):
+                        if scaffold not in paths:
+                            paths[scaffold] = previous_scaffolds[scaffold]
                     test_edge(
-                        previous_scaffolds[scaffold_1],
-                        previous_scaffolds[scaffold_2],
+                        paths[scaffold_1],
+                        paths[scaffold_2],
                         tenx_graph,
                         "tenx",
                     )
@@ -290,8 +271,8 @@ def load_tenx_links():
 
 def load_unitigs_first():
     for u, v in unitig_graph.edges():
-        if u not in G.nodes() and v not in G.nodes():
-            G.add_edge(u, v, score=1.5, type="unitig")
+        if G.is_free(u) and G.is_free(v):
+            G.add_link(u, v)
             contigs.add(u.split(":")[0])
             contigs.add(v.split(":")[0])
 
@@ -316,16 +297,16 @@ def test_edge(scaffold_first, scaffold_second, G_test, type):
     if G_test.has_edge(last_first, first_second):
         v1 = c1 + ":E"
         v2 = c2 + ":B"
-        if v1 not in G.nodes() and v2 not in G.nodes():
-            G.add_edge(v1, v2, score=2, linktype=type)
+        if G.is_free(v1) and G.is_free(v2):
+            G.add_link(v1, v2)
             contigs.add(c1)
             contigs.add(c2)
 
     if G_test.has_edge(reverse_complement(first_first), first_second):
         v1 = c1 + ":B"
         v2 = c2 + ":B"
-        if v1 not in G.nodes() and v2 not in G.nodes():
-            G.add_edge(v1, v2, score=2, linktype=type)
+        if G.is_free(v1) and G.is_free(v2):
+            G.add_link(v1, v2)
             contigs.add(c1)
             contigs.add(c2)
             return
@@ -333,8 +314,8 @@ def test_edge(scaffold_first, scaffold_second, G_test, type):
     if G_test.has_edge(last_first, reverse_complement(last_second)):
         v1 = c1 + ":E"
         v2 = c2 + ":E"
-        if v1 not in G.nodes() and v2 not in G.nodes():
-            G.add_edge(v1, v2, score=2, linktype=type)
+        if G.is_free(v1) and G.is_free(v2):
+            G.add_link(v1, v2)
             contigs.add(c1)
             contigs.add(c2)
             return
@@ -344,8 +325,8 @@ def test_edge(scaffold_first, scaffold_second, G_test, type):
     ):
         v1 = c1 + ":E"
         v2 = c2 + ":B"
-        if v1 not in G.nodes() and v2 not in G.nodes():
-            G.add_edge(v1, v2, score=2, linktype=type)
+        if G.is_free(v1) and G.is_free(v2):
+            G.add_link(v1, v2)
             contigs.add(c1)
             contigs.add(c2)
             return
@@ -356,81 +337,77 @@ def test_edge(scaffold_first, scaffold_second, G_test, type):
 def generate_scaffold_graph():
     gfa_edges = 0
     tiling_edges = 0
-    with open(
-        args.directory + "/contig_links_scaled_sorted_iteration_" + str(iteration), "r"
-    ) as f:
-        for line in f:
-            # i += 1
-            # print(i)
-            attrs = line.split()
-            # print(line)
-            if len(attrs) < 5:
+    # links sorted by decreasing score, with their scores and counts
+    names, node1, node2, scores, counts = fss.load_links_table(
+        args.directory + "/contig_links_scaled_sorted_iteration_" + str(iteration)
+    )
+    names = names.tolist()
+    for n1, n2, score, count in zip(
+        node1.tolist(), node2.tolist(), scores.tolist(), counts.tolist()
+    ):
+        v1 = names[n1]
+        v2 = names[n2]
+        c1 = v1.split(":")[0]
+        o1 = v1.split(":")[1]
+        c2 = v2.split(":")[0]
+        o2 = v2.split(":")[1]
+        # print(score)
+        all_G.add_edge(v1, v2, score=score)
+        # filter out links
+        if iteration == 1:
+            if contig_length[c1] <= int(args.cutoff) or contig_length[c2] <= int(
+                args.cutoff
+            ):
+                continue
+        if score < 1 and count >= 100:
+            if G.is_free(v1) and G.is_free(v2):
+                # print(line)
+                # hic_edges += 1
+                added = False
+                if iteration == 1 and unitig_graph.number_of_edges() > 0:
+                    for ori in ["B:B", "B:E", "E:B", "E:E"]:
+                        u1 = c1 + ":" + ori[0]
+                        u2 = c2 + ":" + ori[1]
+                        if (
+                            unitig_graph.has_edge(u1, u2)
+                            and G.is_free(u1)
+                            and G.is_free(u2)
+                        ):
+                            G.add_link(u1, u2)
+                            added = True
+                            contigs.add(c1)
+                            contigs.add(c2)
+                            break
+            else:
                 break
-            v1 = attrs[0]
-            v2 = attrs[1]
-            c1 = attrs[0].split(":")[0]
-            o1 = attrs[0].split(":")[1]
-            c2 = attrs[1].split(":")[0]
-            o2 = attrs[1].split(":")[1]
-            # print(float(attrs[4]))
-            all_G.add_edge(v1, v2, score=float(attrs[4]))
-            # filter out links
-            if iteration == 1:
-                if contig_length[c1] <= int(args.cutoff) or contig_length[c2] <= int(
-                    args.cutoff
-                ):
-                    continue
-            if float(attrs[4]) < 1 and float(attrs[5]) >= 100:
-                if v1 not in G.nodes() and v2 not in G.nodes():
-                    # print(line)
-                    # hic_edges += 1
-                    added = False
-                    if iteration == 1 and args.unitigs != "abc":
-                        for ori in ["B:B", "B:E", "E:B", "E:E"]:
-                            if unitig_graph.has_edge(
-                                c1 + ":" + ori[0], c2 + ":" + ori[1]
-                            ):
-                                G.add_edge(
-                                    c1 + ":" + ori[0],
-                                    c2 + ":" + ori[1],
-                                    score=float(attrs[4]),
-                                    linktype="hic",
-                                )
-                                added = True
-                                contigs.add(c1)
-                                contigs.add(c2)
-                                break
-                else:
-                    break
 
-            else:
-                if v1 not in G.nodes() and v2 not in G.nodes():
-                    # print(line)
-                    # hic_edges += 1
-                    added = False
-                    if iteration == 1 and args.unitigs != "abc":
-                        for ori in ["B:B", "B:E", "E:B", "E:E"]:
-                            if unitig_graph.has_edge(
-                                c1 + ":" + ori[0], c2 + ":" + ori[1]
-                            ):
-                                G.add_edge(
-                                    c1 + ":" + ori[0],
-                                    c2 + ":" + ori[1],
-                                    score=float(attrs[4]),
-                                    linktype="hic",
-                                )
-                                added = True
-                                break
-                        if not added:
-                            G.add_edge(v1, v2, score=float(attrs[4]), linktype="hic")
+        else:
+            if G.is_free(v1) and G.is_free(v2):
+                # print(line)
+                # hic_edges += 1
+                added = False
+                if iteration == 1 and unitig_graph.number_of_edges() > 0:
+                    for ori in ["B:B", "B:E", "E:B", "E:E"]:
+                        u1 = c1 + ":" + ori[0]
+                        u2 = c2 + ":" + ori[1]
+                        if (
+                            unitig_graph.has_edge(u1, u2)
+                            and G.is_free(u1)
+                            and G.is_free(u2)
+                        ):
+                            G.add_link(u1, u2)
+                            added = True
+                            break
+                    if not added:
+                        G.add_link(v1, v2)
 
-                    else:
-                        if int(attrs[5]) >= 20 and float(attrs[4]) >= 1.12:
-                            G.add_edge(v1, v2, score=float(attrs[4]), linktype="hic")
-                    # else:
-                    #    print("UNUSED "+ line)
-                    contigs.add(c1)
-                    contigs.add(c2)
+                else:
+                    if count >= 20 and score >= 1.12:
+                        G.add_link(v1, v2)
+                # else:
+                #    print("UNUSED "+ line)
+                contigs.add(c1)
+                contigs.add(c2)
     # print(>> sys.stderr,  'Finished loading Hi-C links, Loading unitig links now..')
 
     """
@@ -444,16 +421,17 @@ def generate_scaffold_graph():
 
     # Now do usual layout
     for ctg in list(contigs):
-        G.add_edge(ctg + ":B", ctg + ":E", t="c", score=0, linktype="implicit")
+        G.add_contig(ctg)
 
     print(
         "Hybrid scaffold graph loaded, nodes = "
-        + str(len(G.nodes()))
+        + str(G.number_of_nodes())
         + " edges = "
-        + str(len(G.edges())),
+        + str(G.number_of_edges()),
         file=sys.stderr,
     )
     print("Hi-C implied edges = " + str(hic_edges), file=sys.stderr)
+    telemetry.count("layout_links", G.links)
 
 
 def get_seed_scaffold():
@@ -465,21 +443,17 @@ def get_seed_scaffold():
     seed_scaffolds = {}  # this stores initial long scaffolds
     to_merge = set()
 
-    for subg in nx.connected_component_subgraphs(G):
-        p = []
-        for node in subg.nodes():
-            if subg.degree(node) == 1:
-                p.append(node)
+    for component in G.components():
+        path = G.path(component)
 
-        # If this is 2 then we have found the path!
-        if len(p) == 2:
-            path = nx.shortest_path(subg, p[0], p[1])
+        # If this is a path then we have found the scaffold!
+        if path is not None:
             seed_scaffolds[g_idx] = path
             g_idx += 1
 
         # else try to insert these contigs in the long scaffolds generated previously
         else:
-            for node in subg.nodes():
+            for node in G.ends(component):
                 to_merge.add(node.split(":")[0])
 
     return seed_scaffolds, to_merge
@@ -490,24 +464,30 @@ def assign_small_to_seed(to_merge, seed_scaffolds):
     Given a small contig, it finds best scaffold where small contig can go in
     """
     assignment = {}
+    index = sg.ScaffoldIndex(seed_scaffolds)
+    rank = {key: i for i, key in enumerate(seed_scaffolds)}
 
     for contig in to_merge:
+        # links of the contig to each scaffold, summed in the order of the
+        # path like a scan of the scaffold would
+        hits = {}
+        for side, end in enumerate([contig + ":B", contig + ":E"]):
+            if end not in all_G:
+                continue
+            for node, data in all_G[end].items():
+                key = index.scaffold.get(node)
+                if key is not None:
+                    hits.setdefault(key, []).append(
+                        (index.label[node], side, data["score"])
+                    )
+
         max_sum = -1
         max_path = -1
-        for key in seed_scaffolds:
-            path = seed_scaffolds[key]
+        for key in sorted(hits, key=rank.__getitem__):
             cur_sum = 0
-            cnt = 0
-            five_prime = contig + ":B"
-            three_prime = contig + ":E"
-            for node in path:
-                if all_G.has_edge(five_prime, node):
-                    cur_sum += all_G[five_prime][node]["score"]
-                    cnt += 1
-                if all_G.has_edge(three_prime, node):
-                    cur_sum += all_G[three_prime][node]["score"]
-                    cnt += 1
-            if cnt != 0 and cur_sum > max_sum:
+            for _, _, score in sorted(hits[key]):
+                cur_sum += score
+            if cur_sum > max_sum:
                 max_sum = cur_sum
                 max_path = key
 
@@ -523,33 +503,38 @@ def insert(assignment, seed_scaffolds):
     all possible orientation and orderings
     """
     to_add_later = set()
+    index = sg.ScaffoldIndex(seed_scaffolds)
     for contig in assignment:
         # print(contig)
         # print(assignment[contig])
-        path = seed_scaffolds[assignment[contig]]
-        # print(path)
+        key = assignment[contig]
         five_prime = contig + ":B"
         three_prime = contig + ":E"
         total_max = -1
         orientation = ""
-        pos = -1
-        # first check at all middle positions
-        for i in xrange(1, len(path) - 1, 2):
+        pos = None
+        # a position only scores if the 5' end links to the end before it, so
+        # the positions come from the links of the 5' end, in path order
+        gaps = []
+        if five_prime in all_G:
+            for node in all_G[five_prime]:
+                if index.scaffold.get(node) == key and index.opens_gap(node):
+                    gaps.append(node)
+        gaps.sort(key=index.label.__getitem__)
+
+        for node in gaps:
+            after = index.next[node]
             score_fow = -1
             score_rev = -1
-            if all_G.has_edge(five_prime, path[i]) and all_G.has_edge(
-                three_prime, path[i + 1]
-            ):
+            if all_G.has_edge(five_prime, node) and all_G.has_edge(three_prime, after):
                 score_fow = (
-                    all_G[five_prime][path[i]]["score"]
-                    + all_G[three_prime][path[i + 1]]["score"]
+                    all_G[five_prime][node]["score"]
+                    + all_G[three_prime][after]["score"]
                 )
-            if all_G.has_edge(three_prime, path[i]) and all_G.has_edge(
-                five_prime, path[i + 1]
-            ):
+            if all_G.has_edge(three_prime, node) and all_G.has_edge(five_prime, after):
                 score_rev = (
-                    all_G[three_prime][path[i]]["score"]
-                    + all_G[five_prime][path[i + 1]]["score"]
+                    all_G[three_prime][node]["score"]
+                    + all_G[five_prime][after]["score"]
                 )
 
             # print(score_fow, score_rev)
@@ -557,30 +542,27 @@ def insert(assignment, seed_scaffolds):
                 if score_fow > total_max:
                     total_max = score_fow
                     orientation = "fow"
-                    pos = i
+                    pos = node
                 else:
                     if score_rev > total_max:
                         total_max = score_rev
                         orientation = "rev"
-                        pos = i
+                        pos = node
 
         if total_max != -1:
             # print(contig)
             if orientation == "fow":
-                # print("INSERTING " + contig + ' between ' + path[pos-1] + ' and ' + path[pos+1])
-                path.insert(pos + 1, five_prime)
-                path.insert(pos + 2, three_prime)
-
+                index.insert_after(pos, [five_prime, three_prime])
             else:
-                # print("INSERTING " + contig + ' between ' + path[pos-1] + ' and ' + path[pos+1])
-                path.insert(pos + 1, three_prime)
-                path.insert(pos + 2, five_prime)
-            seed_scaffolds[assignment[contig]] = path
+                index.insert_after(pos, [three_prime, five_prime])
 
         else:
             # print(contig)
             to_add_later.add(contig)
 
+    for key in seed_scaffolds:
+        seed_scaffolds[key] = index.path(key)
+
     return seed_scaffolds, to_add_later
 
 
@@ -601,7 +583,7 @@ def update_bed(expanded_scaffold):
         path = expanded_scaffold[key]
         scaffold_length[key] = 0
         offset = 0
-        for i in xrange(0, len(path), 2):
+        for i in range(0, len(path), 2):
             contig = path[i].split(":")[0]
             contig2scaffold[contig] = key
             ori = path[i].split(":")[1] + path[i + 1].split(":")[1]
@@ -624,7 +606,7 @@ def update_bed(expanded_scaffold):
             contig = path[0].split(":")[0]
             scaffold_re[key] = re_counts[contig]
         else:
-            for i in xrange(0, len(path), 2):
+            for i in range(0, len(path), 2):
                 contig = path[i].split(":")[0]
                 contig2scaffold[contig] = key
                 left, right = re_counts[contig]
@@ -684,83 +666,16 @@ def update_bed(expanded_scaffold):
             scaffold_re[key] = (s_left, s_right)
             # print("==============================")
 
-    o_lines = ""
-    count = 0
-    prev_line = ""
-
-    if not os.path.isfile(
-        args.directory + "/alignment_iteration_" + str(iteration + 1) + ".bed"
-    ):
-        output = open(
-            args.directory + "/alignment_iteration_" + str(iteration + 1) + ".bed", "w"
-        )
-        with open(args.directory + "/alignment_iteration_1.bed", "r") as f:
-            for line in f:
-                if prev_line == "":
-                    prev_line = line
-                    continue
-                else:
-                    prev_attrs = prev_line.split()
-                    curr_attrs = line.split()
-                    prev_contig = prev_attrs[0]
-                    curr_contig = curr_attrs[0]
-                    # if prev_contig == curr_contig:
-                    #    continue
-                    prev_read = prev_attrs[3].split("/")[0]
-                    curr_read = curr_attrs[3].split("/")[0]
-                    first = prev_attrs[3].split("/")[1]
-                    second = curr_attrs[3].split("/")[1]
-                    if (
-                        prev_contig in contig2scaffold
-                        and curr_contig in contig2scaffold
-                    ):
-                        prev_scaffold = contig2scaffold[prev_contig]
-                        curr_scaffold = contig2scaffold[curr_contig]
-                        # if prev_read == curr_read and prev_scaffold != curr_scaffold and first == '1' and second == '2':
-                        if prev_read == curr_read and first == "1" and second == "2":
-                            prev_info = contig2info[prev_contig]
-                            prev_start = int(prev_attrs[1])
-                            prev_end = int(prev_attrs[2])
-                            new_prev_start = prev_start + prev_info[0]
-                            new_prev_end = prev_end + prev_info[0]
-                            o_lines += (
-                                prev_scaffold
-                                + "\t"
-                                + str(new_prev_start)
-                                + "\t"
-                                + str(new_prev_end)
-                                + "\t"
-                                + prev_attrs[3]
-                                + "\n"
-                            )
-                            count += 1
-
-                            curr_info = contig2info[curr_contig]
-                            curr_start = int(curr_attrs[1])
-                            curr_end = int(curr_attrs[2])
-                            new_curr_start = curr_start + curr_info[0]
-                            new_curr_end = curr_end + curr_info[0]
-                            o_lines += (
-                                curr_scaffold
-                                + "\t"
-                                + str(new_curr_start)
-                                + "\t"
-                                + str(new_curr_end)
-                                + "\t"
-                                + curr_attrs[3]
-                                + "\n"
-                            )
-                            count += 1
-                            if count == 1000000:
-                                output.write(o_lines)
-                                count = 0
-                                o_lines = ""
-
-                prev_line = line
-
-            # write remaining lines
-            output.write(o_lines)
-            output.close()
+    # The alignments are not rewritten : the next stages place them on the
+    # scaffolds with this table when they read the alignment store
+    alst.write_scaffold_offsets(
+        args.directory + "/scaffold_offsets_iteration_" + str(iteration + 1) + ".npz",
+        args.directory + "/alignments",
+        list(expanded_scaffold.keys()),
+        contig2scaffold,
+        contig2info,
+        intra=True,
+    )
     len_output = open(
         args.directory + "/scaffold_length_iteration_" + str(iteration + 1), "w"
     )
@@ -788,7 +703,7 @@ def merge(contigs):
     # print("MERGING " + str(contigs))
     scaffolds = []
     subg = all_G.subgraph(contigs)
-    best_hic_graph = nx.Graph()
+    best_hic_graph = sg.EndMatching()
     edges = []
     contigs = set()
     for u, v, data in subg.edges(data=True):
@@ -796,29 +711,21 @@ def merge(contigs):
     edges.sort(key=lambda x: x[2], reverse=True)
     # print(edges)
     for u, v, score in edges:
-        if u not in best_hic_graph.nodes() and v not in best_hic_graph.nodes():
-            best_hic_graph.add_edge(u, v, score=score)
+        if best_hic_graph.is_free(u) and best_hic_graph.is_free(v):
+            best_hic_graph.add_link(u, v)
             contigs.add(u.split(":")[0])
             contigs.add(v.split(":")[0])
 
     for contig in contigs:
-        best_hic_graph.add_edge(contig + ":B", contig + ":E", score=0)
-
-    # print(best_hic_graph.nodes())
-
-    for g in nx.connected_component_subgraphs(best_hic_graph):
-        # print(g.nodes())
-        p = []
-        for node in g.nodes():
-            if g.degree(node) == 1:
-                p.append(node)
+        best_hic_graph.add_contig(contig)
 
-        if len(p) == 2:
-            path = nx.shortest_path(g, p[0], p[1])
+    for component in best_hic_graph.components():
+        path = best_hic_graph.path(component)
+        if path is not None:
             scaffolds.append(path)
         else:
             contigs = set()
-            for node in g.nodes():
+            for node in best_hic_graph.ends(component):
                 contigs.add(node.split(":")[0])
             for each in contigs:
                 scaffolds.append([each + ":B", each + ":E"])
@@ -877,7 +784,7 @@ for key in final_scaffolds:
     path = final_scaffolds[key]
     new_path = []
     # print(path)
-    for i in xrange(0, len(path) - 1, 2):
+    for i in range(0, len(path) - 1, 2):
         # print(path)
         contig = path[i].split(":")[0]
         scaffolded_contigs[contig] = True
@@ -903,7 +810,7 @@ for key in final_scaffolds:
     oline = ""
     oline += "scaffold_" + str(key) + "\t"
     cum_len = 0
-    for i in xrange(0, len(path) - 1, 2):
+    for i in range(0, len(path) - 1, 2):
         # print(path)
         contig = path[i].split(":")[0]
         cum_len += prev_len[contig]
@@ -962,7 +869,7 @@ Now break the scaffolds at all the junctions where link support is less than 10,
 #    for key in final_scaffolds:
 #        scaffold_path = final_scaffolds[key]
 #        to_break = []
-#        for i in xrange(1,len(scaffold_path)-1,2):
+#        for i in range(1,len(scaffold_path)-1,2):
 #           curr = scaffold_path[i]
 #           next = scaffold_path[i+1]
 #           if G_first.has_edge(curr,next):
@@ -971,7 +878,7 @@ Now break the scaffolds at all the junctions where link support is less than 10,
 
 #        #now break scaffold
 #        if len(to_break) >= 1:
-#           for i in xrange(len(to_break)):
+#           for i in range(len(to_break)):
 #              if i == 0:
 #                 scaff = scaffold_path[0:to_break[i]+1]
 #                 updated_scaffolds['scaffold_'+str(new_id)] = scaff
@@ -993,8 +900,10 @@ Now break the scaffolds at all the junctions where link support is less than 10,
 
 # expanded_scaffold_paths = updated_scaffolds
 
-pickle.dump(
+scaffolds_written = sl.save_layout(
+    args.directory + "/scaffolds_iteration_" + str(args.iteration) + ".layout",
     expanded_scaffold_paths,
-    open(args.directory + "/scaffolds_iteration_" + str(args.iteration) + ".p", "w"),
+    contig_length,
 )
+telemetry.count("scaffolds", scaffolds_written)
 update_bed(expanded_scaffold_paths)
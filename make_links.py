@@ -1,22 +1,44 @@
 # ======================================================================#
 # Process Hi-C data to make links
-# Last edition : 2019/02/28
+# Last edition : 2026/10/18
 # ======================================================================#
 
+import os
 import sys
+from itertools import islice
+from functools import partial
+from multiprocessing import Pool
 import numpy as np
+import contig_ids as cids
+import alignment_store as alst
+import pair_cache as pcache
+import telemetry
 
 # ======================================================================#
 #                                ARGUMENTS
 # ======================================================================#
 
-# mapping_data : path to Hi-C data
+# mapping_data : path to Hi-C data, bed file or directory of an alignment store
+#                with its pair table
 # restrict_data : path to restriction sites counts per half of contigs
 # contig_len_data : path to file with contigs length
 # iteration : integer, iteration number
 # contig_links_file : path to file where links should be written
 # dup_data : path to duplicated links file
 # avoid_data : path to links to avoid
+# offsets_data : contig to scaffold table applied to the pair table
+# engine : "chunked" to pair mates with numpy, "python" for the line by line loop,
+#          "incremental" to aggregate the contig end counts of the first iteration
+# workers : number of processes counting links
+
+# Contact counts between contig bins, written in the alignment store by
+# count_contig_ends and read by the incremental engine. Each contig is cut in
+# END_BINS bins, a bin being assigned as a whole to one end of its scaffold.
+END_COUNTS_FILE = "end_counts.npz"
+END_BINS = 64
+
+# Number of bed lines loaded at once by the chunked engine
+CHUNK_SIZE = 2000000
 
 # ======================================================================#
 #                                MODULES
@@ -176,6 +198,499 @@ def compute_links(
     return links_dict, norm_dict
 
 
+# PARSE_BED_CHUNKS
+# input :
+#   mapping_file : path to file with processed Hi-C reads
+#   contig_ids : ContigIds of the contigs in the length file
+#   chunk_size : number of lines to read at once
+#   start, stop : byte range of the file to read, stop=None for the end
+# output :
+#   generator of (ids, pos, reads) arrays for consecutive chunks of lines, pos
+#   being the middle of each mapped read
+def parse_bed_chunks(
+    mapping_file, contig_ids, chunk_size=CHUNK_SIZE, start=0, stop=None
+):
+    """
+    Read a name-sorted bed file by chunks of consecutive lines.
+    """
+    with open(mapping_file, "rb") as f:
+        f.seek(start)
+        lines = _read_range(f, start, stop)
+        while True:
+            fields = [x.decode().split(None, 4) for x in islice(lines, chunk_size)]
+            if not fields:
+                break
+            ids = contig_ids.intern([x[0] for x in fields])
+            pos = (
+                np.array([x[1] for x in fields], dtype=np.int64)
+                + np.array([x[2] for x in fields], dtype=np.int64)
+            ) // 2
+            reads = np.array([x[3].split("/")[0] for x in fields])
+            yield ids, pos, reads
+
+
+def _read_range(f, start, stop):
+    """
+    Lines of a binary file starting before byte stop.
+    """
+    for line in f:
+        if stop is not None and start >= stop:
+            break
+        start += len(line)
+        yield line
+
+
+# BED_SHARDS
+# input :
+#   mapping_file : path to file with processed Hi-C reads sorted by read name
+#   workers : number of shards wanted
+# output :
+#   list of (start, stop) byte ranges, each one starting with a new read
+def bed_shards(mapping_file, workers):
+    """
+    Split a name-sorted bed file in byte ranges of similar size, without
+    splitting the alignments of a read between two ranges.
+    """
+    size = os.path.getsize(mapping_file)
+    bounds = [0]
+    with open(mapping_file, "rb") as f:
+        for i in range(1, workers):
+            pos = size * i // workers
+            if pos <= bounds[-1]:
+                continue
+            # Skip to the end of the current line, then to the next read
+            f.seek(pos)
+            f.readline()
+            read = _read_name(f.readline())
+            while True:
+                pos = f.tell()
+                line = f.readline()
+                if not line or _read_name(line) != read:
+                    break
+            if bounds[-1] < pos < size:
+                bounds.append(pos)
+    bounds.append(size)
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _read_name(line):
+    """
+    Read name of a bed line, without its mate number.
+    """
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        return None
+    return fields[3].split(b"/")[0]
+
+
+# PAIR_MATES
+# input :
+#   chunks : generator of (ids, pos, reads) arrays for consecutive lines
+# output :
+#   generator of (ids1, pos1, ids2, pos2) arrays for consecutive lines of the
+#   same read, the last line of a chunk being paired with the first of the next
+def pair_mates(chunks):
+    """
+    Pair consecutive alignments of the same read.
+    """
+    carry = None
+    for ids, pos, reads in chunks:
+        if len(ids) == 0:
+            continue
+        if carry is not None:
+            ids = np.concatenate([carry[0], ids])
+            pos = np.concatenate([carry[1], pos])
+            reads = np.concatenate([carry[2], reads])
+        carry = (ids[-1:], pos[-1:], reads[-1:])
+
+        mask = reads[1:] == reads[:-1]
+        yield ids[:-1][mask], pos[:-1][mask], ids[1:][mask], pos[1:][mask]
+
+
+# CACHE_CHUNKS
+# input :
+#   store_dir : directory of an alignment store and its pair table
+#   contig_ids : ContigIds of the contigs or scaffolds in the length file
+#   offsets_data : contig to scaffold table, or "abc" to read contigs
+#   start, stop : range of pairs to read, stop=None for the end
+# output :
+#   generator of (ids1, pos1, ids2, pos2) arrays, as pair_mates
+def cache_chunks(store_dir, contig_ids, offsets_data="abc", start=0, stop=None):
+    """
+    Read the pair table by chunks.
+    """
+    offsets = None
+    if offsets_data != "abc":
+        offsets = alst.load_scaffold_offsets(offsets_data)
+
+    to_ids = None
+    for names, pairs in pcache.iter_pairs(
+        store_dir, offsets, start=start, stop=stop
+    ):
+        if to_ids is None:
+            # Cache ids are translated to the ids of the current length file
+            to_ids = np.append(contig_ids.intern(names), -1)
+        yield (
+            to_ids[pairs["contig1"]],
+            pairs["mid1"],
+            to_ids[pairs["contig2"]],
+            pairs["mid2"],
+        )
+
+
+# COMPUTE_LINKS_CHUNKED
+# input :
+#   chunks : generator of (ids1, pos1, ids2, pos2) arrays of paired mates
+#   contig_ids : ContigIds of the contigs in the length file
+#   contig_len : array with length of each contig, indexed by contig id
+#   restrict_counts : array with restriction sites count for each half of
+#                     each contig, indexed by contig id
+#   dup_link : list of duplicated links
+#   avoid_link : list of links to avoid
+# output :
+#   node1, node2 : arrays of contig end ids making up each link, in order of
+#                  first appearance in the bed file
+#   counts : array with the number of chimer mapped on each link
+#   norms : array with the normalization score of each link
+def compute_links_chunked(
+    chunks, contig_ids, contig_len, restrict_counts, dup_link=[], avoid_link=[]
+):
+    """
+    Vectorized version of compute_links : mates are paired and links are
+    counted with numpy on large chunks of alignments.
+    """
+    keys, counts, first = count_link_keys(
+        chunks, contig_ids, contig_len, dup_link, avoid_link
+    )
+    order = np.argsort(first, kind="stable")
+
+    return link_arrays(
+        keys[order], counts[order], len(contig_ids), contig_len, restrict_counts
+    )
+
+
+# COUNT_LINK_KEYS
+# input :
+#   chunks : generator of (ids1, pos1, ids2, pos2) arrays of paired mates
+#   contig_ids : ContigIds of the contigs in the length file
+#   contig_len : array with length of each contig, indexed by contig id
+#   dup_link : list of duplicated links
+#   avoid_link : list of links to avoid
+# output :
+#   keys : array of link keys (lo * n + hi) * 4 + junction
+#   counts : array with the raw number of pairs on each link
+#   first : array with the rank of the first pair of each link
+def count_link_keys(chunks, contig_ids, contig_len, dup_link=[], avoid_link=[]):
+    """
+    Count the pairs of each link, without any particular order.
+    """
+    n = len(contig_ids)
+    rank = contig_ids.rank
+    mids = (contig_len / 2).astype(np.int64)
+
+    skip = _skip_pairs(contig_ids, list(dup_link) + list(avoid_link))
+
+    all_keys, all_counts, all_first = [], [], []
+    seen = 0
+    for prev_ids, prev_pos, curr_ids, curr_pos in chunks:
+        # Pairs of mates on two different contigs
+        mask = (prev_ids != curr_ids) & (prev_ids >= 0) & (curr_ids >= 0)
+        prev_ids, curr_ids = prev_ids[mask], curr_ids[mask]
+        prev_pos, curr_pos = prev_pos[mask], curr_pos[mask]
+
+        # The link is oriented from the contig with the smallest name
+        prev_first = rank[prev_ids] < rank[curr_ids]
+        lo = np.where(prev_first, prev_ids, curr_ids)
+        hi = np.where(prev_first, curr_ids, prev_ids)
+        pos_lo = np.where(prev_first, prev_pos, curr_pos)
+        pos_hi = np.where(prev_first, curr_pos, prev_pos)
+
+        pair = lo * n + hi
+        keep = ~np.isin(pair, skip)
+
+        # Junction class : 0 = BB, 1 = BE, 2 = EB, 3 = EE
+        junction = (pos_lo > mids[lo]) * 2 + (pos_hi > mids[hi])
+        keys = (pair * 4 + junction)[keep]
+
+        uniq, first, counts = np.unique(keys, return_index=True, return_counts=True)
+        all_keys.append(uniq)
+        all_counts.append(counts)
+        all_first.append(seen + first)
+        seen += len(keys)
+
+    return _merge_counts(all_keys, all_counts, all_first)
+
+
+# COMPUTE_LINKS_PARALLEL
+# input :
+#   mapping_data : name-sorted bed file or directory of an alignment store
+#   contig_len_data : path to file with contigs length
+#   restrict_counts : array with restriction sites count for each half of
+#                     each contig, indexed by contig id
+#   dup_link : list of duplicated links
+#   avoid_link : list of links to avoid
+#   offsets_data : contig to scaffold table applied to the pair table
+#   workers : number of processes
+# output :
+#   node1, node2, counts, norms : as compute_links_chunked
+def compute_links_parallel(
+    mapping_data,
+    contig_len_data,
+    restrict_counts,
+    dup_link=[],
+    avoid_link=[],
+    offsets_data="abc",
+    workers=1,
+):
+    """
+    Count links on shards of the alignments in a pool of processes. Shards
+    never split the alignments of a read, so merging their counts gives the
+    same links as compute_links_chunked.
+    """
+    contig_ids, contig_len = cids.load_contig_ids(contig_len_data, np.float64)
+
+    if os.path.isdir(mapping_data):
+        _, pairs = pcache.load_pair_cache(mapping_data)
+        bounds = [len(pairs) * i // workers for i in range(workers + 1)]
+        shards = list(zip(bounds[:-1], bounds[1:]))
+    else:
+        shards = bed_shards(mapping_data, workers)
+
+    tasks = [
+        (mapping_data, start, stop, contig_len_data, dup_link, avoid_link, offsets_data)
+        for start, stop in shards
+    ]
+    with Pool(workers) as pool:
+        results = pool.map(partial(telemetry.measured_task, _count_shard), tasks)
+    for _, usage in results:
+        telemetry.add_worker_usage(usage)
+    results = [result for result, _ in results]
+
+    # Pairs of a shard are ranked after the ones of the previous shards
+    all_keys, all_counts, all_first = [], [], []
+    seen = 0
+    for keys, counts, first in results:
+        all_keys.append(keys)
+        all_counts.append(counts)
+        all_first.append(seen + first)
+        seen += int(counts.sum())
+
+    keys, counts, first = _merge_counts(all_keys, all_counts, all_first)
+    order = np.argsort(first, kind="stable")
+
+    return link_arrays(
+        keys[order], counts[order], len(contig_ids), contig_len, restrict_counts
+    )
+
+
+def _count_shard(task):
+    """
+    Count the links of one shard, in a worker process.
+    """
+    mapping_data, start, stop, contig_len_data, dup_link, avoid_link, offsets_data = (
+        task
+    )
+    contig_ids, contig_len = cids.load_contig_ids(contig_len_data, np.float64)
+
+    if os.path.isdir(mapping_data):
+        chunks = cache_chunks(mapping_data, contig_ids, offsets_data, start, stop)
+    else:
+        chunks = pair_mates(
+            parse_bed_chunks(mapping_data, contig_ids, start=start, stop=stop)
+        )
+
+    return count_link_keys(chunks, contig_ids, contig_len, dup_link, avoid_link)
+
+
+def _skip_pairs(contig_ids, links):
+    """
+    Encode links to skip as lo * n + hi.
+    """
+    n = len(contig_ids)
+    skip = []
+    for ks in links:
+        link = ks.split("$")
+        if link[0] in contig_ids and link[1] in contig_ids:
+            skip.append(contig_ids.get(link[0]) * n + contig_ids.get(link[1]))
+    return np.array(skip, dtype=np.int64)
+
+
+# LINK_ARRAYS
+# input :
+#   keys : array of link keys (lo * n + hi) * 4 + junction, in output order
+#   counts : array with the raw number of pairs on each link
+#   n : number of contigs
+#   contig_len : array with length of each contig, indexed by contig id
+#   restrict_counts : array with restriction sites count for each half of
+#                     each contig, indexed by contig id
+# output :
+#   node1, node2, counts, norms : as compute_links_chunked
+def link_arrays(keys, counts, n, contig_len, restrict_counts):
+    """
+    Decode link keys into contig ends and normalize their counts.
+    """
+    ratios = 1 / contig_len * 2
+    lo = keys // 4 // n
+    hi = keys // 4 % n
+    half_lo = (keys % 4) // 2
+    half_hi = keys % 2
+    norms = (
+        restrict_counts[lo, half_lo] * ratios[lo]
+        + restrict_counts[hi, half_hi] * ratios[hi]
+    )
+    # compute_links starts counting at 0 for the first pair of a link
+    return 2 * lo + half_lo, 2 * hi + half_hi, counts - 1, norms
+
+
+# COUNT_CONTIG_ENDS
+# input :
+#   store_dir : directory of an alignment store and its pair table
+#   contig_len_data : path to file with contigs length at first iteration
+#   chunk_size : number of pairs read at once
+# output :
+#   contact counts between contig bins saved in store_dir, see END_COUNTS_FILE
+def count_contig_ends(store_dir, contig_len_data, chunk_size=CHUNK_SIZE):
+    """
+    Count the pairs joining every two contig bins, keeping only the pairs
+    which are placed on scaffolds at later iterations (mate 1 followed by
+    mate 2). The index of the first pair of each count is kept to reproduce
+    the order in which links appear.
+    """
+    contig_names, _ = alst.load_alignment_store(store_dir)
+    contig_ids, lengths = cids.load_contig_ids(contig_len_data)
+    lengths = np.maximum(lengths[contig_ids.intern(contig_names)], 1)
+    m = END_BINS * len(contig_names)
+
+    all_keys, all_counts, all_first = [], [], []
+    start = 0
+    for _, pairs in pcache.iter_pairs(store_dir, chunk_size=chunk_size):
+        c1, c2 = pairs["contig1"].astype(np.int64), pairs["contig2"].astype(np.int64)
+        keep = np.flatnonzero(
+            (pairs["mate1"] == 1)
+            & (pairs["mate2"] == 2)
+            & (c1 >= 0)
+            & (c2 >= 0)
+            & (c1 != c2)
+        )
+        c1, c2 = c1[keep], c2[keep]
+        node1 = END_BINS * c1 + _bin(pairs["mid1"][keep], lengths[c1])
+        node2 = END_BINS * c2 + _bin(pairs["mid2"][keep], lengths[c2])
+
+        keys, first, counts = np.unique(
+            node1 * m + node2, return_index=True, return_counts=True
+        )
+        all_keys.append(keys)
+        all_counts.append(counts)
+        all_first.append(start + keep[first])
+        start += len(pairs)
+
+    keys, counts, first = _merge_counts(all_keys, all_counts, all_first)
+    with open(store_dir + "/" + END_COUNTS_FILE, "wb") as f:
+        np.savez(
+            f,
+            node1=keys // m,
+            node2=keys % m,
+            counts=counts,
+            first=first,
+            lengths=lengths,
+        )
+
+
+def _bin(pos, lengths):
+    """
+    Bin of each position in its contig.
+    """
+    return np.clip(pos * END_BINS // lengths, 0, END_BINS - 1)
+
+
+def _merge_counts(all_keys, all_counts, all_first):
+    """
+    Sum the counts of identical keys, keeping their smallest first index.
+    """
+    keys = np.concatenate(all_keys + [np.zeros(0, dtype=np.int64)])
+    counts = np.concatenate(all_counts + [np.zeros(0, dtype=np.int64)])
+    first = np.concatenate(all_first + [np.zeros(0, dtype=np.int64)])
+
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    merged_counts = np.bincount(inverse, weights=counts, minlength=len(uniq))
+    merged_first = np.full(len(uniq), np.iinfo(np.int64).max)
+    np.minimum.at(merged_first, inverse, first)
+    return uniq, merged_counts.astype(np.int64), merged_first
+
+
+# AGGREGATE_LINKS
+# input :
+#   store_dir : directory of an alignment store with its contig end counts
+#   contig_ids : ContigIds of the scaffolds in the length file
+#   contig_len : array with length of each scaffold, indexed by scaffold id
+#   restrict_counts : array with restriction sites count for each half of
+#                     each scaffold, indexed by scaffold id
+#   offsets_data : contig to scaffold table of the current layout
+#   dup_link : list of duplicated links
+#   avoid_link : list of links to avoid
+# output :
+#   node1, node2, counts, norms : as compute_links_chunked
+def aggregate_links(
+    store_dir,
+    contig_ids,
+    contig_len,
+    restrict_counts,
+    offsets_data,
+    dup_link=[],
+    avoid_link=[],
+):
+    """
+    Compute scaffold links from the contact counts between contig bins,
+    without reading any alignment. Each bin is assigned to the half of its
+    scaffold holding its centre, with the offset rule of update_bed. This is
+    exact unless a bin spans the middle of its scaffold.
+    """
+    ends = np.load(store_dir + "/" + END_COUNTS_FILE)
+    offsets = alst.load_scaffold_offsets(offsets_data)
+    n = len(contig_ids)
+    rank = contig_ids.rank
+    mids = (contig_len / 2).astype(np.int64)
+
+    # Contig id -> scaffold id in the length file, -1 when not placed
+    to_ids = np.append(contig_ids.intern(offsets["scaffold_names"]), -1)
+    scaffold = to_ids[offsets["scaffold"]]
+
+    # Centre of each contig bin once shifted on its scaffold
+    lengths = ends["lengths"][:, None]
+    bins = np.arange(END_BINS)[None, :]
+    centre = (2 * bins + 1) * lengths // (2 * END_BINS)
+    centre = (centre + offsets["offset"][:, None]).ravel()
+
+    node1, node2 = ends["node1"], ends["node2"]
+    s1, s2 = scaffold[node1 // END_BINS], scaffold[node2 // END_BINS]
+    keep = (s1 >= 0) & (s2 >= 0) & (s1 != s2)
+    s1, s2 = s1[keep], s2[keep]
+    half1 = centre[node1[keep]] > mids[s1]
+    half2 = centre[node2[keep]] > mids[s2]
+
+    # The link is oriented from the scaffold with the smallest name
+    first_lo = rank[s1] < rank[s2]
+    lo = np.where(first_lo, s1, s2)
+    hi = np.where(first_lo, s2, s1)
+    half_lo = np.where(first_lo, half1, half2)
+    half_hi = np.where(first_lo, half2, half1)
+
+    skip = _skip_pairs(contig_ids, list(dup_link) + list(avoid_link))
+    pair = lo * n + hi
+    keys = pair * 4 + half_lo * 2 + half_hi
+    unskipped = ~np.isin(pair, skip)
+
+    keys, counts, first = _merge_counts(
+        [keys[unskipped]],
+        [ends["counts"][keep][unskipped]],
+        [ends["first"][keep][unskipped]],
+    )
+    order = np.argsort(first, kind="stable")
+
+    return link_arrays(keys[order], counts[order], n, contig_len, restrict_counts)
+
+
 # WRITE_LINKS_COUNT
 # input :
 #   links_dict : dictionnary where keys are link names and values are the
@@ -212,6 +727,39 @@ def write_links_count(links_dict: dict, norm_dict: dict, outfile):
     output.close()
 
 
+# WRITE_LINKS_ARRAYS
+# input :
+#   contig_ids : ContigIds used to number contig ends
+#   node1, node2 : arrays of contig end ids making up each link
+#   counts : array with the number of chimer mapped on each link
+#   norms : array with the normalization score of each link
+#   outfile : path to output
+# output :
+#   output file written in the same format as write_links_count
+def write_links_arrays(contig_ids, node1, node2, counts, norms, outfile):
+    """
+    Write contig links file from link arrays.
+    """
+    output = open(outfile, "w")
+
+    for u, v, count, norm in zip(
+        node1.tolist(), node2.tolist(), counts.tolist(), norms.tolist()
+    ):
+        if norm != 0:
+            output.write(
+                contig_ids.node_name(u)
+                + "\t"
+                + contig_ids.node_name(v)
+                + "\t"
+                + str(count / norm)
+                + "\t"
+                + str(count)
+                + "\n"
+            )
+
+    output.close()
+
+
 # ======================================================================#
 #                                MAIN
 # ======================================================================#
@@ -225,6 +773,11 @@ def write_links_count(links_dict: dict, norm_dict: dict, outfile):
 #   contig_links_file : path to file where links should be written
 #   dup_data : path to duplicated links file
 #   avoid_data : path to links to avoid
+#   offsets_data : contig to scaffold table applied to the pair table
+#   engine : "chunked" (default), "python" or "incremental", alignment stores
+#            are read with the chunked engine unless engine is "incremental"
+#            and a contig to scaffold table is given
+#   workers : number of processes counting links with the chunked engine
 # output :
 #   output written to contig_links_file with links
 def make_contig_links(
@@ -235,6 +788,9 @@ def make_contig_links(
     contig_links_file,
     dup_data="abc",
     avoid_data="abc",
+    offsets_data="abc",
+    engine="chunked",
+    workers=1,
 ):
     """
     Process links from Hi-C data file.
@@ -250,6 +806,56 @@ def make_contig_links(
     if int(iteration) > 1:
         avoid_links = load_links(avoid_data)
 
+    print("Loading bedfile...")
+
+    if engine != "python" or os.path.isdir(mapping_data):
+        # Contig ids follow the length file, lengths and counts are arrays
+        contig_ids, contig_lengths = cids.load_contig_ids(contig_len_data, np.float64)
+        restrict_sites_counts = contig_ids.load_re_counts(restrict_data)
+
+        if engine == "incremental" and offsets_data != "abc":
+            node1, node2, counts, norms = aggregate_links(
+                store_dir=mapping_data,
+                contig_ids=contig_ids,
+                contig_len=contig_lengths,
+                restrict_counts=restrict_sites_counts,
+                offsets_data=offsets_data,
+                dup_link=dup_links,
+                avoid_link=avoid_links,
+            )
+        elif workers > 1:
+            node1, node2, counts, norms = compute_links_parallel(
+                mapping_data=mapping_data,
+                contig_len_data=contig_len_data,
+                restrict_counts=restrict_sites_counts,
+                dup_link=dup_links,
+                avoid_link=avoid_links,
+                offsets_data=offsets_data,
+                workers=workers,
+            )
+        else:
+            if os.path.isdir(mapping_data):
+                chunks = cache_chunks(mapping_data, contig_ids, offsets_data)
+            else:
+                chunks = pair_mates(parse_bed_chunks(mapping_data, contig_ids))
+
+            node1, node2, counts, norms = compute_links_chunked(
+                chunks=chunks,
+                contig_ids=contig_ids,
+                contig_len=contig_lengths,
+                restrict_counts=restrict_sites_counts,
+                dup_link=dup_links,
+                avoid_link=avoid_links,
+            )
+
+        print("Bedfile loaded.")
+
+        # counts of the links are one less than their pairs
+        telemetry.count("linked_pairs", np.sum(counts + 1))
+        telemetry.count("links", len(node1))
+        write_links_arrays(contig_ids, node1, node2, counts, norms, contig_links_file)
+        return
+
     # Read contig length file
     contig_lengths = {}
     with open(contig_len_data, "r") as cfile:
@@ -267,8 +873,6 @@ def make_contig_links(
     contig_links = {}
     norm_score = {}
 
-    print("Loading bedfile...")
-
     contig_links, norm_score = compute_links(
         mapping_file=mapping_data,
         contig_len=contig_lengths,
@@ -279,4 +883,5 @@ def make_contig_links(
 
     print("Bedfile loaded.")
 
+    telemetry.count("links", len(contig_links))
     write_links_count(contig_links, norm_score, contig_links_file)
@@ -0,0 +1,308 @@
+# ======================================================================#
+# Misassembly detection at the junctions of the scaffolds from the Hi-C
+# coverage of the pair table, like break_contigs
+# ======================================================================#
+
+import argparse
+import numpy as np
+import alignment_store as alst
+import coverage_track as ct
+import pair_cache
+import telemetry
+
+# ======================================================================#
+#                                ARGUMENTS
+# ======================================================================#
+
+# junction : position of a scaffold where two contigs were joined, listed in
+#            breakpoints_iteration_N.txt by layout_unitigs
+# coverage : number of pairs spanning a position, a pair spans its first
+#            alignment start to its second alignment end
+# restart : like break_contigs, the coverage of a window is summed from its
+#           start, so the pairs of an overlapping window covering the base
+#           before start - 1 are subtracted from the whole window, the track
+#           keeps the exact coverage of that base as a point
+# bin_size : coverage is sampled every bin_size bases, see coverage_track for
+#            the accuracy, a junction matches a low coverage region to within
+#            bin_size bases
+# track_file : coverage track of the checked scaffolds, break_contigs -c
+#              gives the same results from it
+
+# Bases checked on each side of a junction, junctions closer to an end of
+# their scaffold are not checked
+WINDOW = 2000000
+
+# Scaffolds shorter than this are not checked
+MIN_LENGTH = 1000000
+
+# A junction is suspicious when the coverage is lower than average / divisor
+# around it for at least MIN_VOTES of the divisors
+DIVISORS = np.arange(5, 16)
+MIN_VOTES = 8
+
+# ======================================================================#
+#                                MODULES
+# ======================================================================#
+
+
+# LOAD_JUNCTIONS
+# input :
+#   breakpoints_file : one line per scaffold, its name then its junctions
+#   lengths : dictionary of scaffold lengths
+# output :
+#   dictionary of the scaffolds to their junctions far enough from the ends
+def load_junctions(breakpoints_file, lengths):
+    junctions = {}
+    with open(breakpoints_file, "r") as f:
+        for line in f:
+            attrs = line.split()
+            if not attrs:
+                continue
+            length = lengths.get(attrs[0], 0)
+            junctions[attrs[0]] = [
+                int(x)
+                for x in attrs[1:]
+                if int(x) - WINDOW >= 0 and int(x) + WINDOW <= length
+            ]
+    return junctions
+
+
+# RESTART_POSITION
+# input :
+#   junction : position of the junction
+# output :
+#   base whose coverage is subtracted from the window of the junction, -1 for
+#   a window starting at 0
+def restart_position(junction):
+    """
+    break_contigs sums the coverage of a window from the base before its
+    start, the coverage at the base before that one is not counted.
+    """
+    return max(junction - WINDOW - 2, -1)
+
+
+class JunctionCoverage:
+    """
+    Coverage track of the scaffolds holding junctions. Only the pairs lying
+    inside the window of a junction of their scaffold, with the first mate
+    ending before the second starts, and shorter than a tenth of the scaffold
+    are counted, like break_contigs.
+    """
+
+    def __init__(self, names, lengths, junctions, bin_size=ct.BIN_SIZE):
+        self.lengths = np.array([lengths.get(x, 0) for x in names], dtype=np.int64)
+        ids = {name: i for i, name in enumerate(names)}
+
+        windows = []
+        for scaffold, positions in junctions.items():
+            if scaffold not in ids or self.lengths[ids[scaffold]] < MIN_LENGTH:
+                continue
+            for pos in positions:
+                windows.append((ids[scaffold], pos - WINDOW, pos + WINDOW))
+
+        # windows in the coordinates of the scaffolds laid end to end, sorted
+        # by start, as they are all as long the last one starting before a
+        # pair is the one ending last
+        self.base = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(self.lengths + 2, out=self.base[1:])
+        windows = np.array(sorted(windows), dtype=np.int64).reshape(-1, 3)
+        self.window_scaffold = windows[:, 0]
+        self.window_start = self.base[windows[:, 0]] + windows[:, 1]
+        self.window_end = windows[:, 2]
+
+        # the track holds the checked scaffolds only, and the restart base of
+        # their windows
+        checked = np.unique(self.window_scaffold)
+        self.track_id = np.full(len(names), -1, dtype=np.int64)
+        self.track_id[checked] = np.arange(len(checked))
+        points = [
+            (self.track_id[scaffold], restart_position(start + WINDOW))
+            for scaffold, start in windows[:, :2].tolist()
+        ]
+        self.builder = ct.TrackBuilder(
+            [names[i] for i in checked], self.lengths[checked], bin_size, points
+        )
+
+    def add_pairs(self, pairs):
+        """
+        Add the pairs of a chunk of the pair table placed on the scaffolds.
+        """
+        scaffold = pairs["contig1"].astype(np.int64)
+        start = pairs["start1"]
+        end = pairs["end2"]
+        keep = (
+            (scaffold == pairs["contig2"])
+            & (pairs["end1"] <= pairs["start2"])
+            & (end - start <= self.lengths[scaffold] // 10)
+        )
+        scaffold, start, end = scaffold[keep], start[keep], end[keep]
+
+        window = np.searchsorted(
+            self.window_start, self.base[scaffold] + start, "right"
+        )
+        window -= 1
+        inside = window >= 0
+        window = np.maximum(window, 0)
+        inside &= (self.window_scaffold[window] == scaffold) & (
+            self.window_end[window] >= end + 1
+        )
+        return self.builder.add_spans(
+            self.track_id[scaffold[inside]], start[inside], end[inside]
+        )
+
+    def finish(self):
+        return self.builder.finish()
+
+
+def _max_subarrays(delta):
+    """
+    First and last index of the maximum sum subarray of each row, the first
+    one found by Kadane's algorithm. The best subarray ending at j starts at
+    the first minimum of the prefix sums up to j.
+    """
+    rows = np.arange(len(delta))
+    prefix = np.zeros((len(delta), delta.shape[1] + 1), dtype=np.int64)
+    np.cumsum(delta, axis=1, out=prefix[:, 1:])
+    low = np.minimum.accumulate(prefix[:, :-1], axis=1)
+    end = np.argmax(prefix[:, 1:] - low, axis=1)
+    start = np.argmax(prefix == low[rows, end][:, None], axis=1)
+    return start, end
+
+
+# JUNCTION_VOTES
+# input :
+#   track : CoverageTrack of the scaffold
+#   scaffold : name of the scaffold
+#   junction : position of the junction
+# output :
+#   number of divisors for which the junction is in the low coverage region
+def junction_votes(track, scaffold, junction):
+    """
+    The region of lowest coverage of the middle third of the window is the
+    maximum sum subarray of +1 for samples under average / divisor and -1 for
+    the others, it is found for all the divisors at once.
+    """
+    first, samples = track.window(scaffold, junction - WINDOW, junction + WINDOW)
+    if len(samples) < 3:
+        return 0
+    samples = samples.astype(np.int64) - track.point(
+        scaffold, restart_position(junction)
+    )
+    middle = samples[len(samples) // 3 : 2 * len(samples) // 3]
+    cutoff = samples.mean() / DIVISORS
+    delta = np.where(middle[None, :] < cutoff[:, None], 1, -1)
+    start, end = _max_subarrays(delta)
+
+    # the region is known to within a sample on each side
+    offset = first + len(samples) // 3
+    low = (offset + start) * track.bin_size - (track.bin_size - 1)
+    high = (offset + end) * track.bin_size + (track.bin_size - 1)
+    return int(np.sum((junction >= low) & (junction <= high)))
+
+
+# FIND_MISASSEMBLIES
+# input :
+#   store_dir : directory of the alignment store
+#   offsets_file : contig to scaffold table of the pairs, written by
+#                  layout_unitigs with the pairs inside a scaffold kept
+#   breakpoints_file : junctions of the scaffolds
+#   length_file : path to file with scaffolds length
+#   track_file : path of the coverage track to write
+#   bin_size : distance between two coverage samples
+# output :
+#   list of (scaffold, junctions, suspicious junctions), in the order of the
+#   breakpoints file
+def find_misassemblies(
+    store_dir,
+    offsets_file,
+    breakpoints_file,
+    length_file,
+    track_file,
+    bin_size=ct.BIN_SIZE,
+):
+    lengths = {}
+    with open(length_file, "r") as f:
+        for line in f:
+            attrs = line.split()
+            lengths[attrs[0]] = int(attrs[1])
+    junctions = load_junctions(breakpoints_file, lengths)
+    offsets = alst.load_scaffold_offsets(offsets_file)
+    coverage = JunctionCoverage(offsets["scaffold_names"], lengths, junctions, bin_size)
+
+    pairs = 0
+    if len(coverage.window_start) > 0:
+        for _, chunk in pair_cache.iter_pairs(store_dir, offsets):
+            pairs += coverage.add_pairs(chunk)
+    telemetry.count("junction_pairs", pairs)
+    ct.save_track(track_file, coverage.finish())
+    track = ct.load_track(track_file)
+
+    results = []
+    for scaffold, positions in junctions.items():
+        if scaffold not in track:
+            continue
+        suspicious = [
+            pos
+            for pos in positions
+            if junction_votes(track, scaffold, pos) >= MIN_VOTES
+        ]
+        results.append((scaffold, positions, suspicious))
+    telemetry.count("junctions", sum(len(x[1]) for x in results))
+    return results
+
+
+# WRITE_REPORT
+# input :
+#   report_file : path of the report to write
+#   results : list returned by find_misassemblies
+# output :
+#   report in the format of break_contigs, read by refactor_breaks
+def write_report(report_file, results):
+    total = sum(len(positions) for _, positions, _ in results)
+    suspicious = sum(len(found) for _, _, found in results)
+    with open(report_file, "w") as f:
+        for scaffold, _, found in results:
+            f.write(scaffold + "".join("\t" + str(x) for x in found) + "\n")
+        f.write("Total Joins = " + str(total) + "\n")
+        f.write("Suspicious Joins = " + str(suspicious) + "\n")
+        percent = suspicious * 100.0 / total if total > 0 else 0.0
+        f.write("Percent Suspicious Joins = " + str(percent) + "\n")
+    return suspicious
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Find the misassembled junctions of the scaffolds"
+    )
+    parser.add_argument("-s", "--store", help="Alignment store", required=True)
+    parser.add_argument(
+        "-t", "--offsets", help="Contig to scaffold table", required=True
+    )
+    parser.add_argument(
+        "-b", "--breakpoints", help="Junctions of the scaffolds", required=True
+    )
+    parser.add_argument("-l", "--lengths", help="Scaffold lengths", required=True)
+    parser.add_argument("-o", "--output", help="Report file", required=True)
+    parser.add_argument("-w", "--track", help="Coverage track to write", required=True)
+    parser.add_argument(
+        "-z",
+        "--bin",
+        help="Bases between two coverage samples, default = " + str(ct.BIN_SIZE),
+        required=False,
+        default=ct.BIN_SIZE,
+    )
+    args = parser.parse_args()
+
+    results = find_misassemblies(
+        args.store,
+        args.offsets,
+        args.breakpoints,
+        args.lengths,
+        args.track,
+        int(args.bin),
+    )
+    write_report(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
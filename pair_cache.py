@@ -0,0 +1,285 @@
+# ======================================================================#
+# Cache of Hi-C read pairs, built once per run
+# ======================================================================#
+
+import os
+import shutil
+import hashlib
+from functools import partial
+import numpy as np
+import alignment_store as alst
+import telemetry
+
+# ======================================================================#
+#                                ARGUMENTS
+# ======================================================================#
+
+# store_dir : directory of the alignment store, the pair table is written next
+#             to its columns
+# offsets : contig to scaffold table returned by
+#           alignment_store.load_scaffold_offsets
+
+# One record per pair of consecutive alignments of the same read. Fields are
+# laid out like the equivalent C struct, so that C++ tools can read the file.
+PAIR_DTYPE = np.dtype(
+    [
+        ("start1", np.int64),
+        ("end1", np.int64),
+        ("start2", np.int64),
+        ("end2", np.int64),
+        ("mid1", np.int64),
+        ("mid2", np.int64),
+        ("contig1", np.int32),
+        ("contig2", np.int32),
+        ("mate1", np.int8),
+        ("mate2", np.int8),
+    ],
+    align=True,
+)
+
+# Bumped whenever the store or pair table layout changes
+CACHE_VERSION = "1"
+
+PAIRS_FILE = "pairs.bin"
+FINGERPRINT_FILE = "fingerprint"
+
+# Bytes of an input read at a time by fingerprint
+READ_SIZE = 1 << 22
+
+# ======================================================================#
+#                                MODULES
+# ======================================================================#
+
+
+# FINGERPRINT
+# input :
+#   paths : list of input files
+# output :
+#   hexadecimal digest of the size and of the content of each file
+def fingerprint(paths) -> str:
+    """
+    Content fingerprint of the inputs of a cache, the files are hashed whole
+    by blocks.
+    """
+    digest = hashlib.sha1(CACHE_VERSION.encode())
+    for path in paths:
+        digest.update(str(os.path.getsize(path)).encode())
+        with open(path, "rb") as f:
+            for block in iter(partial(f.read, READ_SIZE), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+# STAMP
+# input :
+#   paths : list of input files
+# output :
+#   hexadecimal digest of the size, modification time and inode of each file
+def stamp(paths) -> str:
+    """
+    Fingerprint of the inputs of a cache which does not read them, for callers
+    which already check their content.
+    """
+    digest = hashlib.sha1(CACHE_VERSION.encode())
+    for path in paths:
+        info = os.stat(path)
+        digest.update(str((info.st_size, info.st_mtime_ns, info.st_ino)).encode())
+    return digest.hexdigest()
+
+
+# CACHE_IS_VALID
+# input :
+#   store_dir : directory of the alignment store
+#   key : fingerprint of the current inputs
+# output :
+#   True if the store and its pair table were built from the same inputs
+def cache_is_valid(store_dir, key) -> bool:
+    """
+    Check whether a previous run left a usable store and pair table.
+    """
+    path = store_dir + "/" + FINGERPRINT_FILE
+    if not os.path.isfile(path) or not os.path.isfile(store_dir + "/" + PAIRS_FILE):
+        return False
+    with open(path, "r") as f:
+        return f.read().strip() == key
+
+
+# BUILD_PAIR_CACHE
+# input :
+#   store_dir : directory of the alignment store
+#   chunk_size : number of alignments read at once
+# output :
+#   number of pairs written to the pair table
+def build_pair_cache(store_dir, chunk_size=alst.CHUNK_SIZE) -> int:
+    """
+    Pair consecutive alignments of the same read and save them as fixed-width
+    records. Pairs on the same contig are kept for misassembly detection.
+    """
+    _, columns = alst.load_alignment_store(store_dir)
+    total = len(columns["contig"])
+
+    count = 0
+    with open(store_dir + "/" + PAIRS_FILE, "wb") as output:
+        for start in range(0, total, chunk_size):
+            # Look one alignment ahead to pair the last mate of the chunk
+            stop = min(start + chunk_size + 1, total)
+            ids, starts, ends, reads, mates = (
+                np.asarray(columns[name][start:stop]) for name, _ in alst.COLUMNS
+            )
+            first = np.flatnonzero(reads[:-1] == reads[1:])
+            second = first + 1
+
+            pairs = np.zeros(len(first), dtype=PAIR_DTYPE)
+            pairs["contig1"] = ids[first]
+            pairs["contig2"] = ids[second]
+            pairs["start1"] = starts[first]
+            pairs["end1"] = ends[first]
+            pairs["start2"] = starts[second]
+            pairs["end2"] = ends[second]
+            pairs["mid1"] = (starts[first] + ends[first]) // 2
+            pairs["mid2"] = (starts[second] + ends[second]) // 2
+            pairs["mate1"] = mates[first]
+            pairs["mate2"] = mates[second]
+            pairs.tofile(output)
+            count += len(pairs)
+
+    return count
+
+
+# PREPARE_PAIR_CACHE
+# input :
+#   bed_file : bed file of alignments sorted by read names
+#   length_file : path to file with contigs length
+#   store_dir : directory of the alignment store
+#   check_content : False when the caller already checks the content of the
+#                   inputs, the store is then reused while their stamp holds
+# output :
+#   True if the store and the pair table were (re)built, False if the ones of
+#   a previous run were reused
+def prepare_pair_cache(bed_file, length_file, store_dir, check_content=True) -> bool:
+    """
+    Build the alignment store and the pair table unless they are up to date.
+    """
+    if check_content:
+        key = fingerprint([bed_file, length_file])
+    else:
+        key = stamp([bed_file, length_file])
+    if cache_is_valid(store_dir, key):
+        return False
+
+    # Everything in the store derives from the inputs, including the counts
+    # other modules keep there, and a build without fingerprint is never reused
+    if os.path.isdir(store_dir):
+        shutil.rmtree(store_dir)
+
+    telemetry.count(
+        "alignments", alst.build_alignment_store(bed_file, length_file, store_dir)
+    )
+    telemetry.count("pairs", build_pair_cache(store_dir))
+
+    with open(store_dir + "/" + FINGERPRINT_FILE, "w") as f:
+        f.write(key + "\n")
+    return True
+
+
+# LOAD_PAIR_CACHE
+# input :
+#   store_dir : directory of the alignment store
+# output :
+#   contig_names : list of contig names in id order
+#   pairs : memory-mapped array of PAIR_DTYPE records
+def load_pair_cache(store_dir):
+    """
+    Memory-map the pair table.
+    """
+    contig_names, _ = alst.load_alignment_store(store_dir)
+    path = store_dir + "/" + PAIRS_FILE
+    if os.path.getsize(path) == 0:
+        return contig_names, np.zeros(0, dtype=PAIR_DTYPE)
+    return contig_names, np.memmap(path, dtype=PAIR_DTYPE, mode="r")
+
+
+# ITER_PAIRS
+# input :
+#   store_dir : directory of the alignment store
+#   offsets : contig to scaffold table, or None for contigs
+#   chunk_size : number of pairs read at once
+#   start, stop : range of pairs to read, stop=None for the end
+# output :
+#   generator of (names, pairs) chunks, names being the list of contig or
+#   scaffold names indexed by the contig1/contig2 fields
+def iter_pairs(store_dir, offsets=None, chunk_size=alst.CHUNK_SIZE, start=0, stop=None):
+    """
+    Read the pair table, placed on scaffolds when a table is given. With a
+    table, only pairs of mate 1 followed by mate 2 with both contigs placed
+    are kept, and coordinates are shifted by the offsets of their contigs.
+    """
+    contig_names, pairs = load_pair_cache(store_dir)
+
+    if offsets is not None:
+        # Unknown contigs have id -1 and pick the last, unplaced, entry
+        scaffold = np.append(offsets["scaffold"], -1)
+        shift = np.append(offsets["offset"], 0)
+
+    if stop is None or stop > len(pairs):
+        stop = len(pairs)
+
+    for first in range(start, stop, chunk_size):
+        chunk = np.array(pairs[first : min(first + chunk_size, stop)])
+
+        if offsets is None:
+            yield contig_names, chunk
+            continue
+
+        scaffold1 = scaffold[chunk["contig1"]]
+        scaffold2 = scaffold[chunk["contig2"]]
+
+        keep = (
+            (chunk["mate1"] == 1)
+            & (chunk["mate2"] == 2)
+            & (scaffold1 >= 0)
+            & (scaffold2 >= 0)
+        )
+        if not offsets["intra"]:
+            keep &= (chunk["contig1"] != chunk["contig2"]) & (scaffold1 != scaffold2)
+
+        chunk = chunk[keep]
+        shift1 = shift[chunk["contig1"]]
+        shift2 = shift[chunk["contig2"]]
+        for field in ["start1", "end1", "mid1"]:
+            chunk[field] += shift1
+        for field in ["start2", "end2", "mid2"]:
+            chunk[field] += shift2
+        chunk["contig1"] = scaffold1[keep]
+        chunk["contig2"] = scaffold2[keep]
+
+        yield offsets["scaffold_names"], chunk
+
+
+# EXPORT_PAIRS
+# input :
+#   store_dir : directory of the alignment store
+#   offsets_file : contig to scaffold table, or "abc" for contigs
+#   outfile : path of the pair table to write, names are written to
+#             outfile + ".names"
+# output :
+#   pair table placed on scaffolds, for the C++ tools
+def export_pairs(store_dir, offsets_file, outfile):
+    """
+    Write the pairs placed on the current scaffolds as fixed-width records.
+    """
+    offsets = None
+    if offsets_file != "abc":
+        offsets = alst.load_scaffold_offsets(offsets_file)
+
+    with open(outfile, "wb") as output:
+        for _, chunk in iter_pairs(store_dir, offsets):
+            chunk.tofile(output)
+
+    if offsets is None:
+        names, _ = alst.load_alignment_store(store_dir)
+    else:
+        names = offsets["scaffold_names"]
+    with open(outfile + ".names", "w") as f:
+        for name in names:
+            f.write(name + "\n")
@@ -0,0 +1,340 @@
+# ======================================================================#
+# Stage graph of the scaffolding pipeline, with cached and resumable stages
+# ======================================================================#
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import threading
+import subprocess
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+import telemetry
+
+# ======================================================================#
+#                                ARGUMENTS
+# ======================================================================#
+
+# state_dir : directory of the manifest and of the copies of the files
+#             rewritten by the stages
+# inputs : files read by a stage
+# outputs : files written by a stage
+# updates : files read and rewritten in place by a stage, the graph keeps the
+#           version of their producer so that the stage can run again
+# params : parameters of a stage which change its outputs
+# report : telemetry.RunReport receiving the usage of each stage, None to run
+#          the stages without measuring them
+
+MANIFEST_FILE = "manifest.json"
+
+# Bytes of a file read at a time when hashing it
+READ_SIZE = 1 << 22
+
+# ======================================================================#
+#                                MODULES
+# ======================================================================#
+
+
+class Stage:
+    """
+    One step of the pipeline, run is called without arguments.
+    """
+
+    def __init__(
+        self,
+        name,
+        run,
+        inputs=(),
+        outputs=(),
+        updates=(),
+        params=None,
+        error=None,
+        fatal=True,
+    ):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.updates = list(updates)
+        self.params = params or {}
+        self.error = error or "Could not run stage " + name + "."
+        # a failed stage which is not fatal only prints its error
+        self.fatal = fatal
+        # stage producing each input, and all the stages to wait for
+        self.producers = {}
+        self.deps = set()
+
+
+class Pipeline:
+    """
+    Run the stages added to the graph as soon as the stages they depend on
+    are done, at most jobs at a time. A stage is skipped when its outputs were
+    written by a previous run from the same inputs and parameters.
+    """
+
+    def __init__(self, state_dir, jobs=1, report=None):
+        if not os.path.isdir(state_dir):
+            os.makedirs(state_dir)
+        self.state_dir = state_dir
+        self.manifest = {"stages": {}, "files": {}}
+        path = state_dir + "/" + MANIFEST_FILE
+        if os.path.isfile(path):
+            with open(path, "r") as f:
+                self.manifest = json.load(f)
+        self.stages = {}
+        self.status = {}
+        self.pending = []
+        self.failed = None
+        # last stage writing each path and stages reading it since then
+        self.producer = {}
+        self.readers = {}
+        # digest of the files hashed by device and inode, so that a file and
+        # the links to it are hashed once, with their size and modification time
+        self.hashes = {}
+        self.lock = threading.Condition()
+        self.pool = ThreadPoolExecutor(max_workers=max(1, jobs))
+        self.report = report
+
+    def add(self, stage):
+        """
+        Add a stage after the stages already in the graph.
+        """
+        if stage.name in self.stages:
+            raise ValueError("Stage " + stage.name + " is already in the graph")
+        for path in stage.inputs + stage.updates:
+            if path in self.producer:
+                stage.producers[path] = self.producer[path]
+                stage.deps.add(self.producer[path])
+        # files are only rewritten once the stages reading them are done
+        for path in stage.outputs + stage.updates:
+            stage.deps.update(self.readers.get(path, ()))
+            if path in self.producer:
+                stage.deps.add(self.producer[path])
+        stage.deps.discard(stage.name)
+        for path in stage.inputs:
+            self.readers.setdefault(path, set()).add(stage.name)
+        for path in stage.outputs + stage.updates:
+            self.producer[path] = stage.name
+            self.readers[path] = set()
+
+        with self.lock:
+            self.stages[stage.name] = stage
+            self.pending.append(stage)
+            self._submit_ready()
+
+    def wait(self, paths=None):
+        """
+        Wait for the stages producing paths, or for all the stages, and stop
+        the pipeline if one of them failed.
+        """
+        with self.lock:
+            if paths is None:
+                names = list(self.stages)
+            else:
+                names = [self.producer[p] for p in paths if p in self.producer]
+            while self.failed is None and any(
+                self.status.get(name) != "done" for name in names
+            ):
+                self.lock.wait()
+            failed = self.failed
+
+        if failed is not None:
+            stage, err = failed
+            print("ERROR : " + stage.error)
+            if isinstance(err, (subprocess.CalledProcessError, SystemExit)):
+                sys.exit(1)
+            raise err
+
+    def close(self):
+        """
+        Wait for all the stages and release the worker threads.
+        """
+        self.wait()
+        self.pool.shutdown()
+
+    def _submit_ready(self):
+        if self.failed is not None:
+            return
+        ready = [
+            stage
+            for stage in self.pending
+            if all(self.status.get(dep) == "done" for dep in stage.deps)
+        ]
+        for stage in ready:
+            self.pending.remove(stage)
+            self.status[stage.name] = "running"
+            future = self.pool.submit(self._execute, stage)
+            future.add_done_callback(partial(self._finish, stage))
+
+    def _finish(self, stage, future):
+        err = future.exception()
+        with self.lock:
+            if err is not None and stage.fatal:
+                self.status[stage.name] = "failed"
+                if self.failed is None:
+                    self.failed = (stage, err)
+            else:
+                if err is not None:
+                    print("ERROR : " + stage.error)
+                self.status[stage.name] = "done"
+            self._submit_ready()
+            self.lock.notify_all()
+
+    def _execute(self, stage):
+        key = self._key(stage)
+        if self._is_current(stage, key):
+            print("Stage " + stage.name + " is up to date.")
+            if self.report is not None:
+                self.report.skipped(stage)
+            return
+        self._restore_updates(stage)
+        if self.report is None:
+            stage.run()
+        else:
+            with self.report.measure(stage):
+                stage.run()
+
+        outputs = {}
+        for path in stage.outputs + stage.updates:
+            outputs[path] = self._hash(path)
+        with self.lock:
+            self.manifest["stages"][stage.name] = {"key": key, "outputs": outputs}
+            for path in outputs:
+                self.manifest["files"][path] = _file_state(path, stage.name)
+            self._save()
+
+    def _key(self, stage):
+        """
+        Hash of the stage parameters and of the content of its inputs, the
+        inputs produced by other stages are known from their record.
+        """
+        digest = hashlib.sha1(stage.name.encode())
+        digest.update(json.dumps(stage.params, sort_keys=True).encode())
+        for path in stage.inputs + stage.updates:
+            digest.update(path.encode())
+            if path in stage.producers:
+                with self.lock:
+                    record = self.manifest["stages"].get(stage.producers[path], {})
+                digest.update(record.get("outputs", {}).get(path, "").encode())
+                continue
+            digest.update(self._hash(path).encode())
+        return digest.hexdigest()
+
+    def _hash(self, path):
+        """
+        Digest of the whole content of a file, hashed again only when its size
+        or modification time changed.
+        """
+        info = os.stat(path)
+        state = [info.st_size, info.st_mtime_ns]
+        with self.lock:
+            known = self.hashes.get((info.st_dev, info.st_ino))
+        if known is not None and known[0] == state:
+            return known[1]
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(partial(f.read, READ_SIZE), b""):
+                digest.update(block)
+        with self.lock:
+            self.hashes[(info.st_dev, info.st_ino)] = (state, digest.hexdigest())
+        return digest.hexdigest()
+
+    def _is_current(self, stage, key):
+        with self.lock:
+            record = self.manifest["stages"].get(stage.name)
+            if record is None or record["key"] != key:
+                return False
+            for path in stage.outputs + stage.updates:
+                state = self.manifest["files"].get(path)
+                if state is None or not os.path.exists(path):
+                    return False
+                if state["stage"] == stage.name:
+                    if state != _file_state(path, stage.name):
+                        return False
+                # rewritten later, the version of this stage has to be kept
+                elif not os.path.isfile(self._copy_path(state["stage"], path)):
+                    return False
+        return True
+
+    def _restore_updates(self, stage):
+        """
+        Put back the version of their producer of the files the stage
+        rewrites, or keep a copy of it before the first run.
+        """
+        for path in stage.updates:
+            copy = self._copy_path(stage.name, path)
+            producer = stage.producers.get(path)
+            with self.lock:
+                state = self.manifest["files"].get(path)
+                record = self.manifest["stages"].get(producer, {})
+            if state is not None and state == _file_state(path, producer):
+                if not os.path.isdir(os.path.dirname(copy)):
+                    os.makedirs(os.path.dirname(copy))
+                shutil.copyfile(path, copy)
+            elif os.path.isfile(copy) and self._hash(copy) == record.get(
+                "outputs", {}
+            ).get(path):
+                shutil.copyfile(copy, path)
+            else:
+                print(
+                    "ERROR : "
+                    + path
+                    + " was changed outside of the pipeline, remove it to rerun "
+                    + stage.name
+                )
+                sys.exit(1)
+
+    def _copy_path(self, name, path):
+        return self.state_dir + "/" + name + "/" + os.path.basename(path)
+
+    def _save(self):
+        path = self.state_dir + "/" + MANIFEST_FILE
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+
+def _file_state(path, name):
+    info = os.stat(path)
+    return {"stage": name, "size": info.st_size, "mtime": info.st_mtime_ns}
+
+
+# RUN_COMMAND
+# input :
+#   argv : command and its arguments, run without a shell
+#   log : file where the command is written
+#   stdout : file receiving the standard output of the command
+# output :
+#   CalledProcessError is raised if the command fails or cannot be started
+def run_command(argv, log=None, stdout=None):
+    """
+    Run an external program of the pipeline.
+    """
+    if log is not None:
+        log.write(" ".join(argv) + (" > " + stdout if stdout else "") + "\n")
+    try:
+        if stdout is None:
+            status = telemetry.run_program(argv)
+        else:
+            with open(stdout, "w") as f:
+                status = telemetry.run_program(argv, f)
+    except OSError:
+        # missing program, reported like a failed one
+        raise subprocess.CalledProcessError(127, argv)
+    if status != 0:
+        raise subprocess.CalledProcessError(status, argv)
+
+
+# LINK
+# input :
+#   target : existing file
+#   path : symbolic link to create, replaced if it exists
+def link(target, path):
+    """
+    Point path to target.
+    """
+    if os.path.lexists(path):
+        os.remove(path)
+    os.symlink(os.path.abspath(target), path)
@@ -1,5 +1,7 @@
 import argparse
-import pickle
+import alignment_store as alst
+import scaffold_layout as sl
+import telemetry
 
 parser = argparse.ArgumentParser()
 parser.add_argument(
@@ -11,8 +13,8 @@ args = parser.parse_args()
 
 iteration = int(args.iteration)
 breakpoints = {}
-scaffolds_current = pickle.load(
-    open(args.directory + "/scaffolds_iteration_" + str(iteration - 1) + ".p", "r")
+scaffolds_current = sl.load_layout(
+    args.directory + "/scaffolds_iteration_" + str(iteration - 1) + ".layout"
 )
 
 with open(args.directory + "/misasm_iteration_" + args.iteration + ".report", "r") as f:
@@ -25,7 +27,7 @@ with open(args.directory + "/misasm_iteration_" + args.iteration + ".report", "r
             if len(attrs) < 2:
                 continue
             breakpoints[attrs[0]] = []
-            for i in xrange(1, len(attrs)):
+            for i in range(1, len(attrs)):
                 breakpoints[attrs[0]].append(int(attrs[i]))
         except:
             continue
@@ -123,87 +125,16 @@ def update_bed(expanded_scaffold):
              """
             scaffold_re[key] = (s_left, s_right)
 
-    o_lines = ""
-    count = 0
-    prev_line = ""
-    # print(contig2scaffold)
-    # sys.exit(1)
-    if True:
-        output = open(
-            args.directory + "/alignment_iteration_" + str(iteration) + ".bed", "w"
-        )
-        with open(args.directory + "/alignment_iteration_1.bed", "r") as f:
-            for line in f:
-                if prev_line == "":
-                    prev_line = line
-                    continue
-                else:
-                    prev_attrs = prev_line.split()
-                    curr_attrs = line.split()
-                    prev_contig = prev_attrs[0]
-                    curr_contig = curr_attrs[0]
-                    if prev_contig == curr_contig:
-                        continue
-                    prev_read = prev_attrs[3].split("/")[0]
-                    curr_read = curr_attrs[3].split("/")[0]
-                    first = prev_attrs[3].split("/")[1]
-                    second = curr_attrs[3].split("/")[1]
-                    if (
-                        prev_contig in contig2scaffold
-                        and curr_contig in contig2scaffold
-                    ):
-                        prev_scaffold = contig2scaffold[prev_contig]
-                        curr_scaffold = contig2scaffold[curr_contig]
-                        if (
-                            prev_read == curr_read
-                            and prev_scaffold != curr_scaffold
-                            and first == "1"
-                            and second == "2"
-                        ):
-                            # if prev_read == curr_read and first == '1' and second == '2':
-                            prev_info = contig2info[prev_contig]
-                            prev_start = int(prev_attrs[1])
-                            prev_end = int(prev_attrs[2])
-                            new_prev_start = prev_start + prev_info[0]
-                            new_prev_end = prev_end + prev_info[0]
-                            o_lines += (
-                                prev_scaffold
-                                + "\t"
-                                + str(new_prev_start)
-                                + "\t"
-                                + str(new_prev_end)
-                                + "\t"
-                                + prev_attrs[3]
-                                + "\n"
-                            )
-                            count += 1
-
-                            curr_info = contig2info[curr_contig]
-                            curr_start = int(curr_attrs[1])
-                            curr_end = int(curr_attrs[2])
-                            new_curr_start = curr_start + curr_info[0]
-                            new_curr_end = curr_end + curr_info[0]
-                            o_lines += (
-                                curr_scaffold
-                                + "\t"
-                                + str(new_curr_start)
-                                + "\t"
-                                + str(new_curr_end)
-                                + "\t"
-                                + curr_attrs[3]
-                                + "\n"
-                            )
-                            count += 1
-                            if count == 1000000:
-                                output.write(o_lines)
-                                count = 0
-                                o_lines = ""
-
-                prev_line = line
-
-            # write remaining lines
-            output.write(o_lines)
-            output.close()
+    # The alignments are not rewritten : the next stages place them on the
+    # scaffolds with this table when they read the alignment store
+    alst.write_scaffold_offsets(
+        args.directory + "/scaffold_offsets_iteration_" + str(iteration) + ".npz",
+        args.directory + "/alignments",
+        list(expanded_scaffold.keys()),
+        contig2scaffold,
+        contig2info,
+        intra=False,
+    )
     len_output = open(
         args.directory + "/scaffold_length_iteration_" + str(iteration), "w"
     )
@@ -238,10 +169,12 @@ for key in scaffolds_current:
         scaff_id += 1
     else:
         # print(key)
+        # the path is decoded from the layout once for all the slices below
+        path = scaffolds_current[key]
         cum_len = 0
         breaks_list = []
-        for i in range(1, len(scaffolds_current[key]), 2):
-            utg = scaffolds_current[key][i].split(":")[0]
+        for i in range(1, len(path), 2):
+            utg = path[i].split(":")[0]
             cum_len += unitig_length[utg]
             positions = breakpoints[key]
             # print(key, cum_len, positions)
@@ -252,13 +185,13 @@ for key in scaffolds_current:
                     break
         print(breaks_list)
         if len(breaks_list) == 0:
-            scaffolds_new["scaffold_" + str(scaff_id)] = scaffolds_current[key]
+            scaffolds_new["scaffold_" + str(scaff_id)] = path
             scaff_id += 1
             continue
         if len(breaks_list) == 1:
             # print('here')
-            first_part = scaffolds_current[key][: breaks_list[0] + 1]
-            second_part = scaffolds_current[key][breaks_list[0] + 1 :]
+            first_part = path[: breaks_list[0] + 1]
+            second_part = path[breaks_list[0] + 1 :]
             print("first part : " + str(first_part))
             print("second part : " + str(second_part))
             first_id = "scaffold_" + str(scaff_id)
@@ -275,12 +208,12 @@ for key in scaffolds_current:
             for i in range(len(breaks_list)):
                 if i == len(breaks_list) - 1:
                     print("start : " + str(prev) + "\tend : " + str(breaks_list[i] + 1))
-                    scaff = scaffolds_current[key][prev : breaks_list[i] + 1]
+                    scaff = path[prev : breaks_list[i] + 1]
                     print("part : " + str(scaff))
                     scaffolds_new["scaffold_" + str(scaff_id)] = scaff
                     scaff_id += 1
                     print("start : " + str(breaks_list[i] + 1))
-                    scaff = scaffolds_current[key][breaks_list[i] + 1 :]
+                    scaff = path[breaks_list[i] + 1 :]
                     print("part : " + str(scaff))
                     scaffolds_new["scaffold_" + str(scaff_id)] = scaff
                     avoid_file.write(
@@ -289,7 +222,7 @@ for key in scaffolds_current:
                     scaff_id += 1
                     continue
                 print("start = " + str(prev) + "\tend = " + str(breaks_list[i] + 1))
-                scaff = scaffolds_current[key][prev : breaks_list[i] + 1]
+                scaff = path[prev : breaks_list[i] + 1]
                 print("part : " + str(scaff))
                 prev = breaks_list[i] + 1
                 scaffolds_new["scaffold_" + str(scaff_id)] = scaff
@@ -303,13 +236,12 @@ for key in scaffolds_current:
                 scaff_id += 1
         print("=================")
 # print(scaffolds_new.keys())
-pickle.dump(
+scaffolds_written = sl.save_layout(
+    args.directory + "/scaffolds_iteration_" + str(int(args.iteration) - 1) + ".layout",
     scaffolds_new,
-    open(
-        args.directory + "/scaffolds_iteration_" + str(int(args.iteration) - 1) + ".p",
-        "w",
-    ),
+    unitig_length,
 )
+telemetry.count("scaffolds", scaffolds_written)
 update_bed(scaffolds_new)
 ofile = open(args.directory + "/misasm_" + args.iteration + ".DONE", "w")
 ofile.close()
@@ -1,12 +1,17 @@
 import os
 import argparse
 import sys
-import subprocess
-from subprocess import Popen, PIPE
+from functools import partial
 import seq_utils as sequ
 import digest
 import make_links
+import pair_cache
+import pipeline
 import fast_scaled_scores as fss
+import assembly_graph as ag
+import misassembly
+import coverage_track as ct
+import telemetry
 
 
 def check(path):
@@ -34,6 +39,216 @@ def NG50(lengths, sz=0):
             return contig_lengths[i]
 
 
+def add_link_stages(graph, args, iter_num, engine):
+    """
+    Count the links between the scaffolds of an iteration, scale and rank them.
+    Returns the path of the sorted links.
+    """
+    out = args.output
+    i = str(iter_num)
+    store = out + "/alignments"
+    links = out + "/contig_links_iteration_" + i
+    sorted_links = out + "/contig_links_scaled_sorted_iteration_" + i
+
+    inputs = [
+        store + "/" + pair_cache.FINGERPRINT_FILE,
+        out + "/re_counts_iteration_" + i,
+        out + "/scaffold_length_iteration_" + i,
+    ]
+    if args.dup != "abc":
+        inputs.append(args.dup)
+    avoid_data = "abc"
+    offsets_data = "abc"
+    if iter_num > 1:
+        avoid_data = out + "/links_avoid_iteration_" + i
+        offsets_data = out + "/scaffold_offsets_iteration_" + i + ".npz"
+        inputs += [avoid_data, offsets_data]
+        if engine == "incremental":
+            inputs.append(store + "/" + make_links.END_COUNTS_FILE)
+
+    graph.add(
+        pipeline.Stage(
+            "make_links_" + i,
+            partial(
+                make_links.make_contig_links,
+                mapping_data=store,
+                restrict_data=out + "/re_counts_iteration_" + i,
+                contig_len_data=out + "/scaffold_length_iteration_" + i,
+                iteration=iter_num,
+                contig_links_file=links,
+                dup_data=args.dup,
+                avoid_data=avoid_data,
+                offsets_data=offsets_data,
+                engine=engine,
+                workers=int(args.workers),
+            ),
+            inputs=inputs,
+            outputs=[links],
+            params={"engine": engine},
+        )
+    )
+
+    # now use Serge's code to calculate, the links are written by decreasing
+    # scaled score with a table read by the layout
+    graph.add(
+        pipeline.Stage(
+            "fast_scaled_scores_" + i,
+            partial(fss.fast_scaled_scores, infile=links, outfile=sorted_links),
+            inputs=[links],
+            outputs=[sorted_links, sorted_links + ".npz"],
+        )
+    )
+    return sorted_links
+
+
+def add_layout_stages(graph, args, iter_num, links, workdir, log):
+    """
+    Lay out the scaffolds of an iteration, then break them at the misassemblies
+    found by misassembly. The stages write the inputs of iteration + 1.
+    """
+    out = args.output
+    i = str(iter_num)
+    n = str(iter_num + 1)
+    store_key = out + "/alignments/" + pair_cache.FINGERPRINT_FILE
+    scaffolds = out + "/scaffolds_iteration_" + i + ".layout"
+    lengths = out + "/scaffold_length_iteration_" + n
+    re_counts = out + "/re_counts_iteration_" + n
+    offsets = out + "/scaffold_offsets_iteration_" + n + ".npz"
+    breakpoints = out + "/breakpoints_iteration_" + n + ".txt"
+    report = out + "/misasm_iteration_" + n + ".report"
+
+    inputs = [
+        links + ".npz",
+        out + "/scaffold_length_iteration_1",
+        out + "/scaffold_length_iteration_" + i,
+        out + "/re_counts_iteration_1",
+        store_key,
+    ]
+    if iter_num > 1:
+        inputs.append(out + "/scaffolds_iteration_" + str(iter_num - 1) + ".layout")
+    graph.add(
+        pipeline.Stage(
+            "layout_" + i,
+            partial(
+                pipeline.run_command,
+                [
+                    sys.executable,
+                    workdir + "/layout_unitigs.py",
+                    # layout_unitigs does not load the assembly graph, the
+                    # links were corrected with it by correct_links
+                    "-x",
+                    "abc",
+                    "-l",
+                    links,
+                    "-c",
+                    str(args.cutoff),
+                    "-i",
+                    i,
+                    "-d",
+                    out,
+                ],
+                log,
+            ),
+            inputs=inputs,
+            outputs=[scaffolds, lengths, re_counts, offsets, breakpoints],
+            params={"cutoff": str(args.cutoff)},
+            error="Could not run module layout_unitigs.",
+        )
+    )
+
+    graph.add(
+        pipeline.Stage(
+            "break_contigs_" + n,
+            partial(break_contigs, out, iter_num + 1),
+            inputs=[store_key, offsets, breakpoints, lengths],
+            outputs=[report, out + "/coverage_iteration_" + n + ".track"],
+            params={"bin_size": ct.BIN_SIZE, "track_version": ct.TRACK_VERSION},
+            error="Could not find the misassembled junctions.",
+        )
+    )
+
+    # refactor_breaks rewrites the scaffolds and tables written by the layout
+    graph.add(
+        pipeline.Stage(
+            "refactor_breaks_" + n,
+            partial(
+                pipeline.run_command,
+                [sys.executable, workdir + "/refactor_breaks.py", "-d", out, "-i", n],
+                log,
+                out + "/misasm_" + n + ".log",
+            ),
+            inputs=[
+                report,
+                out + "/scaffold_length_iteration_1",
+                out + "/re_counts_iteration_1",
+                store_key,
+            ],
+            outputs=[
+                out + "/links_avoid_iteration_" + n,
+                out + "/misasm_" + n + ".DONE",
+                out + "/misasm_" + n + ".log",
+            ],
+            updates=[scaffolds, lengths, re_counts, offsets],
+            error="Could not run module refactor_breaks.",
+        )
+    )
+
+
+def add_get_seq_stage(graph, args, iter_num, suffix, log):
+    """
+    Write the sequences and the agp file of the scaffolds of an iteration.
+    """
+    workdir = os.path.dirname(os.path.abspath(__file__))
+    prefix = args.output + "/scaffolds_" + suffix
+    scaffolds = args.output + "/scaffolds_iteration_" + str(iter_num) + ".layout"
+    cleaned = args.output + "/assembly.cleaned.fasta"
+    graph.add(
+        pipeline.Stage(
+            "get_seq_" + suffix,
+            partial(
+                pipeline.run_command,
+                [sys.executable, workdir + "/get_seq.py", "-a", cleaned]
+                + ["-f", prefix + ".fasta", "-g", prefix + ".agp", "-p", scaffolds],
+                log,
+            ),
+            inputs=[cleaned, scaffolds],
+            outputs=[prefix + ".fasta", prefix + ".agp"],
+            error="Could not run module get_seq to output scaffolds and gaps.",
+            fatal=suffix == "FINAL",
+        )
+    )
+
+
+def break_contigs(out, iter_num):
+    """
+    Find the misassembled junctions of the scaffolds from the pairs placed on
+    them.
+    """
+    i = str(iter_num)
+    results = misassembly.find_misassemblies(
+        out + "/alignments",
+        out + "/scaffold_offsets_iteration_" + i + ".npz",
+        out + "/breakpoints_iteration_" + i + ".txt",
+        out + "/scaffold_length_iteration_" + i,
+        out + "/coverage_iteration_" + i + ".track",
+    )
+    misassembly.write_report(out + "/misasm_iteration_" + i + ".report", results)
+
+
+def correct_links(workdir, index_file, links, log):
+    """
+    Check the links against the assembly graph and replace them, with their
+    table.
+    """
+    pipeline.run_command(
+        [workdir + "/correct_links", "-i", index_file, "-l", links],
+        log,
+        links + ".tmp",
+    )
+    os.replace(links + ".tmp", links)
+    fss.links_table_from_text(links)
+
+
 def main():
 
     workdir = os.path.dirname(os.path.abspath(__file__))
@@ -110,6 +325,40 @@ def main():
         required=False,
         default="no",
     )
+    parser.add_argument(
+        "-k",
+        "--incremental",
+        help="Set this option to 'yes' to compute the links of iterations 2..N "
+        "from the contact counts of the first iteration instead of the alignments. "
+        "The links are approximate : the pairs in the 1/64 of a contig spanning "
+        "the middle of a scaffold can be counted on the wrong scaffold end, about "
+        "0.3%% of the pairs on synthetic data, so the scaffolds can differ",
+        required=False,
+        default="no",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        help="Number of processes used to digest the genome and count links, "
+        "default = 1",
+        required=False,
+        default=1,
+    )
+    parser.add_argument(
+        "-q",
+        "--profile",
+        help="Set this option to 'yes' to run the stages under cProfile, the "
+        "statistics are written to the profiles folder of the output",
+        required=False,
+        default="no",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of pipeline stages run at the same time, default = 2",
+        required=False,
+        default=2,
+    )
 
     # CURRENTLY NOT USED
     # parser.add_argument('-u', '--unitigs',
@@ -149,322 +398,225 @@ def main():
 
     log = open(args.output + "/commands.log", "w", 1)
 
+    # Every step below is a stage of a graph and starts as soon as the stages
+    # writing its inputs are done. Stages are cached by the hash of their inputs
+    # and parameters, a rerun in the same directory resumes after the last
+    # stage which completed.
+    # The usage of every stage is appended to run_report.jsonl
+    profiles = args.output + "/profiles" if args.profile == "yes" else None
+    report = telemetry.RunReport(args.output + "/run_report.jsonl", profiles)
+    graph = pipeline.Pipeline(args.output + "/stages", int(args.jobs), report)
+
+    workers = int(args.workers)
+    out = args.output
+    assembly = args.assembly
+    lengths = out + "/scaffold_length_iteration_1"
+    names = out + "/contig_names.txt"
+    bed = out + "/alignment_iteration_1.bed"
+    cleaned = out + "/assembly.cleaned.fasta"
+    store = out + "/alignments"
+
     # ----------------------- Generate length file -------------------------------#
 
-    sequ.make_seq_length_file(
-        assembly=args.assembly,
-        output_file=args.output + "/scaffold_length_iteration_1",
-        namelist_file=args.output + "/contig_names.txt",
+    graph.add(
+        pipeline.Stage(
+            "lengths",
+            partial(
+                sequ.make_seq_length_file,
+                assembly=args.assembly,
+                output_file=lengths,
+                namelist_file=names,
+            ),
+            inputs=[args.assembly],
+            outputs=[lengths, names],
+        )
     )
 
     # ----------------------- Filtering bed file ---------------------------------#
 
     if args.filter == "yes":
         # filter Hi-C reads for contigs present in the assembly
-        os.system(
-            "grep -f "
-            + args.output
-            + "/contig_names.txt -w  "
-            + args.bed
-            + " > "
-            + args.output
-            + "/alignment_iteration_1.bed"
+        filter_bed = partial(
+            pipeline.run_command,
+            [workdir + "/filter_bed", "-n", names, "-b", args.bed]
+            + ["-t", str(workers)],
+            log,
+            bed,
         )
+        inputs = [args.bed, names]
     else:
-        os.symlink(
-            os.path.abspath(args.bed), args.output + "/alignment_iteration_1.bed"
+        filter_bed = partial(pipeline.link, args.bed, bed)
+        inputs = [args.bed]
+    graph.add(
+        pipeline.Stage(
+            "filter",
+            filter_bed,
+            inputs=inputs,
+            outputs=[bed],
+            params={"filter": args.filter},
+            error="Could not filter the Hi-C data bed file.",
         )
-
-    os.system(
-        "ln -s "
-        + os.path.abspath(args.assembly)
-        + " "
-        + args.output
-        + "/assembly.cleaned.fasta"
     )
 
     # ----------------------- FIND MISASSEMBLIES ---------------------------------#
 
     if args.clean == "yes":
-
-        cmd = (
-            workdir
-            + "/break_contigs_start -a "
-            + args.output
-            + "/alignment_iteration_1.bed -l "
-            + args.output
-            + "/scaffold_length_iteration_1 > "
-            + args.output
-            + "/input_breaks -s 100"
+        graph.add(
+            pipeline.Stage(
+                "break_contigs_start",
+                partial(
+                    pipeline.run_command,
+                    [workdir + "/break_contigs_start", "-a", bed, "-l", lengths]
+                    + ["-s", "100", "-z", str(ct.BIN_SIZE)],
+                    log,
+                    out + "/input_breaks",
+                ),
+                inputs=[bed, lengths],
+                outputs=[out + "/input_breaks"],
+                params={"bin_size": ct.BIN_SIZE},
+                error="Could not run break_contigs_start to detect misassemblies."
+                " Will continue without detecting misassemblies.",
+                fatal=False,
+            )
         )
-        log.write(cmd)
-        try:
-            subprocess.check_output(cmd, shell=True)
-        except subprocess.CalledProcessError as err:
-            print(
-                "ERROR : Could not run break_contigs_start to detect misassemblies."
-                " Will continue without detecting misassemblies."
+        # correct.py rewrites the length file for the broken contigs
+        graph.add(
+            pipeline.Stage(
+                "correct",
+                partial(
+                    pipeline.run_command,
+                    [sys.executable, workdir + "/correct.py", args.assembly]
+                    + [out + "/input_breaks", bed, out],
+                    log,
+                ),
+                inputs=[args.assembly, out + "/input_breaks", bed],
+                outputs=[out + "/alignment_iteration_1.tmp.bed"]
+                + [out + "/asm.cleaned.fasta"],
+                updates=[lengths],
+                error="Could not run module 'correct'.",
             )
-
-        cmd = (
-            "python "
-            + workdir
-            + "/correct.py  "
-            + args.assembly
-            + " "
-            + args.output
-            + "/input_breaks "
-            + args.output
-            + "/alignment_iteration_1.bed "
-            + args.output
         )
-        log.write(cmd)
-        try:
-            p = subprocess.check_output(cmd, shell=True)
-        except subprocess.CalledProcessError as err:
-            print("Could not run module 'correct.'")
-            sys.exit(1)
-
-        os.system(
-            "mv "
-            + args.output
-            + "/alignment_iteration_1.tmp.bed "
-            + args.output
-            + "/alignment_iteration_1.bed"
+        bed = out + "/alignment_iteration_1.tmp.bed"
+        assembly = out + "/asm.cleaned.fasta"
+
+    graph.add(
+        pipeline.Stage(
+            "assembly",
+            partial(pipeline.link, assembly, cleaned),
+            inputs=[assembly],
+            outputs=[cleaned],
+        )
+    )
+
+    # ----------------------- PAIR CACHE ----------------------------------------#
+    # Convert the bed file and pair its mates once, later iterations only place
+    # the pairs on the scaffolds through the scaffold_offsets_iteration_N.npz
+    # tables.
+
+    graph.add(
+        pipeline.Stage(
+            "pair_cache",
+            partial(
+                pair_cache.prepare_pair_cache,
+                bed_file=bed,
+                length_file=lengths,
+                store_dir=store,
+                # the stage key already covers the content of the bed file
+                check_content=False,
+            ),
+            inputs=[bed, lengths],
+            outputs=[store + "/" + pair_cache.FINGERPRINT_FILE],
         )
-        os.system(
-            "mv "
-            + args.output
-            + "/asm.cleaned.fasta "
-            + args.output
-            + "/assembly.cleaned.fasta"
+    )
+
+    # Iterations 2..N only regroup the contact counts between contig bins
+    links_engine = "chunked"
+    if args.incremental == "yes":
+        links_engine = "incremental"
+        graph.add(
+            pipeline.Stage(
+                "count_contig_ends",
+                partial(
+                    make_links.count_contig_ends,
+                    store_dir=store,
+                    contig_len_data=lengths,
+                ),
+                inputs=[store + "/" + pair_cache.FINGERPRINT_FILE, lengths],
+                outputs=[store + "/" + make_links.END_COUNTS_FILE],
+            )
         )
 
-    print("Digesting genome.")
     # ------------- GET RESTRICTION ENZYME CUTTING SITES ---------------#
 
-    digest.generate_digested_fragments(
-        assembly=args.output + "/assembly.cleaned.fasta",
-        enzyme=args.enzyme,
-        outname=args.output + "/re_counts_iteration_" + str(iter_num),
+    graph.add(
+        pipeline.Stage(
+            "digest",
+            partial(
+                digest.generate_digested_fragments,
+                assembly=cleaned,
+                enzyme=args.enzyme,
+                outname=out + "/re_counts_iteration_1",
+                workers=workers,
+            ),
+            inputs=[cleaned],
+            outputs=[out + "/re_counts_iteration_1"],
+            params={"enzyme": args.enzyme},
+        )
     )
 
     # ------------- MAKE LINKS -----------------------------------------#
 
     print("Starting iteration {0}".format(iter_num))
 
-    make_links.make_contig_links(
-        mapping_data=args.output + "/alignment_iteration_" + str(iter_num) + ".bed",
-        restrict_data=args.output + "/re_counts_iteration_" + str(iter_num),
-        contig_len_data=args.output + "/scaffold_length_iteration_" + str(iter_num),
-        iteration=iter_num,
-        contig_links_file=args.output + "/contig_links_iteration_" + str(iter_num),
-        dup_data=args.dup,
-    )
-
-    # ------------- FAST SCALED SCORES ---------------------------------#
+    links = add_link_stages(graph, args, iter_num, "chunked")
 
-    # now use Serge's code to calculate
+    # ------------- LOAD GFA -------------------------------------------#
 
-    fss.fast_scaled_scores(
-        infile=args.output + "/contig_links_iteration_" + str(iter_num),
-        outfile=args.output + "/contig_links_scaled_iteration_" + str(iter_num),
-    )
-
-    # ------------- SORT LINKS -----------------------------------------#
-    # Sort the links by column 5
-    if not os.path.isfile(
-        args.output + "/contig_links_scaled_sorted_iteration_" + str(iter_num)
-    ):
-        try:
-            cmd = (
-                "sort -k 5 -gr "
-                + args.output
-                + "/contig_links_scaled_iteration_"
-                + str(iter_num)
-                + " > "
-                + args.output
-                + "/contig_links_scaled_sorted_iteration_"
-                + str(iter_num)
-            )
-            log.write(cmd + "\n")
-
-            p = subprocess.check_output(cmd, shell=True)
-        except subprocess.CalledProcessError as err:
-            if os.path.isfile(
-                args.output + "/contig_links_scaled_sorted_iteration_" + str(iter_num)
-            ):
-                os.system(
-                    "rm "
-                    + args.output
-                    + "/contig_links_scaled_sorted_iteration_"
-                    + str(iter_num)
-                )
-            print("ERROR : Could not run sort.")
-            sys.exit(1)
-
-            # ------------- LOAD GFA -------------------------------------------#
-    if args.gfa != "abc" and not os.path.isfile(args.output + "/tmp.links"):
-        try:
-            cmd = (
-                workdir
-                + "/correct_links -g "
-                + args.gfa
-                + " -l "
-                + args.output
-                + "/contig_links_scaled_sorted_iteration_1 > "
-                + args.output
-                + "/tmp.links"
+    if args.gfa != "abc":
+        # the GFA file is parsed once, every later run maps its graph index
+        index_file = out + "/" + ag.INDEX_FILE
+        graph.add(
+            pipeline.Stage(
+                "graph_index",
+                partial(ag.build_graph_index, args.gfa, index_file),
+                inputs=[args.gfa],
+                outputs=[index_file, index_file + ".names"],
+                error="Could not build the assembly graph index.",
             )
-            log.write(cmd + "\n")
-            p = subprocess.check_output(cmd, shell=True)
-        except subprocess.CalledProcessError as err:
-            print("ERROR : Could not run correct_links.")
-            sys.exit(1)
-
-        os.system(
-            "mv "
-            + args.output
-            + "/tmp.links "
-            + args.output
-            + "/contig_links_scaled_sorted_iteration_1"
         )
-
-        # ------------- LAYOUT UNITIGS -------------------------------------#
-    if not os.path.isfile(args.output + "/scaffolds_iteration_1.p"):
-        try:
-            cmd = (
-                "python "
-                + workdir
-                + "/layout_unitigs.py -x "
-                + args.gfa
-                + " -l "
-                + args.output
-                + "/contig_links_scaled_sorted_iteration_"
-                + str(iter_num)
-                + " -c "
-                + str(args.cutoff)
-                + " -i 1 -d "
-                + args.output
-            )
-            log.write(cmd + "\n")
-
-            p = subprocess.check_output(cmd, shell=True)
-        except subprocess.CalledProcessError as err:
-            if os.path.isfile(args.output + "scaffolds_iteration_1.p"):
-                os.system("rm " + args.output + "scaffolds_iteration_1.p")
-            print("ERROR : Could not run module layout_unitigs.")
-            sys.exit(1)
-
-            # ------------- BREAK CONTIGS --------------------------------------#
-    if not os.path.isfile(
-        args.output + "/misasm_iteration_" + str(iter_num + 1) + ".report"
-    ):
-        try:
-            cmd = (
-                workdir
-                + "/break_contigs -a "
-                + args.output
-                + "/alignment_iteration_"
-                + str(iter_num + 1)
-                + ".bed -b "
-                + args.output
-                + "/breakpoints_iteration_"
-                + str(iter_num + 1)
-                + ".txt -l "
-                + args.output
-                + "/scaffold_length_iteration_"
-                + str(iter_num + 1)
-                + " -i "
-                + str(iter_num + 1)
-                + " -s 100   > "
-                + args.output
-                + "/misasm_iteration_"
-                + str(iter_num + 1)
-                + ".report"
+        graph.add(
+            pipeline.Stage(
+                "correct_links",
+                partial(correct_links, workdir, index_file, links, log),
+                inputs=[index_file, index_file + ".names"],
+                updates=[links, links + ".npz"],
+                error="Could not run correct_links.",
             )
-            p = subprocess.check_output(cmd, shell=True)
-
-            log.write(cmd + "\n")
-        except subprocess.CalledProcessError as err:
-            print("ERROR : Could not run break_contigs.")
-            sys.exit(1)
-
-            # ------------- REFACTOR BREAKS ------------------------------------#
-    if not os.path.isfile(args.output + "/misasm_" + str(iter_num + 1) + ".DONE"):
-        cmd = (
-            "python "
-            + workdir
-            + "/refactor_breaks.py -d "
-            + args.output
-            + " -i "
-            + str(iter_num + 1)
         )
-        try:
-            p = subprocess.check_output(cmd, shell=True)
 
-            log.write(cmd + "\n")
-        except subprocess.CalledProcessError as err:
-            print("ERROR : Could not run module refactor_breaks.")
-            sys.exit(1)
+    # ------------- LAYOUT UNITIGS AND BREAK CONTIGS -------------------#
 
-            # if it is required to output scaffolds and gaps at each iteration
+    add_layout_stages(graph, args, iter_num, links, workdir, log)
+
+    # if it is required to output scaffolds and gaps at each iteration
     if args.prnt == "yes":
-        cmd = (
-            "python "
-            + workdir
-            + "/get_seq.py -a "
-            + args.output
-            + "/assembly.cleaned.fasta -f "
-            + args.output
-            + "/scaffolds_ITERATION_"
-            + str(iter_num)
-            + ".fasta -g "
-            + args.output
-            + "/scaffolds_ITERATION_"
-            + str(iter_num)
-            + ".agp -p "
-            + args.output
-            + "/scaffolds_iteration_"
-            + str(iter_num)
-            + ".p"
-        )
-        log.write(cmd + "\n")
-        try:
-            p = subprocess.check_output(cmd, shell=True)
-        except subprocess.CalledProcessError as err:
-            print(
-                "ERROR : Could not run module get_seq to output " "scaffolds and gaps."
-            )
+        add_get_seq_stage(graph, args, iter_num, "ITERATION_" + str(iter_num), log)
 
     iter_num += 1
 
     scaffold_length = {}
 
-    with open(args.output + "/scaffold_length_iteration_" + str(iter_num), "r") as f:
+    lengths = out + "/scaffold_length_iteration_" + str(iter_num)
+    graph.wait([lengths])
+    with open(lengths, "r") as f:
         for line in f:
             attrs = line.split()
             scaffold_length[attrs[0]] = int(attrs[1])
         ng50.append(NG50(scaffold_length, genome_size))
 
     if iter_num - 1 == int(args.iter):
-        cmd = (
-            "python "
-            + workdir
-            + "/get_seq.py -a "
-            + args.output
-            + "/assembly.cleaned.fasta -f "
-            + args.output
-            + "/scaffolds_FINAL.fasta -g "
-            + args.output
-            + "/scaffolds_FINAL.agp -p "
-            + args.output
-            + "/scaffolds_iteration_"
-            + str(args.iter)
-            + ".p"
-        )
-        log.write(cmd + "\n")
-        os.system(cmd)
+        add_get_seq_stage(graph, args, int(args.iter), "FINAL", log)
+        graph.close()
         sys.exit(0)
 
         # now do iterative
@@ -472,178 +624,25 @@ def main():
 
         print("... Starting iteration {0}".format(iter_num))
 
-        make_links.make_contig_links(
-            mapping_data=args.output + "/alignment_iteration_" + str(iter_num) + ".bed",
-            restrict_data=args.output + "/re_counts_iteration_" + str(iter_num),
-            contig_len_data=args.output + "/scaffold_length_iteration_" + str(iter_num),
-            iteration=iter_num,
-            contig_links_file=args.output + "/contig_links_iteration_" + str(iter_num),
-            dup_data=args.dup,
-        )
-
-        fss.fast_scaled_scores(
-            infile=args.output + "/contig_links_iteration_" + str(iter_num),
-            outfile=args.output + "/contig_links_scaled_iteration_" + str(iter_num),
-        )
+        links = add_link_stages(graph, args, iter_num, links_engine)
 
-        if not os.path.isfile(
-            args.output + "/contig_links_scaled_sorted_iteration_" + str(iter_num)
-        ):
-            try:
-                cmd = (
-                    "sort -k 5 -gr "
-                    + args.output
-                    + "/contig_links_scaled_iteration_"
-                    + str(iter_num)
-                    + " > "
-                    + args.output
-                    + "/contig_links_scaled_sorted_iteration_"
-                    + str(iter_num)
-                )
-                log.write(cmd + "\n")
-                p = subprocess.check_output(cmd, shell=True)
-            except subprocess.CalledProcessError as err:
-                if os.path.isfile(
-                    args.output + "/new_links_scaled_sorted_iteration_" + str(iter_num)
-                ):
-                    os.system(
-                        "rm "
-                        + args.output
-                        + "/new_links_scaled_sorted_iteration_"
-                        + str(iter_num)
-                    )
-                print("ERROR : Could not run sort.")
-                sys.exit(1)
-
-                # NOW check if any useful link here
-        if check(
-            args.output + "/contig_links_scaled_sorted_iteration_" + str(iter_num)
-        ):
+        # NOW check if any useful link here
+        graph.wait([links])
+        if check(links):
             # FOR FUCK SAKE, WHO THOUGHT THIS WAS A GOOD IDEA ???
             print("No more useful links to use :/ ")
             break
 
-        if not os.path.isfile(
-            args.output + "/scaffolds_iteration_" + str(iter_num) + ".p"
-        ):
-            try:
-                cmd = (
-                    "python "
-                    + workdir
-                    + "/layout_unitigs.py -x abc -l "
-                    + args.output
-                    + "/contig_links_scaled_sorted_iteration_"
-                    + str(iter_num)
-                    + " -c "
-                    + str(args.cutoff)
-                    + " -i "
-                    + str(iter_num)
-                    + " -d "
-                    + args.output
-                )
-                log.write(cmd + "\n")
-                p = subprocess.check_output(cmd, shell=True)
-            except subprocess.CalledProcessError as err:
-                if os.path.isfile(
-                    args.output + "scaffolds_iteration_" + str(iter_num) + ".p"
-                ):
-                    os.system(
-                        "rm "
-                        + args.output
-                        + "scaffolds_iteration_"
-                        + str(iter_num)
-                        + ".p"
-                    )
-                print("ERROR : Could not run module layout_unitigs.")
-                sys.exit(1)
-
-        if not os.path.isfile(
-            args.output + "/misasm_iteration_" + str(iter_num + 1) + ".report"
-        ):
-            try:
-                cmd = (
-                    workdir
-                    + "/break_contigs -a "
-                    + args.output
-                    + "/alignment_iteration_"
-                    + str(iter_num + 1)
-                    + ".bed -b "
-                    + args.output
-                    + "/breakpoints_iteration_"
-                    + str(iter_num + 1)
-                    + ".txt -l "
-                    + args.output
-                    + "/scaffold_length_iteration_"
-                    + str(iter_num + 1)
-                    + " -i "
-                    + str(iter_num + 1)
-                    + " -s 100  > "
-                    + args.output
-                    + "/misasm_iteration_"
-                    + str(iter_num + 1)
-                    + ".report"
-                )
-                log.write(cmd + "\n")
-                p = subprocess.check_output(cmd, shell=True)
-            except subprocess.CalledProcessError as err:
-                print("ERROR : Could not run break_contigs.")
-                sys.exit(1)
-
-        if not os.path.isfile(args.output + "/misasm_" + str(iter_num + 1) + ".DONE"):
-            cmd = (
-                "python "
-                + workdir
-                + "/refactor_breaks.py -d "
-                + args.output
-                + " -i "
-                + str(iter_num + 1)
-                + " > "
-                + args.output
-                + "/misasm_"
-                + str(iter_num + 1)
-                + ".log"
-            )
-            try:
-                log.write(cmd + "\n")
-                p = subprocess.check_output(cmd, shell=True)
-            except subprocess.CalledProcessError as err:
-                print("ERROR : Could not run module refactor_breaks.")
-                sys.exit(1)
+        add_layout_stages(graph, args, iter_num, links, workdir, log)
 
         if args.prnt == "yes":
-            cmd = (
-                "python "
-                + workdir
-                + "/get_seq.py -a "
-                + args.output
-                + "/assembly.cleaned.fasta -f "
-                + args.output
-                + "/scaffolds_ITERATION_"
-                + str(iter_num)
-                + ".fasta -g "
-                + args.output
-                + "/scaffolds_ITERATION_"
-                + str(iter_num)
-                + ".agp -p "
-                + args.output
-                + "/scaffolds_iteration_"
-                + str(iter_num)
-                + ".p"
-            )
-            log.write(cmd + "\n")
-            try:
-                p = subprocess.check_output(cmd, shell=True)
-            except subprocess.CalledProcessError as err:
-                print(
-                    "ERROR : Could not run module get_seq to output "
-                    "scaffolds and gaps."
-                )
+            add_get_seq_stage(graph, args, iter_num, "ITERATION_" + str(iter_num), log)
 
         scaffold_length = {}
 
-        with open(
-            args.output + "/scaffold_length_iteration_" + str(iter_num + 1), "r"
-        ) as f:
+        lengths = out + "/scaffold_length_iteration_" + str(iter_num + 1)
+        graph.wait([lengths])
+        with open(lengths, "r") as f:
             for line in f:
                 attrs = line.split()
                 scaffold_length[attrs[0]] = int(attrs[1])
@@ -651,47 +650,18 @@ def main():
             curr_sz = len(ng50)
 
             if ng50[curr_sz - 1] == ng50[curr_sz - 2]:
-                cmd = (
-                    "python "
-                    + workdir
-                    + "/get_seq.py -a "
-                    + args.output
-                    + "/assembly.cleaned.fasta -f "
-                    + args.output
-                    + "/scaffolds_FINAL.fasta -g "
-                    + args.output
-                    + "/scaffolds_FINAL.agp -p "
-                    + args.output
-                    + "/scaffolds_iteration_"
-                    + str(iter_num - 1)
-                    + ".p"
-                )
-                log.write(cmd + "\n")
-                os.system(cmd)
+                add_get_seq_stage(graph, args, iter_num - 1, "FINAL", log)
+                graph.close()
                 sys.exit(0)
 
         if iter_num - 1 == int(args.iter):
-            cmd = (
-                "python "
-                + workdir
-                + "/get_seq.py -a "
-                + args.output
-                + "/assembly.cleaned.fasta -f "
-                + args.output
-                + "/scaffolds_FINAL.fasta -g "
-                + args.output
-                + "/scaffolds_FINAL.agp -p "
-                + args.output
-                + "/scaffolds_iteration_"
-                + str(args.iter)
-                + ".p"
-            )
-            log.write(cmd + "\n")
-            os.system(cmd)
+            add_get_seq_stage(graph, args, int(args.iter), "FINAL", log)
+            graph.close()
             sys.exit(0)
 
         iter_num += 1
 
+    graph.close()
     log.close()
 
 
@@ -0,0 +1,211 @@
+# ======================================================================#
+# Layout graph of the greedy scaffolding, on arrays of contig ends, and
+# index of the scaffolds small contigs are inserted in
+# ======================================================================#
+
+# ======================================================================#
+#                                ARGUMENTS
+# ======================================================================#
+
+# end : name of a contig end, contig + ":B" or contig + ":E"
+# mate : end of another contig joined to an end by a link, at most one
+# twin : other end of the same contig, joined once the contig is laid out
+
+# Spacing of the order labels of the ends of a scaffold
+LABEL_GAP = 1 << 32
+
+# ======================================================================#
+#                                MODULES
+# ======================================================================#
+
+
+class EndMatching:
+    """
+    Contig ends joined by links of degree at most one per end and by the
+    implicit edge of each contig, so that every connected component is a path
+    or a cycle. Ends are numbered in the order they are added, like the nodes
+    of the networkx graph this replaces, and components are found with a
+    union-find instead of a graph traversal.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self.mate = []
+        self.twin = []
+        self.parent = []
+        self.links = 0
+        self.contigs = 0
+
+    def _end_id(self, end):
+        """
+        Id of an end, added with no edge if it is new.
+        """
+        idx = self.ids.get(end)
+        if idx is None:
+            idx = len(self.names)
+            self.ids[end] = idx
+            self.names.append(end)
+            self.mate.append(-1)
+            self.twin.append(-1)
+            self.parent.append(idx)
+        return idx
+
+    def _find(self, idx):
+        parent = self.parent
+        while parent[idx] != idx:
+            parent[idx] = parent[parent[idx]]
+            idx = parent[idx]
+        return idx
+
+    def _union(self, a, b):
+        a = self._find(a)
+        b = self._find(b)
+        # the root is the first end added, which orders the components
+        if a < b:
+            self.parent[b] = a
+        elif b < a:
+            self.parent[a] = b
+
+    def is_free(self, end):
+        """
+        True if no link was added to the end yet.
+        """
+        idx = self.ids.get(end)
+        return idx is None or self.mate[idx] == -1
+
+    def add_link(self, end1, end2):
+        """
+        Join two free ends of different contigs.
+        """
+        a = self._end_id(end1)
+        b = self._end_id(end2)
+        if self.mate[a] != -1 or self.mate[b] != -1:
+            raise ValueError("Link " + end1 + " " + end2 + " joins a used end")
+        self.mate[a] = b
+        self.mate[b] = a
+        self._union(a, b)
+        self.links += 1
+
+    def add_contig(self, contig):
+        """
+        Join the two ends of a contig.
+        """
+        a = self._end_id(contig + ":B")
+        b = self._end_id(contig + ":E")
+        if self.twin[a] == -1:
+            self.twin[a] = b
+            self.twin[b] = a
+            self._union(a, b)
+            self.contigs += 1
+
+    def number_of_nodes(self):
+        return len(self.names)
+
+    def number_of_edges(self):
+        return self.links + self.contigs
+
+    def degree(self, idx):
+        return (self.mate[idx] != -1) + (self.twin[idx] != -1)
+
+    def components(self):
+        """
+        Ids of the ends of each connected component, components and ends
+        in the order the ends were added.
+        """
+        groups = {}
+        for idx in range(len(self.names)):
+            groups.setdefault(self._find(idx), []).append(idx)
+        return list(groups.values())
+
+    def path(self, component):
+        """
+        Names of the ends of a component from its first end of degree one to
+        the other one, None if the component is not a path.
+        """
+        tips = [idx for idx in component if self.degree(idx) == 1]
+        if len(tips) != 2:
+            return None
+        path = []
+        prev = -1
+        idx = tips[0]
+        while idx != -1:
+            path.append(self.names[idx])
+            step = self.twin[idx] if self.twin[idx] != prev else self.mate[idx]
+            prev, idx = idx, step
+        return path
+
+    def ends(self, component):
+        return [self.names[idx] for idx in component]
+
+
+class ScaffoldIndex:
+    """
+    Scaffold and position of the contig ends of a set of scaffolds. Each
+    scaffold is a linked list of ends with increasing order labels, so that a
+    contig can be inserted between two ends in constant time and ends can
+    still be compared by position.
+    """
+
+    def __init__(self, scaffolds):
+        self.scaffold = {}
+        self.label = {}
+        self.next = {}
+        self.first = {}
+        # ends closing a contig, at odd positions of their path
+        self.closing = set()
+        for key in scaffolds:
+            path = scaffolds[key]
+            if not path:
+                continue
+            self.first[key] = path[0]
+            for i, end in enumerate(path):
+                self.scaffold[end] = key
+                self.next[end] = path[i + 1] if i + 1 < len(path) else None
+                if i % 2 == 1:
+                    self.closing.add(end)
+            self._relabel(key)
+
+    def _relabel(self, key):
+        label = 0
+        end = self.first[key]
+        while end is not None:
+            self.label[end] = label
+            label += LABEL_GAP
+            end = self.next[end]
+
+    def opens_gap(self, end):
+        """
+        True if a contig can be inserted right after the end.
+        """
+        return end in self.closing and self.next[end] is not None
+
+    def insert_after(self, end, contig_ends):
+        """
+        Insert the two ends of a contig after an end closing a contig.
+        """
+        key = self.scaffold[end]
+        after = self.next[end]
+        if after is not None and self.label[after] - self.label[end] <= 2:
+            self._relabel(key)
+        low = self.label[end]
+        high = self.label[after] if after is not None else low + 3 * LABEL_GAP
+        prev = end
+        for i, new in enumerate(contig_ends):
+            self.scaffold[new] = key
+            self.label[new] = low + (high - low) * (i + 1) // 3
+            self.next[prev] = new
+            prev = new
+        self.next[prev] = after
+        self.closing.add(prev)
+
+    def path(self, key):
+        """
+        Ends of a scaffold in order.
+        """
+        path = []
+        end = self.first.get(key)
+        while end is not None:
+            path.append(end)
+            end = self.next[end]
+        return path
@@ -0,0 +1,181 @@
+# ======================================================================#
+# Binary layout of the scaffolds of an iteration, the contigs of each
+# scaffold with their orientation, offset and gap
+# ======================================================================#
+
+import sys
+import numpy as np
+
+# ======================================================================#
+#                                ARGUMENTS
+# ======================================================================#
+
+# layout_file : scaffolds_iteration_N.layout, written by layout_unitigs and
+#               refactor_breaks, read by the next iteration, get_seq and stitch
+# path : contig ends of a scaffold in order, contig + ":B" and contig + ":E"
+#        for a forward contig, contig + ":E" and contig + ":B" for a reverse one
+
+# The layout file starts with this header, then holds the first placement of
+# each scaffold, the placements and the scaffold then contig names separated
+# by newlines
+LAYOUT_MAGIC = b"SALSALAY"
+LAYOUT_VERSION = 1
+LAYOUT_HEADER = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<i8"),
+        ("scaffolds", "<i8"),
+        ("contigs", "<i8"),
+        ("placements", "<i8"),
+        ("names_bytes", "<i8"),
+    ]
+)
+
+# Contig of a scaffold, orientation is 0 for forward and 1 for reverse, offset
+# is its start in the scaffold and gap the number of Ns written after it
+PLACEMENT_DTYPE = np.dtype(
+    [
+        ("contig", "<i4"),
+        ("orientation", "u1"),
+        ("offset", "<i8"),
+        ("gap", "<i4"),
+    ]
+)
+
+# Ns between two contigs of a scaffold
+GAP_SIZE = 500
+
+# ======================================================================#
+#                                MODULES
+# ======================================================================#
+
+
+class ScaffoldLayout:
+    """
+    Scaffolds of a layout file by name, like the dictionary of paths it
+    replaces. The placements are memory-mapped and only the scaffolds which
+    are looked up are converted to paths.
+    """
+
+    def __init__(self, scaffold_names, contig_names, starts, placements):
+        self.scaffold_names = scaffold_names
+        self.contig_names = contig_names
+        self.ids = {name: i for i, name in enumerate(scaffold_names)}
+        self.starts = starts
+        self.placements = placements
+
+    def __len__(self):
+        return len(self.scaffold_names)
+
+    def __iter__(self):
+        return iter(self.scaffold_names)
+
+    def __contains__(self, key):
+        return key in self.ids
+
+    def __getitem__(self, key):
+        """
+        Path of a scaffold.
+        """
+        path = []
+        placements = self.scaffold(key)
+        for contig, orientation in zip(
+            placements["contig"].tolist(), placements["orientation"].tolist()
+        ):
+            name = self.contig_names[contig]
+            if orientation == 0:
+                path += [name + ":B", name + ":E"]
+            else:
+                path += [name + ":E", name + ":B"]
+        return path
+
+    def keys(self):
+        return list(self.scaffold_names)
+
+    def scaffold(self, key):
+        """
+        Placements of the contigs of a scaffold.
+        """
+        i = self.ids[key]
+        return self.placements[self.starts[i] : self.starts[i + 1]]
+
+
+# SAVE_LAYOUT
+# input :
+#   layout_file : path of the layout to write
+#   scaffolds : dictionary of scaffold names to paths
+#   lengths : dictionary of contig lengths
+# output :
+#   number of scaffolds written
+def save_layout(layout_file, scaffolds, lengths, gap=GAP_SIZE):
+    contigs = {}
+    starts = [0]
+    placements = []
+    for key in scaffolds:
+        path = scaffolds[key]
+        offset = 0
+        for i in range(0, len(path) - 1, 2):
+            contig, side = path[i].split(":")
+            length = lengths[contig]
+            after = gap if i + 2 < len(path) - 1 else 0
+            placements.append(
+                (
+                    contigs.setdefault(contig, len(contigs)),
+                    0 if side == "B" else 1,
+                    offset,
+                    after,
+                )
+            )
+            offset += length + after
+        starts.append(len(placements))
+
+    names = "".join(name + "\n" for name in list(scaffolds) + list(contigs))
+    names = names.encode()
+    header = np.zeros(1, dtype=LAYOUT_HEADER)
+    header["magic"] = LAYOUT_MAGIC
+    header["version"] = LAYOUT_VERSION
+    header["scaffolds"] = len(scaffolds)
+    header["contigs"] = len(contigs)
+    header["placements"] = len(placements)
+    header["names_bytes"] = len(names)
+
+    with open(layout_file, "wb") as f:
+        header.tofile(f)
+        np.array(starts, dtype="<i8").tofile(f)
+        np.array(placements, dtype=PLACEMENT_DTYPE).tofile(f)
+        f.write(names)
+    return len(scaffolds)
+
+
+# LOAD_LAYOUT
+# input :
+#   layout_file : layout written by save_layout
+# output :
+#   ScaffoldLayout with memory-mapped placements
+def load_layout(layout_file):
+    header = np.fromfile(layout_file, dtype=LAYOUT_HEADER, count=1)
+    if (
+        len(header) == 0
+        or header["magic"][0] != LAYOUT_MAGIC
+        or header["version"][0] != LAYOUT_VERSION
+    ):
+        print("ERROR : " + layout_file + " is not a scaffold layout of this version")
+        sys.exit(1)
+    s = int(header["scaffolds"][0])
+    n = int(header["contigs"][0])
+    m = int(header["placements"][0])
+
+    start = LAYOUT_HEADER.itemsize
+    starts = np.fromfile(layout_file, dtype="<i8", count=s + 1, offset=start)
+    start += 8 * (s + 1)
+    if m == 0:
+        placements = np.zeros(0, dtype=PLACEMENT_DTYPE)
+    else:
+        placements = np.memmap(
+            layout_file, dtype=PLACEMENT_DTYPE, mode="r", offset=start, shape=(m,)
+        )
+    start += PLACEMENT_DTYPE.itemsize * m
+    with open(layout_file, "rb") as f:
+        f.seek(start)
+        names = f.read(int(header["names_bytes"][0])).decode().split("\n")
+    return ScaffoldLayout(names[:s], names[s : s + n], starts, placements)
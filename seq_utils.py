@@ -3,11 +3,30 @@
 #     Biopython:
 #         - load fasta file
 #         - generate reverse complement
+#         - read sequences from a memory-mapped fasta file
+#         - index a fasta file (samtools faidx format) and fetch sequences
+#           or slices of them by name
 # ======================================================================#
 
+import mmap
+import os
+import re
+import sys
+import string
 import Bio
 from Bio import SeqIO
 
+# Characters dropped from the lines of a sequence
+WHITESPACE = string.whitespace.encode()
+
+# Complement of every IUPAC code, case preserved, other bytes left unchanged
+COMPLEMENT = bytes.maketrans(
+    b"ACGTURYSWKMBDHVNacgturyswkmbdhvn", b"TGCAAYRSWMKVHDBNtgcaayrswmkvhdbn"
+)
+
+# Number of bases read at once when streaming a sequence
+STREAM_CHUNK = 1 << 22
+
 
 def parse_fasta(fasta_file) -> dict:
     """
@@ -17,44 +36,261 @@ def parse_fasta(fasta_file) -> dict:
     seq_record = {}
     # Part 1: compile list of lines per sequence
     for line in fasta:
-        if ">" in line:
+        if line.startswith(">"):
             # new name line; remember current sequence's short name
-            short_name = line.strip().split()[0]
-            seq_record[short_name] = ""
+            short_name = line[1:].strip().split()[0]
+            seq_record[short_name] = []
         else:
             # append nucleotides to current sequence
-            seq_record[short_name] = seq_record[short_name] + line.strip()
+            seq_record[short_name].append(line.strip())
+    fasta.close()
+
+    # Part 2: join the lines of each sequence once
+    for short_name in seq_record:
+        seq_record[short_name] = "".join(seq_record[short_name])
     return seq_record
 
 
-def rev_comp(seq: str) -> str:
+def rev_comp(seq):
+    """
+    Generates the reverse complement of a sequence, given as str or bytes.
+    """
+    if isinstance(seq, str):
+        return seq.encode().translate(COMPLEMENT, b" ")[::-1].decode()
+    return bytes(seq).translate(COMPLEMENT, b" ")[::-1]
+
+
+def map_fasta(fasta_file):
+    """
+    Memory-map a fasta file, read-only.
+    """
+    with open(fasta_file, "rb") as f:
+        if os.path.getsize(fasta_file) == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def fasta_spans(data):
+    """
+    Yields the name and the byte range of the sequence lines of each record
+    of a mapped fasta file.
+    """
+    pos = data.find(b">")
+    while pos != -1:
+        eol = data.find(b"\n", pos)
+        if eol == -1:
+            eol = len(data)
+        header = data[pos + 1 : eol].split()
+        name = header[0].decode() if header else ""
+        nxt = data.find(b"\n>", eol)
+        end = len(data) if nxt == -1 else nxt + 1
+        yield name, eol + 1, end
+        pos = -1 if nxt == -1 else nxt + 1
+
+
+def span_sequence(data, start: int, end: int) -> bytes:
+    """
+    Sequence of a record of a mapped fasta file, without line breaks.
+    """
+    return data[start:end].translate(None, WHITESPACE)
+
+
+def build_fasta_index(fasta_file, fai_file=None):
+    """
+    Writes the samtools faidx index of a fasta file: name, length, offset of
+    the first base, bases per line and bytes per line of each sequence.
+    """
+    if fai_file is None:
+        fai_file = fasta_file + ".fai"
+
+    data = map_fasta(fasta_file)
+    output = open(fai_file, "w")
+    for name, start, end in fasta_spans(data):
+        newlines = _count(data, b"\n", start, end)
+        length = end - start - newlines - _count(data, b"\r", start, end)
+        eol = data.find(b"\n", start, end)
+        if eol == -1:
+            eol = end
+        linewidth = eol - start + 1
+        linebases = linewidth - 1 - (data[eol - 1 : eol] == b"\r")
+
+        if not _regular_lines(data, start, end, linebases, linewidth):
+            print("ERROR : Lines of different length in sequence " + name)
+            sys.exit(1)
+
+        output.write(
+            "{0}\t{1}\t{2}\t{3}\t{4}\n".format(
+                name, length, start, linebases, linewidth
+            )
+        )
+    output.close()
+
+
+def _count(data, char, start, end, block=1 << 26):
+    """
+    Occurrences of a character in a byte range, read by blocks.
+    """
+    return sum(
+        data[i : min(i + block, end)].count(char) for i in range(start, end, block)
+    )
+
+
+def _regular_lines(data, start, end, linebases, linewidth):
+    """
+    Checks that every line but the last one holds linebases bases.
+    """
+    eol = b"\r\n" if linewidth - linebases == 2 else b"\n"
+    line = b"[^\r\n]{%d}" % linebases
+    pattern = re.compile(
+        b"(?:" + line + eol + b")*[^\r\n]{0,%d}(?:" % linebases + eol + b")?"
+    )
+    return pattern.fullmatch(data, start, end) is not None
+
+
+class IndexedFasta:
     """
-    Generates the reverse complement of a sequence.
+    Random access to the sequences of a fasta file. The file is memory-mapped
+    and only the bytes of the requested sequences are read. The index is
+    built when it is missing or older than the fasta, next to the fasta file
+    unless fai_file is given.
     """
-    comp = {
-        "A": "T",
-        "C": "G",
-        "G": "C",
-        "T": "A",
-        "B": "N",
-        "N": "N",
-        "R": "N",
-        "M": "N",
-        "Y": "N",
-        "S": "N",
-        "W": "N",
-        "K": "N",
-        "a": "t",
-        "c": "g",
-        "g": "c",
-        "t": "a",
-        "n": "n",
-        " ": "",
-    }
 
-    rev_seq = "".join(comp.get(base, base) for base in reversed(seq))
+    def __init__(self, fasta_file, fai_file=None):
+        if fai_file is None:
+            fai_file = fasta_file + ".fai"
+        if not os.path.isfile(fai_file) or os.path.getmtime(
+            fai_file
+        ) < os.path.getmtime(fasta_file):
+            build_fasta_index(fasta_file, fai_file)
+
+        self.names = []
+        self.index = {}
+        with open(fai_file, "r") as f:
+            for line in f:
+                attrs = line.split()
+                self.names.append(attrs[0])
+                self.index[attrs[0]] = [int(x) for x in attrs[1:5]]
+        self.data = map_fasta(fasta_file)
+
+    def __len__(self):
+        return len(self.names)
 
-    return rev_seq
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def length(self, name) -> int:
+        """
+        Length of a sequence.
+        """
+        return self.index[name][0]
+
+    # FETCH
+    # input :
+    #   name : name of the sequence
+    #   start, end : 0-based half open range, end=None for the end
+    # output :
+    #   bases of the range, as bytes
+    def fetch(self, name, start=0, end=None) -> bytes:
+        """
+        Reads a sequence or a slice of it.
+        """
+        length, offset, linebases, linewidth = self.index[name]
+        if end is None or end > length:
+            end = length
+        start = max(start, 0)
+        if start >= end:
+            return b""
+
+        first = offset + start // linebases * linewidth + start % linebases
+        last = offset + end // linebases * linewidth + end % linebases
+        return span_sequence(self.data, first, last)
+
+    # STREAM
+    # input :
+    #   name : name of the sequence
+    #   start, end : 0-based half open range, end=None for the end
+    #   rev : True to read the reverse complement of the range
+    #   chunk_size : number of bases per chunk
+    # output :
+    #   generator of chunks of the range, as bytes
+    def stream(self, name, start=0, end=None, rev=False, chunk_size=STREAM_CHUNK):
+        """
+        Reads a sequence or a slice of it by chunks, from its end when it is
+        reverse complemented.
+        """
+        if end is None or end > self.length(name):
+            end = self.length(name)
+        if not rev:
+            for pos in range(start, end, chunk_size):
+                yield self.fetch(name, pos, min(pos + chunk_size, end))
+        else:
+            for pos in range(end, start, -chunk_size):
+                yield rev_comp(self.fetch(name, max(pos - chunk_size, start), pos))
+
+
+class FastaWriter:
+    """
+    Writes sequences to a fasta file opened in binary mode, wrapping lines as
+    pieces of a record arrive. Only the last incomplete line is kept.
+    """
+
+    # Number of lines joined in a single write
+    BLOCK_LINES = 1 << 16
+
+    def __init__(self, ofile, width=80):
+        self.ofile = ofile
+        self.width = width
+        self.pending = b""
+
+    def start(self, name):
+        """
+        Starts a new record.
+        """
+        self.end()
+        self.ofile.write(b">" + name.encode() + b"\n")
+
+    def write(self, seq):
+        """
+        Appends bases to the current record.
+        """
+        view = memoryview(seq)
+        if self.pending:
+            head = self.width - len(self.pending)
+            self.pending += bytes(view[:head])
+            view = view[head:]
+            if len(self.pending) < self.width:
+                return
+            self.ofile.write(self.pending + b"\n")
+            self.pending = b""
+
+        full = len(view) // self.width * self.width
+        block = self.BLOCK_LINES * self.width
+        for i in range(0, full, block):
+            stop = min(i + block, full)
+            lines = [view[j : j + self.width] for j in range(i, stop, self.width)]
+            self.ofile.write(b"\n".join(lines) + b"\n")
+        self.pending = bytes(view[full:])
+
+    def end(self):
+        """
+        Writes the last line of the current record.
+        """
+        if self.pending:
+            self.ofile.write(self.pending + b"\n")
+            self.pending = b""
+
+
+def write_fasta(ofile, name, seq: bytes, width=80):
+    """
+    Writes a sequence to a fasta file opened in binary mode.
+    """
+    writer = FastaWriter(ofile, width)
+    writer.start(name)
+    writer.write(seq)
+    writer.end()
 
 
 def make_seq_length_file(assembly, output_file, namelist_file="abc"):
@@ -73,4 +309,5 @@ def make_seq_length_file(assembly, output_file, namelist_file="abc"):
             namelist.write("{0}\n".format(record.id))
 
     outlength.close()
-    namelist.close()
+    if namelist_file != "abc":
+        namelist.close()
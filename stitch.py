@@ -1,62 +1,25 @@
-import argparse, pickle
+import argparse
+import seq_utils as sequ
+import scaffold_layout as sl
 
 parser = argparse.ArgumentParser()
 parser.add_argument("-b", "--bed", help="unitig to contig bed file")
 parser.add_argument("-c", "--contigs", help="contigs fasta file")
 parser.add_argument("-u", "--unitigs", help="unitigs fasta file")
-parser.add_argument("-p", "--pickle", help="pickle file for scaffolds")
+parser.add_argument("-p", "--layout", help="layout file of scaffolds")
 parser.add_argument("-o", "--output", help="output file to write scaffolds")
 
 args = parser.parse_args()
 
-revcompl = lambda x: "".join(
-    [
-        {
-            "A": "T",
-            "C": "G",
-            "G": "C",
-            "T": "A",
-            "N": "N",
-            "R": "N",
-            "M": "N",
-            "Y": "N",
-            "S": "N",
-            "W": "N",
-            "K": "N",
-            "a": "t",
-            "c": "g",
-            "g": "c",
-            "t": "a",
-            "n": "n",
-            " ": "",
-        }[B]
-        for B in x
-    ][::-1]
-)
-
-
-def parse_fasta(fh):
-    fa = {}
-    current_short_name = None
-    for ln in fh:
-        if ln[0] == ">":
-            long_name = ln[1:].rstrip()
-            current_short_name = long_name.split()[0]
-            fa[current_short_name] = []
-        else:
-            fa[current_short_name].append(ln.rstrip())
-    for short_name, nuc_list in fa.items():
-        fa[short_name] = "".join(nuc_list)
-    return fa
-
+scaffolds = sl.load_layout(args.layout)
 
-scaffolds = pickle.load(open(args.pickle, "r"))
+contig_seqs = sequ.IndexedFasta(args.contigs)
+unitig_seqs = sequ.IndexedFasta(args.unitigs)
 
-contig_seqs = parse_fasta(open(args.contigs, "r"))
-unitig_seqs = parse_fasta(open(args.unitigs, "r"))
 
-
-ofile = open(args.output, "w")
+ofile = open(args.output, "wb")
+writer = sequ.FastaWriter(ofile)
+gap = b"N" * 500
 
 scaffold_id = 1
 """
@@ -193,38 +156,30 @@ for scaffold in scaffolds:
                 new_path.append(path_with_ori[i])
                 i += 1
 
-    scaffold_seq = ""
-    gap = ""
-    for i in range(500):
-        gap += "N"
+    writer.start("scaffold_" + str(scaffold_id))
+    scaffold_id += 1
     for i in range(len(new_path)):
         if len(new_path[i]) != 4:
             utg, ori = new_path[i].split(":")
-            if ori == "FOW":
-                scaffold_seq += unitig_seqs[utg]
-            else:
-                scaffold_seq += revcompl(unitig_seqs[utg])
-
-            if i != len(new_path) - 1:
-                scaffold_seq += gap
+            chunks = unitig_seqs.stream(utg, rev=ori != "FOW")
         else:
             contig = new_path[i][0]
             start = int(new_path[i][1])
             end = int(new_path[i][2])
             if start < end:
-                scaffold_seq += contig_seqs[contig][start:end]
+                chunks = contig_seqs.stream(contig, start, end)
             else:
-                scaffold_seq += revcompl(contig_seqs[contig][end:start])
+                chunks = contig_seqs.stream(contig, end, start, rev=True)
 
-            if i != len(new_path) - 1:
-                scaffold_seq += gap
-    ofile.write(">scaffold_" + str(scaffold_id) + "\n")
-    scaffold_id += 1
-    chunks = [scaffold_seq[i : i + 80] for i in range(0, len(scaffold_seq), 80)]
-    for each in chunks:
-        ofile.write(each + "\n")
+        for chunk in chunks:
+            writer.write(chunk)
+        if i != len(new_path) - 1:
+            writer.write(gap)
+    writer.end()
 
     print("==============================")
     print(path_with_ori)
     print(new_path)
     print("=============================")
+
+ofile.close()
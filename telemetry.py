@@ -0,0 +1,334 @@
+# ======================================================================#
+# Resource usage and record counts of the pipeline stages, written to a
+# JSON lines run report
+# ======================================================================#
+
+import os
+import sys
+import json
+import time
+import cProfile
+import resource
+import tempfile
+import threading
+import subprocess
+
+# ======================================================================#
+#                                ARGUMENTS
+# ======================================================================#
+
+# report_file : JSON lines file, one record per stage run or skipped
+# profile_dir : directory of the cProfile statistics of the stages, None to
+#               run the stages without profiler
+# meter : measure of the stage run by the current thread
+# counts : number of records handled by a stage, by name
+
+# Programs started by a stage append their counts to the file named by this
+# variable, one name and value per line
+COUNTS_ENV = "SALSA_TELEMETRY_COUNTS"
+
+# Seconds between two samples of the resident memory of the pipeline
+SAMPLE_INTERVAL = 0.2
+
+_local = threading.local()
+
+# ======================================================================#
+#                                MODULES
+# ======================================================================#
+
+
+# IO_COUNTERS
+# input :
+#   path : io file of /proc, of a thread or of a process
+# output :
+#   bytes read and written through system calls, 0 and 0 if the file cannot be
+#   read
+def io_counters(path="/proc/thread-self/io"):
+    counters = {}
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                name, value = line.split(":")
+                counters[name] = int(value)
+    except (OSError, ValueError):
+        pass
+    return counters.get("rchar", 0), counters.get("wchar", 0)
+
+
+def _resident_kb():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except (OSError, ValueError, IndexError):
+        return _maxrss_kb(resource.getrusage(resource.RUSAGE_SELF))
+
+
+# ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+def _maxrss_kb(usage):
+    if sys.platform == "darwin":
+        return usage.ru_maxrss // 1024
+    return usage.ru_maxrss
+
+
+def _file_bytes(paths):
+    return sum(os.path.getsize(p) for p in paths if os.path.isfile(p))
+
+
+class StageMeter:
+    """
+    Usage of a stage run by the current thread : its wall time, the CPU time
+    and the bytes read and written by the thread, by the programs it starts
+    and by the pool workers running its tasks, the peak resident memory of the
+    pipeline process while it runs and of its programs and workers, and the
+    counts added with count.
+    """
+
+    def __init__(self, report, stage, profile=None):
+        self.report = report
+        self.stage = stage
+        self.profile = profile
+        self.counts = {}
+        self.programs = 0
+        self.child_cpu = 0.0
+        self.child_rss = 0
+        self.child_read = 0
+        self.child_written = 0
+        self.peak_rss = _resident_kb()
+
+    def __enter__(self):
+        self.start = time.time()
+        self.cpu = time.thread_time()
+        self.io = io_counters()
+        self.input_bytes = _file_bytes(self.stage.inputs + self.stage.updates)
+        _local.meter = self
+        self.report.watch(self)
+        if self.profile is not None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.profile is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_path())
+        _local.meter = None
+        self.report.unwatch(self)
+        self.sample()
+        read, written = io_counters()
+        self.report.write(
+            self.stage,
+            "done" if exc_type is None else "failed",
+            wall_s=time.time() - self.start,
+            cpu_s=time.thread_time() - self.cpu + self.child_cpu,
+            peak_rss_kb=self.peak_rss,
+            child_peak_rss_kb=self.child_rss,
+            read_bytes=read - self.io[0] + self.child_read,
+            written_bytes=written - self.io[1] + self.child_written,
+            input_bytes=self.input_bytes,
+            output_bytes=_file_bytes(self.stage.outputs + self.stage.updates),
+            counts=self.counts,
+        )
+        return False
+
+    def sample(self):
+        self.peak_rss = max(self.peak_rss, _resident_kb())
+
+    def profile_path(self, program=None):
+        name = self.stage.name
+        if program is not None:
+            name += "." + str(program)
+        return os.path.join(self.profile, name + ".prof")
+
+    def add(self, name, value):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def program_argv(self, argv):
+        """
+        Command of a program started by the stage, Python scripts are run
+        under cProfile when the stage is profiled.
+        """
+        self.programs += 1
+        if self.profile is None or argv[0] != sys.executable:
+            return argv
+        path = self.profile_path(self.programs)
+        return [argv[0], "-m", "cProfile", "-o", path] + argv[1:]
+
+    def add_usage(self, cpu, rss, read, written):
+        self.child_cpu += cpu
+        self.child_rss = max(self.child_rss, rss)
+        self.child_read += read
+        self.child_written += written
+
+    def add_program(self, usage, read, written, counts_file):
+        self.add_usage(
+            usage.ru_utime + usage.ru_stime, _maxrss_kb(usage), read, written
+        )
+        for name, value in read_counts(counts_file).items():
+            self.add(name, value)
+
+
+class RunReport:
+    """
+    JSON lines report of a run of the pipeline, shared by the threads running
+    the stages. A thread samples the resident memory while stages run.
+    """
+
+    def __init__(self, report_file, profile_dir=None):
+        self.report_file = report_file
+        self.profile_dir = profile_dir
+        if profile_dir is not None and not os.path.isdir(profile_dir):
+            os.makedirs(profile_dir)
+        self.run = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.lock = threading.Lock()
+        self.meters = set()
+        self.output = open(report_file, "a", 1)
+        self.sampler = None
+
+    def measure(self, stage):
+        """
+        Context in which the current thread runs a stage.
+        """
+        return StageMeter(self, stage, self.profile_dir)
+
+    def skipped(self, stage):
+        self.write(stage, "skipped")
+
+    def write(self, stage, status, **fields):
+        record = {"run": self.run, "stage": stage.name, "status": status}
+        record["iteration"] = _iteration(stage.name)
+        for name, value in fields.items():
+            record[name] = round(value, 3) if isinstance(value, float) else value
+        with self.lock:
+            self.output.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def watch(self, meter):
+        with self.lock:
+            self.meters.add(meter)
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self._sample, daemon=True)
+                self.sampler.start()
+
+    def unwatch(self, meter):
+        with self.lock:
+            self.meters.discard(meter)
+
+    def _sample(self):
+        while True:
+            time.sleep(SAMPLE_INTERVAL)
+            with self.lock:
+                meters = list(self.meters)
+            for meter in meters:
+                meter.sample()
+
+    def close(self):
+        self.output.close()
+
+
+def _iteration(name):
+    """
+    Iteration of a stage, the number ending its name, None for the stages run
+    once.
+    """
+    suffix = name.rsplit("_", 1)[-1]
+    return int(suffix) if suffix.isdigit() else None
+
+
+# COUNT
+# input :
+#   name : name of the records, e.g. "pairs" or "links"
+#   value : number of records handled
+def count(name, value):
+    """
+    Add records to the counts of the stage run by the current thread, or of
+    the stage which started this program. Does nothing outside of a measured
+    stage.
+    """
+    meter = getattr(_local, "meter", None)
+    if meter is not None:
+        meter.add(name, int(value))
+        return
+    counts_file = os.environ.get(COUNTS_ENV)
+    if counts_file:
+        with open(counts_file, "a") as f:
+            f.write(name + "\t" + str(int(value)) + "\n")
+
+
+# READ_COUNTS
+# input :
+#   counts_file : file named by COUNTS_ENV for programs
+# output :
+#   dictionary of the counts added by the programs, by name
+def read_counts(counts_file):
+    counts = {}
+    with open(counts_file, "r") as f:
+        for line in f:
+            name, value = line.split("\t")
+            counts[name] = counts.get(name, 0) + int(value)
+    return counts
+
+
+# RUN_PROGRAM
+# input :
+#   argv : command and its arguments
+#   stdout : file object receiving the standard output, None to discard it
+# output :
+#   exit status of the program, its usage is added to the current stage
+def run_program(argv, stdout=None):
+    if stdout is None:
+        stdout = subprocess.DEVNULL
+    meter = getattr(_local, "meter", None)
+    if meter is None:
+        return subprocess.run(argv, stdout=stdout).returncode
+
+    fd, counts_file = tempfile.mkstemp(prefix="salsa_counts_")
+    os.close(fd)
+    try:
+        env = dict(os.environ)
+        env[COUNTS_ENV] = counts_file
+        process = subprocess.Popen(meter.program_argv(argv), stdout=stdout, env=env)
+        # the io counters of a program can still be read until it is reaped,
+        # they are only available on Linux
+        read, written = 0, 0
+        if hasattr(os, "waitid"):
+            os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+            read, written = io_counters("/proc/" + str(process.pid) + "/io")
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        meter.add_program(usage, read, written, counts_file)
+    finally:
+        os.remove(counts_file)
+    return process.returncode
+
+
+# MEASURED_TASK
+# input :
+#   func : function run by a worker process of a pool
+#   args : arguments of func
+# output :
+#   result of func and the usage of the worker while it ran : CPU time, peak
+#   resident memory, bytes read and written
+def measured_task(func, *args):
+    """
+    Run a task of a pool and return its usage with its result, so that the
+    stage collecting the results can add it with add_worker_usage.
+    """
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    io = io_counters("/proc/self/io")
+    result = func(*args)
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    read, written = io_counters("/proc/self/io")
+    cpu = after.ru_utime + after.ru_stime - before.ru_utime - before.ru_stime
+    return result, (cpu, _maxrss_kb(after), read - io[0], written - io[1])
+
+
+# ADD_WORKER_USAGE
+# input :
+#   usage : usage returned by measured_task
+def add_worker_usage(usage):
+    """
+    Add the usage of a pool task to the stage run by the current thread. Does
+    nothing outside of a measured stage.
+    """
+    meter = getattr(_local, "meter", None)
+    if meter is not None:
+        meter.add_usage(*usage)